@@ -0,0 +1,83 @@
+"""
+Compare the compiled KeywordMatcher against the old per-keyword substring scan.
+
+    python benchmarks/bench_matcher.py [awards_2025/2025_awards.json] [--repeat 20]
+
+Both scans use every tier of RED_FLAG_WORDS, like analyze_awards with all
+checkboxes ticked; --extra adds the Red Flag Analyzer's quick-add list to
+show how each approach scales with the number of keywords. Each available
+matcher engine is timed (aho-corasick needs the optional pyahocorasick). The old scan is reproduced exactly, including its
+substring false positives ("equity" inside "inequity"), which is why the
+hit counts differ.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nsf_keywords import QUICK_ADD_WORDS, RED_FLAG_WORDS  # noqa: E402
+import nsf_matcher  # noqa: E402
+from nsf_matcher import KeywordMatcher  # noqa: E402
+
+
+def substring_scan(awards, selected_words):
+    """The scan analyze_awards used before KeywordMatcher."""
+    hits = 0
+    for award in awards:
+        abstract = award.get("abstractText", "").lower()
+        for tier, words in selected_words.items():
+            if any(word.lower() in abstract for word in words):
+                hits += len([w for w in words if w.lower() in abstract])
+    return hits
+
+
+def matcher_scan(awards, matcher):
+    hits = 0
+    for award in awards:
+        for words in matcher.matched_words(award.get("abstractText", "")).values():
+            hits += len(words)
+    return hits
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", nargs="?", default="awards_2025/2025_awards.json")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--extra", action="store_true", help="also match the Red Flag Analyzer's keyword list")
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        awards = json.load(f)
+
+    keywords = dict(RED_FLAG_WORDS)
+    if args.extra:
+        keywords["Quick-Add"] = QUICK_ADD_WORDS
+
+    print(f"awards:            {len(awards)}")
+    print(f"keywords:          {sum(len(w) for w in keywords.values())}")
+    old_time, old_hits = best_of(lambda: substring_scan(awards, keywords), args.repeat)
+    print(f"substring scan:    {old_time * 1000:8.2f} ms  ({old_hits} tier/keyword hits)")
+
+    engines = ["scan", "regex"] + (["aho-corasick"] if nsf_matcher.ahocorasick is not None else [])
+    for engine in engines:
+        build_time, matcher = best_of(lambda: KeywordMatcher(keywords, engine=engine), args.repeat)
+        new_time, new_hits = best_of(lambda: matcher_scan(awards, matcher), args.repeat)
+        print(f"{engine + ':':19s}{new_time * 1000:8.2f} ms  ({new_hits} tier/keyword hits, "
+              f"built in {build_time * 1000:.2f} ms)  speedup {old_time / new_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
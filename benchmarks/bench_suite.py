@@ -0,0 +1,390 @@
+"""
+Benchmark the fetch, load, match, highlight and report hot paths on synthetic data.
+
+    python benchmarks/bench_suite.py --sizes 10k,100k,1M -o results.json
+    python benchmarks/bench_suite.py --sizes 10k --only load,match --compare baseline.json
+
+For every size a synthetic year shaped like awards_2025/2025_awards.json is
+generated (see synthetic.py) in a scratch directory, and each benchmark is
+timed on it:
+
+    fetch.pages        NSFFetcher paging through a local stub API server (unthrottled unless --rate-limit)
+    fetch.download     the full downloader (checkpoints, CSV, store, index) against the stub
+    fetch.replay       the same download again, with every page served from the on-disk page cache
+    load.legacy_json   json.load of a {year}_awards.json array (the old fetch_awards cache)
+    load.csv_pandas    pd.read_csv of the CSV export (the old Red Flag Analyzer load)
+    load.jsonl         streaming the JSON-lines cache
+    load.awards_jsonl  nsf_award.Award objects parsed from the JSON-lines cache
+    load.awards_store  nsf_award.Award objects from the typed Arrow store
+    load.dataframe     the Red Flag Analyzer's DataFrame from the memory-mapped store
+    store.build        building the Arrow store from the cache
+    index.build        building the inverted keyword index
+    match.records      analyze_records over loaded awards (what analyze_awards runs)
+    match.years        analyze_years through the keyword index
+    match.memo_cold    nsf_memo.analyze_year with empty memos
+    match.memo_warm    nsf_memo.analyze_year answered from memory
+    filter.any_of      the Red Flag Analyzer's keyword filter (filter_by_keywords)
+    highlight.replace  the analyzer's old str.replace highlighting (baseline)
+    highlight.offsets  highlight spans from KeywordMatcher offsets (nsf_views.highlight_spans)
+    report.pdf         write_pdf of the analysis results
+    report.csv         write_csv of the analysis results
+    report.json        write_json of the analysis results
+
+Results are printed as a table on stderr and written as JSON (stdout or -o),
+together with the interpreter, machine and git commit, so runs of different
+versions can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+FORMAT_VERSION = 1
+SYNTHETIC_YEAR = 2099
+FETCH_YEAR = 2098
+FILTER_WORDS = ["innovative", "equity", "framework", "climate change", "stakeholders"]
+
+
+def log(message=""):
+    print(message, file=sys.stderr, flush=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Suite:
+    """Runs the benchmarks for one size and collects their timings."""
+
+    def __init__(self, size, repeat, only=None, workers=None, fetch_awards=5000, report_top=500,
+                 highlight_awards=1000, rate_limit=None):
+        self.size = size
+        self.repeat = repeat
+        self.only = only
+        self.workers = workers
+        self.fetch_awards = fetch_awards
+        self.report_top = report_top
+        self.highlight_awards = highlight_awards
+        self.rate_limit = rate_limit
+        self.results = []
+
+    def wanted(self, name):
+        return not self.only or any(name == p or name.startswith(p + ".") for p in self.only)
+
+    def measure(self, name, fn, repeat=None, items=None, **extra):
+        """Time fn() `repeat` times; returns its last result."""
+        if not self.wanted(name):
+            return None
+        times = []
+        result = None
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        items = self.size if items is None else items
+        entry = {
+            "benchmark": name,
+            "size": self.size,
+            "items": items,
+            "runs": len(times),
+            "best": best,
+            "mean": sum(times) / len(times),
+            "items_per_second": items / best if best > 0 else None,
+        }
+        entry.update(extra)
+        self.results.append(entry)
+        log(f"  {name:20s} {best * 1000:11.1f} ms  ({entry['runs']} runs, {items:,} items)")
+        return result
+
+    def wants_any(self, *groups):
+        return any(self.wanted(name) or any(p.startswith(name + ".") for p in self.only or ())
+                   for name in groups)
+
+    # --------------------- BENCHMARKS --------------------- #
+    def run(self):
+        log(f"Generating {self.size:,} synthetic awards...")
+        started = time.perf_counter()
+        cache_file = synthetic.write_year(self.size, SYNTHETIC_YEAR)
+        log(f"  generated in {time.perf_counter() - started:.1f}s ({os.path.getsize(cache_file) / 1e6:.0f} MB)")
+
+        if self.wants_any("fetch"):
+            self.bench_fetch()
+        if self.wants_any("load", "store"):
+            self.bench_load(cache_file)
+        if self.wants_any("index", "match", "filter", "highlight", "report"):
+            analysis = self.bench_match()
+            self.bench_highlight(analysis)
+            self.bench_report(analysis)
+        return self.results
+
+    def bench_fetch(self):
+        import nsf_download
+        from nsf_fetch import NSFFetcher
+        from nsf_stub_server import serve
+
+        n = min(self.size, self.fetch_awards)
+        awards = list(synthetic.AwardGenerator(seed=2, year=FETCH_YEAR).iter_awards(n))
+        server, url = serve(awards)
+        try:
+            def download(fetcher):
+                shutil.rmtree(f"awards_{FETCH_YEAR}", ignore_errors=True)
+                return nsf_download.fetch_awards_for_year(FETCH_YEAR, lambda message: None, fetcher=fetcher)
+
+            with NSFFetcher(base_url=url, rate_limit=self.rate_limit, cache=False) as fetcher:
+                params = fetcher.year_params(FETCH_YEAR, nsf_download.PRINT_FIELDS)
+                self.measure("fetch.pages", lambda: sum(len(page.awards) for page in fetcher.iter_pages(params)),
+                             items=n, pages=-(-n // fetcher.rpp))
+                self.measure("fetch.download", lambda: download(fetcher), repeat=1, items=n)
+
+            if self.wanted("fetch.replay"):
+                from nsf_http_cache import PageCache
+
+                cache = PageCache(tempfile.mkdtemp(prefix="pages_", dir="."))
+                with NSFFetcher(base_url=url, rate_limit=self.rate_limit, cache=cache) as fetcher:
+                    download(fetcher)  # fills the page cache
+                    before = server.request_count
+                    self.measure("fetch.replay", lambda: download(fetcher), repeat=1, items=n)
+                    if server.request_count != before:
+                        print(f"  fetch.replay sent {server.request_count - before} requests", file=sys.stderr)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def bench_load(self, cache_file):
+        import nsf_award
+        import nsf_cache
+        import nsf_store
+
+        if self.wanted("load.legacy_json"):
+            legacy = os.path.join(nsf_cache.year_folder(SYNTHETIC_YEAR), "legacy_awards.json")
+            with open(legacy, "w", encoding="utf-8") as f:
+                json.dump(list(nsf_cache.iter_jsonl(cache_file)), f)
+
+            def json_load():
+                with open(legacy, "r", encoding="utf-8") as f:
+                    return len(json.load(f))
+            self.measure("load.legacy_json", json_load)
+            os.remove(legacy)
+
+        if self.wanted("load.csv_pandas"):
+            import pandas as pd
+            from nsf_download import write_csv
+
+            csv_file = write_csv(SYNTHETIC_YEAR, nsf_cache.iter_jsonl(cache_file))
+            self.measure("load.csv_pandas", lambda: len(pd.read_csv(csv_file)))
+
+        self.measure("load.jsonl", lambda: sum(1 for _ in nsf_cache.iter_jsonl(cache_file)))
+        self.measure("load.awards_jsonl", lambda: len(nsf_award.load_file(cache_file)))
+
+        def build_store():
+            path = nsf_store.store_path(SYNTHETIC_YEAR)
+            if os.path.exists(path):
+                os.remove(path)
+            return nsf_store.ensure_store(SYNTHETIC_YEAR)
+        self.measure("store.build", build_store, repeat=1)
+        nsf_store.ensure_store(SYNTHETIC_YEAR)
+
+        self.measure("load.awards_store", lambda: len(nsf_award.load_year(SYNTHETIC_YEAR)))
+        self.measure("load.dataframe", lambda: len(nsf_store.load_dataframe(
+            nsf_store.store_path(SYNTHETIC_YEAR), ["id", "awardeeName", "title", "abstractText", "fundsObligatedAmt"])))
+
+    def bench_match(self):
+        import nsf_analysis
+        import nsf_award
+        import nsf_index
+        import nsf_memo
+        import nsf_store
+        from nsf_keywords import RED_FLAG_WORDS
+
+        def build_index():
+            path = nsf_index._index_path_for(nsf_store.store_path(SYNTHETIC_YEAR))
+            if os.path.exists(path):
+                os.remove(path)
+            return nsf_index.open_index(SYNTHETIC_YEAR)
+        self.measure("index.build", build_index, repeat=1)
+        nsf_index.open_index(SYNTHETIC_YEAR)
+
+        if self.wanted("match.records"):
+            awards = nsf_award.load_year(SYNTHETIC_YEAR)
+            self.measure("match.records", lambda: nsf_analysis.analyze_records(
+                awards, RED_FLAG_WORDS, workers=self.workers), workers=self.workers or os.cpu_count())
+
+        analysis = self.measure("match.years", lambda: nsf_analysis.analyze_years(
+            [SYNTHETIC_YEAR], RED_FLAG_WORDS, workers=self.workers), workers=self.workers or os.cpu_count())
+
+        def memo_cold():
+            nsf_memo.results_memo.clear()
+            nsf_memo.hits_memo.clear()
+            shutil.rmtree(nsf_memo.MEMO_DIR, ignore_errors=True)
+            return nsf_memo.analyze_year(SYNTHETIC_YEAR, RED_FLAG_WORDS)
+        memo = self.measure("match.memo_cold", memo_cold)
+        if memo is not None:
+            self.measure("match.memo_warm", lambda: nsf_memo.analyze_year(SYNTHETIC_YEAR, RED_FLAG_WORDS))
+        analysis = analysis or memo or nsf_memo.analyze_year(SYNTHETIC_YEAR, RED_FLAG_WORDS)
+
+        if self.wanted("filter.any_of"):
+            texts = nsf_store.LazyTexts(nsf_store.store_path(SYNTHETIC_YEAR))
+
+            def any_of():
+                # A fresh index each run, so phrases are verified like the first filter after loading
+                return len(nsf_index.InvertedIndex.load(nsf_index._index_path_for(
+                    nsf_store.store_path(SYNTHETIC_YEAR))).any_of(FILTER_WORDS, texts))
+            self.measure("filter.any_of", any_of, keywords=len(FILTER_WORDS))
+        return analysis
+
+    def bench_highlight(self, analysis):
+        matched = [award for awards in analysis.results.values() for award in awards][:self.highlight_awards]
+        if not matched:
+            return
+
+        def highlight_replace():
+            # What NSFAnalyzer.open_award did before it used highlight spans
+            for award in matched:
+                text = award["abstract"].lower()
+                for word in award["matched_words"]:
+                    text = text.replace(word.lower(), f"**{word}**")
+            return len(matched)
+        self.measure("highlight.replace", highlight_replace, items=len(matched))
+
+        from nsf_views import highlight_spans, keyword_spans
+
+        def highlight_offsets():
+            # As open_award does: a (cached) matcher over the award's matched words; the
+            # spans are cleared first, so an abstract is only reused within a run
+            keyword_spans.cache_clear()
+            for award in matched:
+                highlight_spans(award["abstract"], tuple(award["matched_words"]))
+            return len(matched)
+        self.measure("highlight.offsets", highlight_offsets, items=len(matched))
+
+    def bench_report(self, analysis):
+        import nsf_report
+
+        results = analysis.results
+        matches = sum(len(awards) for awards in results.values())
+        reported = sum(min(len(awards), self.report_top or len(awards)) for awards in results.values())
+        self.measure("report.pdf", lambda: nsf_report.write_pdf(
+            results, "bench_report.pdf", top_n=self.report_top, overall_top=25, max_awards_per_file=2000),
+            repeat=1, items=reported, top_n=self.report_top)
+
+        def write(writer, path, **kwargs):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer(results, f, **kwargs)
+        self.measure("report.csv", lambda: write(nsf_report.write_csv, "bench.csv"), items=matches)
+        self.measure("report.json", lambda: write(nsf_report.write_json, "bench.json", abstracts=False),
+                     items=matches)
+
+
+# --------------------- COMPARISON --------------------- #
+def compare(results, baseline_path, threshold):
+    """Print how each benchmark moved against a previous run. Returns the regressions."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["benchmark"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    log(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for result in results:
+        before = previous.get((result["benchmark"], result["size"]))
+        if before is None or not before["best"]:
+            continue
+        ratio = result["best"] / before["best"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(result["benchmark"])
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        log(f"  {result['benchmark']:20s} {result['size']:>9,}  {before['best'] * 1000:10.1f} -> "
+            f"{result['best'] * 1000:10.1f} ms  ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10k", help="comma-separated award counts, e.g. 10k,100k,1M")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark (best is reported)")
+    parser.add_argument("--only", help="comma-separated benchmark names or groups, e.g. load,match.years")
+    parser.add_argument("--workers", type=int, default=None, help="analysis processes (default: all cores)")
+    parser.add_argument("--fetch-awards", type=int, default=5000, help="awards served by the stub API (capped)")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="fetcher requests per second against the stub (default: unlimited)")
+    parser.add_argument("--report-top", type=int, default=500, help="awards per tier in the PDF (0 = all)")
+    parser.add_argument("--highlight-awards", type=int, default=1000, help="matched abstracts highlighted")
+    parser.add_argument("-o", "--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with the JSON of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="with --compare, slowdown counted as a regression (default 0.10 = 10%%)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    sizes = [synthetic.parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    only = [name.strip() for name in args.only.split(",")] if args.only else None
+
+    scratch = tempfile.mkdtemp(prefix="nsf_bench_")
+    cwd = os.getcwd()
+    os.environ.setdefault("NSF_MEMO_DIR", os.path.join(scratch, ".nsf_memo"))
+    results = []
+    try:
+        for size in sizes:
+            workdir = os.path.join(scratch, str(size))
+            os.makedirs(workdir)
+            os.chdir(workdir)
+            log(f"\n== {size:,} awards ==")
+            suite = Suite(size, args.repeat, only, args.workers, args.fetch_awards,
+                          args.report_top or None, args.highlight_awards, args.rate_limit)
+            results.extend(suite.run())
+            os.chdir(cwd)
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            log(f"\nScratch data kept in {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    document = {
+        "format": FORMAT_VERSION,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": {"sizes": sizes, "repeat": args.repeat, "only": only, "workers": args.workers,
+                    "fetch_awards": args.fetch_awards, "rate_limit": args.rate_limit, "report_top": args.report_top,
+                    "highlight_awards": args.highlight_awards},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+            f.write("\n")
+        log(f"\nResults saved as {args.output}")
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
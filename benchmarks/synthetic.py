@@ -0,0 +1,127 @@
+"""
+Synthetic award generator scaled from the shape of a real year.
+
+    python benchmarks/synthetic.py 100k --year 2099 [--seed 1] [--source awards_2025/2025_awards.json]
+
+Abstracts are assembled from randomly chosen sentences of the source awards,
+so their length, vocabulary and red flag keyword density follow the real
+data while no two abstracts are identical. Awardees are drawn from the
+source's institutions (plus numbered variants, so larger sets also have more
+distinct names), amounts are resampled from the source's amounts with some
+jitter, and programs, officers and dates are filled in with plausible
+values. Every award gets an id unique across years.
+
+The records are streamed to the year's JSON-lines cache (with a complete
+manifest), so even a million awards never sit in memory at once.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import nsf_cache  # noqa: E402
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "awards_2025", "2025_awards.json")
+
+PROGRAMS = ["CISE", "BIO", "GEO", "EHR", "MPS", "SBE", "ENG", "TIP", "OPP", "OIA"]
+OFFICERS = [f"{first} {last}" for first in ("Alex", "Jordan", "Sam", "Taylor", "Morgan", "Casey")
+            for last in ("Nguyen", "Smith", "Garcia", "Chen", "Patel", "Okafor", "Miller")]
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def parse_size(text):
+    """'10k', '1M', '2500' -> int."""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+class AwardGenerator:
+    """Endless stream of synthetic awards shaped like the source awards."""
+
+    def __init__(self, source=DEFAULT_SOURCE, seed=1, year=2099):
+        with open(source, "r", encoding="utf-8") as f:
+            awards = json.load(f)
+        self.random = random.Random(seed)
+        self.year = year
+        self.sentences = [s for award in awards
+                          for s in _SENTENCE_RE.split(award.get("abstractText") or "") if s.strip()]
+        self.sentences_per_abstract = max(1, round(len(self.sentences) / max(1, len(awards))))
+        self.titles = [award.get("title") or "" for award in awards]
+        self.awardees = sorted({award.get("awardeeName") or "" for award in awards})
+        self.amounts = [float(award.get("fundsObligatedAmt") or 0) for award in awards]
+        self.institutions = len(self.awardees)
+
+    def abstract(self):
+        rnd = self.random
+        n = max(1, int(rnd.gauss(self.sentences_per_abstract, self.sentences_per_abstract / 3)))
+        return " ".join(rnd.choice(self.sentences) for _ in range(n))
+
+    def award(self, i):
+        rnd = self.random
+        k = rnd.randrange(self.institutions)
+        variant, name = divmod(k, len(self.awardees))
+        awardee = self.awardees[name] + (f" ({variant})" if variant else "")
+        obligated = round(rnd.choice(self.amounts) * rnd.uniform(0.7, 1.3))
+        start = date(self.year, 1, 1) + timedelta(days=rnd.randrange(365))
+        return {
+            # Distinct per year too, so synthetic years never look like duplicates of each other
+            "id": f"9{self.year % 100:02d}{i:07d}",
+            "agency": "NSF",
+            "awardeeName": awardee,
+            "title": rnd.choice(self.titles),
+            "abstractText": self.abstract(),
+            "fundsObligatedAmt": str(obligated),
+            "estimatedTotalAmt": str(round(obligated * rnd.uniform(1.0, 1.5))),
+            "pdPIName": f"{rnd.choice(OFFICERS)} {rnd.randrange(1000)}",
+            "coPDPI": [],
+            "poName": rnd.choice(OFFICERS),
+            "startDate": start.strftime("%m/%d/%Y"),
+            "expDate": (start + timedelta(days=365 * rnd.randint(1, 5))).strftime("%m/%d/%Y"),
+            "primaryProgram": rnd.choice(PROGRAMS),
+        }
+
+    def iter_awards(self, n):
+        # About one distinct institution per 40 awards, like a real year
+        self.institutions = max(len(self.awardees), n // 40)
+        for i in range(n):
+            yield self.award(i)
+
+
+def write_year(n, year=2099, source=DEFAULT_SOURCE, seed=1):
+    """Write n synthetic awards as `year`'s completed cache (in the current directory). Returns the cache path."""
+    generator = AwardGenerator(source, seed, year)
+    os.makedirs(nsf_cache.year_folder(year), exist_ok=True)
+    path = nsf_cache.cache_path(year)
+    count = nsf_cache.write_jsonl(path, generator.iter_awards(n), block_size=2000)
+    nsf_cache.save_manifest(year, {
+        "year": int(year),
+        "cache_file": os.path.basename(path),
+        "record_count": count,
+        "total_count": count,
+        "started_at": None,
+        "fetched_at": None,
+        "synthetic": {"seed": seed, "source": os.path.basename(source)},
+        "complete": True,
+    })
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("size", type=parse_size, help="number of awards, e.g. 10k, 100k, 1M")
+    parser.add_argument("--year", type=int, default=2099, help="year folder to write (default 2099)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="awards whose shape is copied")
+    args = parser.parse_args()
+    print(write_year(args.size, args.year, args.source, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,32 @@
 import customtkinter as ctk
 from tkinter import messagebox, scrolledtext
 import requests
-import os
 import csv
-import json
+import queue
+import threading
+import time
 from datetime import datetime
-from fpdf import FPDF
+import nsf_cache
+import nsf_metrics
+from nsf_analysis import AnalysisCancelled
+from nsf_download import fetch_awards_for_year
+from nsf_fetch import NSFFetcher
+from nsf_keywords import RED_FLAG_WORDS
+from nsf_memo import analyze_year
+from nsf_report import write_pdf
+from nsf_views import VirtualTreeview, configure_highlight_tags, highlight_spans, insert_highlighted
 
 # Configure appearance
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
-API_BASE_URL = "http://api.nsf.gov/services/v1/awards.json"
+# How often the Tk loop drains worker events (milliseconds)
+POLL_INTERVAL_MS = 100
 
-# Define tiered red flag words
-RED_FLAG_WORDS = {
-    "Tier 1 (Critical)": [  # Most "woke"
-        "social justice", "systemic racism", "anti-racism", "white privilege",
-        "decolonization", "intersectionality", "cultural appropriation",
-        "radical inclusion", "anti-oppression", "equity lens"
-    ],
-    "Tier 2 (High)": [
-        "diversity", "equity", "inclusion", "BIPOC", "LGBTQIA+",
-        "marginalized communities", "gender equity", "racial justice",
-        "microaggressions", "cultural humility"
-    ],
-    "Tier 3 (Moderate)": [
-        "accessibility", "representation", "community engagement",
-        "empowerment", "holistic approach", "disparity", "underserved",
-        "neurodiversity", "safe space", "allyship"
-    ],
-    "Tier 4 (Common)": [  # Least concerning
-        "innovative", "cutting-edge", "synergy", "leverage", "game-changing",
-        "revolutionary", "disruptive", "paradigm", "unprecedented", "scalable",
-        "framework", "sustainability", "impactful", "stakeholder", "inclusive"
-    ]
-}
+# Reports open with the top awards across all tiers and split into volumes
+# of this many awards, so very large result sets still build quickly
+REPORT_OVERALL_TOP = 25
+REPORT_AWARDS_PER_FILE = 2000
 
 class NSFAnalyzer:
     def __init__(self):
@@ -44,7 +35,23 @@ class NSFAnalyzer:
         self.root.geometry("1200x800")
         
         self.selected_words = {tier: [] for tier in RED_FLAG_WORDS.keys()}
+        self.fetcher = NSFFetcher()
+        
+        # Background job state: the worker only talks to the GUI through
+        # self.events, which the Tk loop drains in poll_events()
+        self.events = queue.Queue()
+        self.worker = None
+        self.cancel_event = None
+        self.stage = None
+        self.stage_started = None
+        self.job_metrics = None
+        
+        # Structured results of the last analysis and the flattened rows shown in the table
+        self.results = None
+        self.match_rows = []
+        
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def setup_gui(self):
         # Main container
@@ -93,95 +100,64 @@ class NSFAnalyzer:
         button_frame = ctk.CTkFrame(left_panel)
         button_frame.pack(fill="x", pady=5)
         
-        ctk.CTkButton(button_frame, text="Analyze", command=self.fetch_and_analyze).pack(fill="x", pady=2)
+        self.analyze_button = ctk.CTkButton(button_frame, text="Analyze", command=self.fetch_and_analyze)
+        self.analyze_button.pack(fill="x", pady=2)
+        self.cancel_button = ctk.CTkButton(button_frame, text="Cancel", command=self.cancel_job, state="disabled")
+        self.cancel_button.pack(fill="x", pady=2)
         ctk.CTkButton(button_frame, text="Generate Report", command=self.generate_report).pack(fill="x", pady=2)
         
         # Right panel for results
         right_panel = ctk.CTkFrame(main_container)
         right_panel.pack(side="right", fill="both", expand=True, padx=5)
         
-        # Results list
-        self.results_list = ctk.CTkTextbox(right_panel)
-        self.results_list.pack(fill="both", expand=True)
+        # Progress of the running job
+        progress_frame = ctk.CTkFrame(right_panel)
+        progress_frame.pack(fill="x", pady=(0, 5))
+        self.progress_bar = ctk.CTkProgressBar(progress_frame)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill="x", padx=5, pady=(5, 2))
+        self.status_label = ctk.CTkLabel(progress_frame, text="Idle", anchor="w")
+        self.status_label.pack(fill="x", padx=5)
         
-    def fetch_awards(self, year):
-        # Check for cached JSON file
-        folder_name = f"awards_{year}"
-        json_file_path = os.path.join(folder_name, f"{year}_awards.json")
+        # Log and per-tier summary
+        self.results_list = ctk.CTkTextbox(right_panel, height=180)
+        self.results_list.pack(fill="x")
         
-        # Try to load cached data first
-        if os.path.exists(json_file_path):
-            try:
-                self.results_list.insert(ctk.END, f"Found cached data for {year}...\n")
-                self.root.update()
-                
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    awards = json.load(f)
-                    self.results_list.insert(ctk.END, f"Loaded {len(awards)} awards from cache.\n")
-                    self.root.update()
-                    return awards
-            except Exception as e:
-                self.results_list.insert(ctk.END, f"Error reading cached data: {str(e)}\n")
-                self.root.update()
+        # Matched awards; only the visible rows are materialized and the
+        # highlighted abstract is rendered when a row is opened
+        self.results_view = VirtualTreeview(
+            right_panel, ("Tier", "Title", "Awardee", "Amount", "Matched Words"),
+            widths={"Title": 350, "Awardee": 200, "Amount": 110, "Matched Words": 220},
+            on_open=self.open_award)
+        self.results_view.pack(fill="both", expand=True, pady=(5, 0))
         
-        # If no cache exists or cache read failed, fetch from API
-        self.results_list.insert(ctk.END, "No cached data found. Fetching from NSF API...\n")
-        self.root.update()
+    def fetch_awards(self, year, log=print, progress=None, cancel_event=None):
+        """
+        Make sure the year has a complete cache, downloading (or resuming) it if needed.
+
+        Returns False if the download was cancelled. Runs on the worker
+        thread, so it never touches the widgets itself.
+        """
+        # Only trust a cache whose download finished; a partial one is resumed
+        if nsf_cache.is_complete(year):
+            log(f"Found cached data for {year}...")
+            return True
         
-        awards = []
-        offset = 1
-        rpp = 25
+        # If no complete cache exists, fetch from API
+        log("No complete cached data found. Fetching from NSF API...")
+        with nsf_metrics.stage("fetch_awards"):
+            fetch_awards_for_year(year, log, fetcher=self.fetcher, cancel_event=cancel_event, progress=progress)
         
-        try:
-            while True:
-                params = {
-                    "dateStart": f"01/01/{year}",
-                    "dateEnd": f"12/31/{year}",
-                    "rpp": rpp,
-                    "offset": offset,
-                    "printFields": "id,title,abstractText,awardeeName,fundsObligatedAmt"
-                }
-                
-                response = requests.get(API_BASE_URL, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                
-                if not ("response" in data and "award" in data["response"]):
-                    break
-                    
-                batch = data["response"]["award"]
-                if not batch:
-                    break
-                    
-                awards.extend(batch)
-                offset += rpp
-                
-                self.results_list.insert(ctk.END, f"Fetched {len(awards)} awards...\n")
-                self.results_list.see(ctk.END)
-                self.root.update()
-            
-            # Cache the fetched data
-            if awards:
-                try:
-                    if not os.path.exists(folder_name):
-                        os.makedirs(folder_name)
-                    
-                    with open(json_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(awards, f, indent=2)
-                    self.results_list.insert(ctk.END, f"Cached {len(awards)} awards for future use.\n")
-                    self.root.update()
-                except Exception as e:
-                    self.results_list.insert(ctk.END, f"Warning: Could not cache data: {str(e)}\n")
-                    self.root.update()
-                
-        except Exception as e:
-            self.results_list.insert(ctk.END, f"Error fetching awards: {str(e)}\n")
-            self.root.update()
-            raise
-        
-        return awards
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        if not nsf_cache.is_complete(year):
+            raise requests.exceptions.RequestException(
+                f"Download for {year} stopped before completion. Click Analyze again to resume it.")
+        return True
     
     def fetch_and_analyze(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
         year = self.year_var.get()
         selected_words = {tier: [] for tier in RED_FLAG_WORDS.keys()}
         
@@ -199,99 +175,199 @@ class NSFAnalyzer:
         
         self.results_list.delete("1.0", ctk.END)
         self.results_list.insert(ctk.END, f"Analyzing awards for {year}...\n\n")
-        self.root.update()  # Force GUI update
+        self.results = None
+        self.match_rows = []
+        self.results_view.clear()
         
+        # Hand the job to a worker thread; Analyze stays disabled until it finishes
+        self.analyze_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.cancel_event = threading.Event()
+        self.job_metrics = nsf_metrics.Metrics()
+        self.worker = threading.Thread(target=self.run_job,
+                                       args=(year, selected_words, self.cancel_event, self.job_metrics),
+                                       name="nsf-analyze", daemon=True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_events)
+    
+    def run_job(self, year, selected_words, cancel_event, metrics=None):
+        """Fetch and analyze on the worker thread, posting (kind, payload) events."""
+        post = self.events.put
         try:
-            # Show progress
-            self.results_list.insert(ctk.END, "Fetching awards from NSF API...\n")
-            self.root.update()
-            awards = self.fetch_awards(year)
-            
-            if not awards:
-                self.results_list.insert(ctk.END, "No awards found for selected year.\n")
-                return
-                
-            self.results_list.insert(ctk.END, f"Analyzing {len(awards)} awards...\n")
-            self.root.update()
-            self.analyze_awards(awards, selected_words)
+            with nsf_metrics.collect(metrics):
+                post(("stage", "Fetching awards"))
+                post(("log", "Fetching awards from NSF API..."))
+                fetched = self.fetch_awards(
+                    year,
+                    log=lambda line: post(("log", line.strip("\n"))),
+                    progress=lambda done, total: post(("progress", (done, total, None))),
+                    cancel_event=cancel_event)
+                if not fetched:
+                    post(("cancelled", None))
+                    return
             
+                post(("stage", "Matching keywords"))
+                post(("log", "Analyzing awards..."))
+                # Memoized per (cache contents, keyword selection); a changed
+                # selection only looks up the keywords it has not seen before,
+                # reporting each one with the running match count per tier
+                analysis = analyze_year(
+                    year, selected_words, cancel_event=cancel_event,
+                    progress=lambda done, total, matches: post(("progress", (done, total, matches))))
+                if analysis.scanned == 0:
+                    post(("log", "No awards found for selected year."))
+                    return
+                post(("results", analysis.results))
+        except AnalysisCancelled:
+            post(("cancelled", None))
         except requests.exceptions.RequestException as e:
-            messagebox.showerror("Network Error", f"Failed to connect to NSF API: {str(e)}")
+            post(("error", ("Network Error", f"Failed to connect to NSF API: {str(e)}")))
         except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {str(e)}")
+            post(("error", ("Error", f"An unexpected error occurred: {str(e)}")))
+        finally:
+            post(("finished", None))
     
-    def analyze_awards(self, awards, selected_words):
-        results = {tier: [] for tier in RED_FLAG_WORDS.keys()}
-        
-        for award in awards:
-            abstract = award.get("abstractText", "").lower()
-            
-            for tier, words in selected_words.items():
-                if any(word.lower() in abstract for word in words):
-                    results[tier].append({
-                        "id": award.get("id", ""),
-                        "title": award.get("title", ""),
-                        "awardee": award.get("awardeeName", ""),
-                        "amount": float(award.get("fundsObligatedAmt", 0)),
-                        "abstract": award.get("abstractText", ""),
-                        "matched_words": [w for w in words if w.lower() in abstract]
-                    })
-        
-        # Sort results by amount in descending order
-        for tier in results:
-            results[tier].sort(key=lambda x: x["amount"], reverse=True)
+    def poll_events(self):
+        """Drain worker events on the Tk thread; re-arms itself until the job finishes."""
+        finished = False
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                self.results_list.insert(ctk.END, payload + "\n")
+                self.results_list.see(ctk.END)
+            elif kind == "stage":
+                self.stage = payload
+                self.stage_started = time.monotonic()
+                self.progress_bar.set(0)
+                self.status_label.configure(text=f"{payload}...")
+            elif kind == "progress":
+                self.show_progress(*payload)
+            elif kind == "results":
+                # Rendering is timed on the Tk thread into the job's metrics
+                with self.job_metrics.stage("render"):
+                    self.display_results(payload)
+            elif kind == "cancelled":
+                self.results_list.insert(ctk.END, "\nCancelled. A partial download resumes on the next Analyze.\n")
+            elif kind == "error":
+                messagebox.showerror(*payload)
+            elif kind == "finished":
+                finished = True
+                self.log_metrics(self.job_metrics)
         
-        self.display_results(results)
+        if finished:
+            self.analyze_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
+            self.progress_bar.set(0)
+            self.status_label.configure(text="Idle")
+        else:
+            self.root.after(POLL_INTERVAL_MS, self.poll_events)
+    
+    def log_metrics(self, metrics):
+        """Append a run's stage timings and counters to the log pane (and export them if NSF_PROFILE is set)."""
+        if metrics is None:
+            return
+        self.results_list.insert(ctk.END, "\n" + metrics.format_summary() + "\n")
+        try:
+            path = nsf_metrics.export_profile(metrics)
+        except OSError as e:
+            path = None
+            self.results_list.insert(ctk.END, f"Could not write the profile: {e}\n")
+        if path:
+            self.results_list.insert(ctk.END, f"Profile saved as {path}\n")
+        self.results_list.see(ctk.END)
+    
+    def show_progress(self, done, total, matches):
+        """Update the progress bar and the status line with an ETA for the current stage."""
+        text = f"{self.stage}: {done:,}"
+        if total:
+            fraction = min(done / total, 1.0)
+            self.progress_bar.set(fraction)
+            text += f" of {total:,}"
+            elapsed = time.monotonic() - self.stage_started
+            if 0 < fraction < 1:
+                remaining = elapsed / fraction * (1 - fraction)
+                text += f" - about {int(remaining // 60)}m {int(remaining % 60):02d}s left"
+        if matches:
+            text += " | matches so far: " + ", ".join(f"{tier.split(' (')[0]}: {count}" for tier, count in matches.items())
+        self.status_label.configure(text=text)
     
-    def highlight_red_flags(self, text, matched_words):
-        """Highlight red flag words in the abstract."""
-        for word in matched_words:
-            text = text.replace(word.lower(), f"**{word}**")  # Highlighting with asterisks
-        return text
+    def cancel_job(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.cancel_button.configure(state="disabled")
+            self.status_label.configure(text="Cancelling...")
+    
+    def on_close(self):
+        # Let a running download stop at its next page; its checkpoint survives
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.root.destroy()
     
     def display_results(self, results):
-        self.results_list.delete("1.0", ctk.END)
-        
+        """Show per-tier totals in the textbox (one bulk insert) and the matches in the table."""
+        self.results = results
+        lines = []
         for tier, awards in results.items():
             if awards:
-                self.results_list.insert(ctk.END, f"\n{tier} Matches:\n")
-                self.results_list.insert(ctk.END, "=" * 50 + "\n")
-                
                 total_funding = sum(award["amount"] for award in awards)
-                self.results_list.insert(ctk.END, f"Total Funding: ${total_funding:,.2f}\n")
-                self.results_list.insert(ctk.END, f"Number of Awards: {len(awards)}\n\n")
-                
-                for award in awards:
-                    highlighted_abstract = self.highlight_red_flags(award['abstract'].lower(), award['matched_words'])
-                    self.results_list.insert(ctk.END, f"Title: {award['title']}\n")
-                    self.results_list.insert(ctk.END, f"Awardee: {award['awardee']}\n")
-                    self.results_list.insert(ctk.END, f"Amount: ${award['amount']:,.2f}\n")
-                    self.results_list.insert(ctk.END, f"Abstract: {highlighted_abstract}\n")
-                    self.results_list.insert(ctk.END, f"Matched Words: {', '.join(award['matched_words'])}\n")
-                    self.results_list.insert(ctk.END, "-" * 40 + "\n")
+                lines.append(f"\n{tier} Matches:\n")
+                lines.append("=" * 50 + "\n")
+                lines.append(f"Total Funding: ${total_funding:,.2f}\n")
+                lines.append(f"Number of Awards: {len(awards)}\n")
+        if not lines:
+            lines.append("\nNo awards matched the selected words.\n")
+        else:
+            lines.append("\nDouble-click an award below to read its abstract.\n")
+        self.results_list.delete("1.0", ctk.END)
+        self.results_list.insert(ctk.END, "".join(lines))
+        
+        self.match_rows = [(tier, award) for tier, awards in results.items() for award in awards]
+        self.results_view.set_source(len(self.match_rows), self.match_row_values)
+    
+    def match_row_values(self, i):
+        tier, award = self.match_rows[i]
+        return (tier, award["title"], award["awardee"], f"${award['amount']:,.2f}", ", ".join(award["matched_words"]))
+    
+    def open_award(self, i):
+        """Open one matched award with its highlighted abstract."""
+        tier, award = self.match_rows[i]
+        window = ctk.CTkToplevel(self.root)
+        window.title(award["title"][:80] or "Award")
+        window.geometry("800x600")
+        
+        text = ctk.CTkTextbox(window, wrap="word")
+        text.pack(fill="both", expand=True, padx=10, pady=10)
+        configure_highlight_tags(text)
+        text.insert(ctk.END, "".join([
+            f"Title: {award['title']}\n",
+            f"Awardee: {award['awardee']}\n",
+            f"Amount: ${award['amount']:,.2f}\n",
+            f"{tier} - Matched Words: {', '.join(award['matched_words'])}\n\n",
+            "Abstract: ",
+        ]))
+        # The matched words are highlighted in the original abstract, coloured by tier
+        abstract = award["abstract"] or ""
+        rank = list(self.results).index(tier) if tier in self.results else 0
+        spans = highlight_spans(abstract, tuple(award["matched_words"]), {None: rank})
+        insert_highlighted(text, abstract + "\n", spans)
+        text.configure(state="disabled")
     
     def generate_report(self):
-        report_text = self.results_list.get("1.0", ctk.END)
-        if not report_text.strip():
+        if not self.results or not any(self.results.values()):
             messagebox.showwarning("Warning", "No results to generate report from. Please analyze data first.")
             return
-            
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "NSF Awards Analysis Report", ln=True, align="C")
-        pdf.set_font("Arial", "", 12)
-        
-        # Split text into lines and add to PDF
-        for line in report_text.split("\n"):
-            # Encode the line to handle special characters
-            line = line.encode('latin-1', 'replace').decode('latin-1')  # Replace unencodable characters
-            pdf.multi_cell(0, 10, line)
         
+        # Built from the structured results rather than the textbox contents
         try:
             filename = f"nsf_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            pdf.output(filename)
-            messagebox.showinfo("Success", f"Report saved as {filename}")
+            with nsf_metrics.collect() as metrics:
+                paths = write_pdf(self.results, filename, overall_top=REPORT_OVERALL_TOP,
+                                  max_awards_per_file=REPORT_AWARDS_PER_FILE)
+            self.log_metrics(metrics)
+            messagebox.showinfo("Success", f"Report saved as {', '.join(paths)}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
     
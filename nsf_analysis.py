@@ -0,0 +1,237 @@
+"""
+Parallel red flag analysis engine.
+
+Awards are split into shards and every shard is scanned by KeywordMatcher in
+a separate process, so a sweep over many years uses every core. The shard
+results are merged back in order and sorted by amount, giving exactly the
+`results` mapping that NSFAnalyzer.display_results consumes:
+
+    {tier: [{"id", "title", "awardee", "amount", "abstract", "matched_words"}, ...]}
+
+analyze_records() takes any iterable of award dicts. analyze_years() works
+from the years' Arrow stores: each worker memory-maps the store and reads its
+own rows, so abstracts are never pickled between processes, and the keyword
+index narrows the rows to the awards that can match at all.
+
+Both entry points take an optional `progress(done, total, matches)` callback,
+called after every shard with the awards scanned so far and the running match
+count per tier, and a `cancel_event` that stops the scan between shards.
+
+Nothing here imports tkinter, so the engine runs headlessly.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import nsf_metrics
+from nsf_award import AMOUNT_FIELD, Award
+from nsf_keywords import RED_FLAG_WORDS
+from nsf_matcher import KeywordMatcher
+
+# Columns read from the award store for analysis
+ANALYSIS_COLUMNS = ["id", "title", "abstractText", "awardeeName", AMOUNT_FIELD]
+
+SHARD_SIZE = 2000
+
+Analysis = namedtuple("Analysis", ["results", "totals", "scanned"])
+
+class AnalysisCancelled(Exception):
+    """Raised when an analysis is cancelled through its cancel_event."""
+
+
+# Per-process matcher, compiled once by the pool initializer
+_matcher = None
+
+
+def empty_results(tiers=None):
+    return {tier: [] for tier in (tiers if tiers is not None else RED_FLAG_WORDS.keys())}
+
+
+def _make_matcher(selected_words, boilerplate=None):
+    matcher = KeywordMatcher(selected_words)
+    if boilerplate is not None:
+        from nsf_dedup import BoilerplateStripper
+        matcher = BoilerplateStripper(matcher, boilerplate)
+    return matcher
+
+
+def _init_worker(selected_words, boilerplate=None):
+    global _matcher
+    _matcher = _make_matcher(selected_words, boilerplate)
+
+
+def _scan(awards, matcher, year=None):
+    """Scan awards with `matcher`. Returns ({tier: [result]}, scanned)."""
+    results = {}
+    scanned = 0
+    for award in awards:
+        scanned += 1
+        abstract = award.get("abstractText") or ""
+
+        matches = matcher.matched_words(abstract)
+        if matches:
+            # Only matched awards are parsed; raw records and store rows alike
+            award = Award.from_record(award)
+        for tier, matched_words in matches.items():
+            result = {
+                "id": award.get("id", ""),
+                "title": award.get("title", ""),
+                "awardee": award.get("awardeeName", ""),
+                "amount": award.amount,
+                "abstract": abstract,
+                "matched_words": matched_words
+            }
+            if year is not None:
+                result["year"] = year
+            results.setdefault(tier, []).append(result)
+    return results, scanned
+
+
+def _scan_records(awards, matcher=None):
+    return _scan(awards, matcher or _matcher)
+
+
+def _scan_store_rows(shard, matcher=None):
+    import nsf_store
+    year, path, rows = shard
+    table = nsf_store.read_table(path, ANALYSIS_COLUMNS)
+    return _scan(nsf_store.take_rows(table, rows), matcher or _matcher, year)
+
+
+def _shards(items, size):
+    items = iter(items)
+    while True:
+        shard = list(islice(items, size))
+        if not shard:
+            return
+        yield shard
+
+
+def _merge(shard_results):
+    """Concatenate shard results in shard order, then sort each tier by amount."""
+    results = empty_results()
+    scanned = 0
+    for shard, count in shard_results:
+        scanned += count
+        for tier, matches in shard.items():
+            results.setdefault(tier, []).extend(matches)
+
+    # Sort results by amount in descending order (stable, so ties keep input order)
+    with nsf_metrics.stage("analysis.merge"):
+        for tier in results:
+            results[tier].sort(key=lambda x: x["amount"], reverse=True)
+        totals = {tier: sum(award["amount"] for award in matches) for tier, matches in results.items()}
+    nsf_metrics.count("awards_scanned", scanned)
+    nsf_metrics.count_keywords(results)
+    return Analysis(results, totals, scanned)
+
+
+def _run(worker, shards, selected_words, workers, progress=None, cancel_event=None, boilerplate=None):
+    """
+    Map `worker` over shards in a process pool, or inline when one process
+    is enough. Returns the shard results in shard order.
+    """
+    shards = list(shards)
+    # Store shards are (year, path, rows) tuples; record shards are lists
+    total = sum(len(shard[-1]) if isinstance(shard, tuple) else len(shard) for shard in shards)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(shards))
+
+    shard_results = []
+    matches = {}
+
+    def collect(result):
+        if cancel_event is not None and cancel_event.is_set():
+            raise AnalysisCancelled()
+        shard_results.append(result)
+        for tier, found in result[0].items():
+            matches[tier] = matches.get(tier, 0) + len(found)
+        if progress is not None:
+            progress(sum(count for _, count in shard_results), total, dict(matches))
+
+    if workers <= 1:
+        matcher = _make_matcher(selected_words, boilerplate)
+        for shard in shards:
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled()
+            collect(worker(shard, matcher))
+        return shard_results
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(selected_words, boilerplate)) as executor:
+        futures = [executor.submit(worker, shard) for shard in shards]
+        try:
+            for future in futures:
+                collect(future.result())
+        except AnalysisCancelled:
+            # Shards already running finish; queued ones never start
+            for future in futures:
+                future.cancel()
+            raise
+    return shard_results
+
+
+def analyze_records(awards, selected_words, workers=None, shard_size=SHARD_SIZE,
+                    progress=None, cancel_event=None, boilerplate=None):
+    """
+    Scan an iterable of award dicts for the selected {tier: [words]}.
+
+    Returns Analysis(results, totals, scanned): the per-tier results sorted by
+    amount, the funding total per tier and the number of awards scanned.
+    workers=1 scans in this process. `boilerplate` (shingle hashes from
+    nsf_dedup.boilerplate_shingles) is stripped from abstracts before matching.
+    """
+    with nsf_metrics.stage("analysis.scan"):
+        shard_results = _run(_scan_records, _shards(awards, shard_size), selected_words, workers,
+                             progress, cancel_event, boilerplate)
+    return _merge(shard_results)
+
+
+def analyze_years(years, selected_words, workers=None, shard_size=SHARD_SIZE, use_index=True,
+                  progress=None, cancel_event=None, dedupe=True, boilerplate=None, near_duplicates=None):
+    """
+    Analyze the completed caches of several years straight from their stores.
+
+    Every result also carries its "year". With use_index, only rows the
+    keyword index reports as possibly mentioning a selected word are read, and
+    `scanned` counts those candidates. With dedupe, an award cached in more
+    than one of the years is analyzed once, from its newest copy (see
+    nsf_merge), so funding totals do not count it twice. `near_duplicates`
+    (clusters from nsf_dedup.near_duplicates) drops every cluster member but
+    the first one deduplication kept, and `boilerplate` is stripped before
+    matching.
+    """
+    import nsf_index
+    import nsf_store
+
+    keywords = [word for words in selected_words.values() for word in words]
+    excluded = {}
+    if dedupe:
+        import nsf_merge
+
+        with nsf_metrics.stage("analysis.merge_index"):
+            excluded = nsf_merge.open_merge(years).excluded_rows(years)
+    if near_duplicates:
+        from nsf_dedup import duplicate_copies
+
+        for year, rows in duplicate_copies(near_duplicates, excluded).items():
+            excluded[year] = excluded.get(year, set()) | rows
+    shards = []
+    with nsf_metrics.stage("analysis.index"):
+        for year in years:
+            path = nsf_store.ensure_store(year)
+            if use_index:
+                rows = nsf_index.open_index(year).candidates(keywords)
+            else:
+                rows = range(nsf_store.read_table(path, ["id"]).num_rows)
+            dropped = excluded.get(int(year))
+            if dropped:
+                rows = [row for row in rows if row not in dropped]
+            for shard in _shards(rows, shard_size):
+                shards.append((year, path, shard))
+    with nsf_metrics.stage("analysis.scan"):
+        shard_results = _run(_scan_store_rows, shards, selected_words, workers, progress, cancel_event,
+                             boilerplate)
+    return _merge(shard_results)
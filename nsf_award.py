@@ -0,0 +1,217 @@
+"""
+Shared award data model.
+
+Every tool used to keep awards as raw API dicts of strings and convert them
+where they were used: float() on the obligated amount for every hit in the
+analyzer, pandas coercion of the estimated amount in the detector. Award
+parses each field once, when the record is loaded:
+
+    amounts   float (or None when missing or unparseable)
+    dates     datetime.date (the API sends MM/DD/YYYY)
+    coPDPI    "; "-joined names (the API sends a list)
+
+Awards use __slots__ instead of a per-record dict, and the names that repeat
+across thousands of awards (awardee, agency, program, officers) are interned
+so every award of an institution shares one string.
+
+The Arrow store is built from Awards and both analysis engines read their
+matches through Award.from_record, so every tool agrees on what a field
+holds, and the analyzers on which amount is an award's funding
+(AMOUNT_FIELD). The Red Flag Analyzer totals the estimated amount instead.
+
+Loaders cover every cache format: the Arrow store (already typed, so nothing
+is parsed again), JSON lines (plain, .gz or .zst) and the legacy .json/.csv
+caches.
+"""
+import sys
+from datetime import date, datetime
+
+import nsf_cache
+
+# Fields requested from the API, in cache/CSV column order
+FIELDS = (
+    "id", "agency", "awardeeName", "title", "abstractText",
+    "fundsObligatedAmt",       # (1)
+    "estimatedTotalAmt",       # (2)
+    "pdPIName",                # (5)
+    "coPDPI",                  # (6)
+    "poName",                  # (7)
+    "startDate",               # (9)
+    "expDate",                 # (10)
+    "primaryProgram",          # (11)
+)
+
+AMOUNT_FIELDS = ("fundsObligatedAmt", "estimatedTotalAmt")
+# The funding every tool totals and ranks by (Award.amount)
+AMOUNT_FIELD = "fundsObligatedAmt"
+DATE_FIELDS = ("startDate", "expDate")
+# Names shared by many awards; each distinct value is stored once
+INTERNED_FIELDS = ("agency", "awardeeName", "pdPIName", "poName", "primaryProgram")
+_NAMES = frozenset(FIELDS + ("year",))
+
+
+# --------------------- FIELD PARSING --------------------- #
+def parse_amount(value):
+    """'123456' / 123456 / '' -> float or None."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date(value):
+    """Parse the API's MM/DD/YYYY dates (ISO dates and date objects are accepted too)."""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    for fmt in ("%m/%d/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_text(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        # coPDPI arrives as a list of names
+        return "; ".join(str(v) for v in value)
+    return str(value)
+
+
+def _intern(value):
+    return sys.intern(value) if value else value
+
+
+# --------------------- AWARD --------------------- #
+class Award:
+    """
+    One award with typed fields, read like a record: award.title,
+    award.get("title") and award["title"] all work, so code written for raw
+    API dicts accepts Awards unchanged.
+    """
+
+    __slots__ = FIELDS + ("year",)
+
+    def __init__(self, year=None, **fields):
+        self.year = year
+        for name in FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_record(cls, record, year=None):
+        """Parse a raw record (API page, JSON lines or CSV row)."""
+        award = cls.__new__(cls)
+        award.year = year
+        get = record.get
+        for name in FIELDS:
+            value = get(name)
+            if name in AMOUNT_FIELDS:
+                value = parse_amount(value)
+            elif name in DATE_FIELDS:
+                value = parse_date(value)
+            else:
+                value = parse_text(value)
+                if name in INTERNED_FIELDS:
+                    value = _intern(value)
+            setattr(award, name, value)
+        return award
+
+    @classmethod
+    def from_typed(cls, record, year=None):
+        """Wrap an already typed record (an Arrow store row); only the names are interned."""
+        award = cls.__new__(cls)
+        award.year = year
+        get = record.get
+        for name in FIELDS:
+            value = get(name)
+            if name in INTERNED_FIELDS:
+                value = _intern(value)
+            setattr(award, name, value)
+        return award
+
+    @property
+    def amount(self):
+        """Obligated funding as a float (0.0 when unknown); what the analyzers total."""
+        return getattr(self, AMOUNT_FIELD) or 0.0
+
+    def get(self, name, default=None):
+        value = getattr(self, name) if name in _NAMES else None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        if name not in _NAMES:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def to_dict(self):
+        """The award as a plain dict of typed values (without the year)."""
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def to_record(self):
+        """The award in the API's string form, e.g. for writing back to a cache."""
+        record = self.to_dict()
+        for name in AMOUNT_FIELDS:
+            if record[name] is not None:
+                record[name] = f"{record[name]:.0f}" if record[name].is_integer() else str(record[name])
+        for name in DATE_FIELDS:
+            if record[name] is not None:
+                record[name] = record[name].strftime("%m/%d/%Y")
+        return record
+
+    def __repr__(self):
+        return f"Award(id={self.id!r}, year={self.year!r}, amount={self.amount:,.2f})"
+
+
+# --------------------- LOADERS --------------------- #
+def iter_file(path, year=None):
+    """Stream Awards from any cache file: Arrow store, JSON lines (.gz/.zst) or legacy .json/.csv."""
+    if path.endswith(".arrow"):
+        import nsf_store
+
+        for batch in nsf_store.read_table(path).to_batches():
+            for record in batch.to_pylist():
+                yield Award.from_typed(record, year)
+        return
+    for record in nsf_cache.iter_awards_file(path):
+        yield Award.from_record(record, year)
+
+
+def load_file(path, year=None):
+    return list(iter_file(path, year))
+
+
+def iter_year(year, use_store=True):
+    """
+    Stream the year's completed cache as Awards.
+
+    With use_store (and pyarrow installed) the typed Arrow store is read, so
+    no field is parsed again; otherwise the JSON-lines cache is parsed.
+    """
+    if use_store:
+        try:
+            import nsf_store
+        except ImportError:
+            use_store = False
+    if use_store:
+        return iter_file(nsf_store.ensure_store(year), int(year))
+    cache_file = nsf_cache.find_cache(year)
+    if cache_file is None:
+        raise FileNotFoundError(f"No complete award cache for {year}")
+    return iter_file(cache_file, int(year))
+
+
+def load_year(year, use_store=True):
+    return list(iter_year(year, use_store))
+
+
+def load_years(years, use_store=True):
+    """Awards of several years, in year order."""
+    return [award for year in years for award in iter_year(year, use_store)]
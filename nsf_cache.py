@@ -0,0 +1,426 @@
+"""
+On-disk award cache layout, download manifests and page-level checkpoints.
+
+Every year lives under awards_{year}/:
+
+    {year}_awards.jsonl[.gz|.zst]          the award cache, one JSON record per line
+    {year}_awards.jsonl[.gz|.zst].partial  pages committed by an unfinished download
+    {year}_awards.csv                      CSV export for spreadsheets
+    manifest.json                          state of the year's completed download
+    manifest.json.partial                  checkpoint of an unfinished download
+
+The cache is append-only: the downloader writes it page by page and readers
+stream it back record by record, so neither side holds a whole year in
+memory. Caches in the old formats ({year}_awards.json arrays or CSV exports)
+are converted to JSON lines the first time they are opened; the original
+files are left in place.
+
+The manifests record the last committed offset, the API's total record count
+and when the data was fetched, so an interrupted download resumes where it
+stopped and a cache is only treated as complete once the download finished.
+A download in progress only writes the .partial files, so downloading a
+completed year again leaves its cache usable until the new one replaces it.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+
+MANIFEST_NAME = "manifest.json"
+
+# Compression for newly written caches: "" (plain), "gz" or "zst".
+# zstd needs the optional `zstandard` package.
+DEFAULT_COMPRESSION = os.environ.get("NSF_CACHE_COMPRESSION", "")
+
+CACHE_SUFFIXES = {"": ".jsonl", "gz": ".jsonl.gz", "zst": ".jsonl.zst"}
+PARTIAL_SUFFIX = ".partial"
+# Conversions of stray legacy files, kept apart from the downloader's caches
+MIGRATED_SUFFIX = ".migrated.jsonl"
+
+
+def year_folder(year):
+    return f"awards_{year}"
+
+
+def cache_path(year, compression=None):
+    """Path of the JSON-lines cache for `year` with the given compression."""
+    if compression is None:
+        compression = DEFAULT_COMPRESSION
+    return os.path.join(year_folder(year), f"{year}_awards{CACHE_SUFFIXES[compression]}")
+
+
+def legacy_json_path(year):
+    return os.path.join(year_folder(year), f"{year}_awards.json")
+
+
+def csv_cache_path(year):
+    return os.path.join(year_folder(year), f"{year}_awards.csv")
+
+
+def manifest_path(year, partial=False):
+    path = os.path.join(year_folder(year), MANIFEST_NAME)
+    return path + PARTIAL_SUFFIX if partial else path
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _compression_of(path):
+    for compression, suffix in CACHE_SUFFIXES.items():
+        if compression and path.endswith(suffix):
+            return compression
+    return ""
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd caches need the 'zstandard' package: pip install zstandard")
+    return zstandard
+
+
+def _write_atomic(path, text):
+    """Write text to path via a temp file so readers never see a half-written file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# --------------------- JSON LINES I/O --------------------- #
+def encode_block(awards, compression):
+    """
+    Encode awards as one self-contained block of JSON lines.
+
+    gzip members and zstd frames can be concatenated, so every block can be
+    appended to a compressed cache on its own.
+    """
+    data = "".join(json.dumps(award, ensure_ascii=False) + "\n" for award in awards).encode("utf-8")
+    if compression == "gz":
+        return gzip.compress(data)
+    if compression == "zst":
+        return _zstd().ZstdCompressor().compress(data)
+    return data
+
+
+def append_block(path, awards, compression=None):
+    """Append awards to a cache file and fsync. Returns the file size afterwards."""
+    if compression is None:
+        compression = _compression_of(path.replace(PARTIAL_SUFFIX, ""))
+    with open(path, "ab") as f:
+        f.write(encode_block(awards, compression))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def _open_text(path):
+    compression = _compression_of(path.replace(PARTIAL_SUFFIX, ""))
+    if compression == "gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if compression == "zst":
+        reader = _zstd().ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_jsonl(path):
+    """Yield the records of a (possibly compressed) JSON-lines file one at a time."""
+    with _open_text(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_jsonl(path, awards, block_size=500):
+    """Atomically replace `path` with the given awards, written in blocks. Returns the count."""
+    tmp_path = path + ".tmp"
+    compression = _compression_of(path)
+    count = 0
+    block = []
+    with open(tmp_path, "wb") as f:
+        for award in awards:
+            block.append(award)
+            if len(block) >= block_size:
+                f.write(encode_block(block, compression))
+                count += len(block)
+                block = []
+        if block:
+            f.write(encode_block(block, compression))
+            count += len(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+# --------------------- LEGACY MIGRATION --------------------- #
+def iter_legacy_file(path):
+    """Yield records from an old-style JSON array or CSV cache."""
+    if path.endswith(".csv"):
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def _manifest_cache(folder):
+    """The completed cache a folder's manifest owns, or None."""
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    path = os.path.join(folder, manifest.get("cache_file") or "")
+    if manifest.get("complete") and manifest.get("cache_file") and os.path.exists(path):
+        return path
+    return None
+
+
+def migrate_file(path):
+    """
+    Return a JSON-lines version of any cache file. A year's CSV export (or
+    legacy JSON) resolves to the cache its manifest owns, which is never
+    rewritten here; any other .json/.csv is converted to a sibling
+    .migrated.jsonl the first time (or when it is newer than its conversion).
+    """
+    if not path.endswith((".json", ".csv")):
+        return path
+    owned = _manifest_cache(os.path.dirname(path) or ".")
+    if owned is not None:
+        return owned
+    target = os.path.splitext(path)[0] + MIGRATED_SUFFIX
+    if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path):
+        write_jsonl(target, iter_legacy_file(path))
+    return target
+
+
+def iter_awards_file(path):
+    """Stream the awards in any cache file (JSON lines, legacy JSON or CSV)."""
+    return iter_jsonl(migrate_file(path))
+
+
+# --------------------- MANIFEST --------------------- #
+def load_manifest(year, partial=False):
+    """
+    Return the year's manifest dict, or None if there is none (or it is
+    unreadable). With partial, the checkpoint of an unfinished download.
+    """
+    try:
+        with open(manifest_path(year, partial), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(year, manifest, partial=False):
+    os.makedirs(year_folder(year), exist_ok=True)
+    _write_atomic(manifest_path(year, partial), json.dumps(manifest, indent=2))
+
+
+def download_pending(year):
+    """True if an unfinished download of the year left a checkpoint to resume."""
+    manifest = load_manifest(year, partial=True)
+    if manifest is None:
+        # Downloads from before partial manifests checkpointed into the main one
+        manifest = load_manifest(year)
+        if manifest is None or manifest.get("complete"):
+            return False
+    return os.path.exists(os.path.join(year_folder(year), manifest.get("cache_file", "") + PARTIAL_SUFFIX))
+
+
+def _migrate_year(year):
+    """Convert a legacy .json/.csv year cache to JSON lines and give it a manifest."""
+    for legacy in (legacy_json_path(year), csv_cache_path(year)):
+        if os.path.exists(legacy):
+            break
+    else:
+        return None
+    target = cache_path(year)
+    count = write_jsonl(target, iter_legacy_file(legacy))
+    started_at = datetime.fromtimestamp(os.path.getmtime(legacy)).isoformat(timespec="seconds")
+    save_manifest(year, {
+        "year": int(year),
+        "cache_file": os.path.basename(target),
+        "record_count": count,
+        "total_count": None,
+        "started_at": started_at,
+        "fetched_at": started_at,
+        "migrated_from": os.path.basename(legacy),
+        "complete": True,
+    })
+    return target
+
+
+def find_cache(year):
+    """
+    Path of the year's completed cache, or None.
+
+    A legacy cache is migrated on first use; caches written before manifests
+    existed are accepted as complete.
+    """
+    manifest = load_manifest(year)
+    if manifest is not None:
+        if not manifest.get("complete"):
+            return None
+        path = os.path.join(year_folder(year), manifest.get("cache_file", ""))
+        if manifest.get("cache_file") and os.path.exists(path):
+            return path
+    for compression in CACHE_SUFFIXES:
+        path = cache_path(year, compression)
+        if os.path.exists(path):
+            return path
+    if manifest is None or manifest.get("complete"):
+        return _migrate_year(year)
+    return None
+
+
+def is_complete(year):
+    """True if the year has a cache that can be trusted as a full download."""
+    return find_cache(year) is not None
+
+
+def completed_years():
+    """Years with a completed cache in the working directory, oldest first."""
+    years = []
+    for name in os.listdir("."):
+        prefix, _, year = name.partition("_")
+        if prefix == "awards" and year.isdigit() and os.path.isdir(name) and is_complete(int(year)):
+            years.append(int(year))
+    return sorted(years)
+
+
+def iter_awards(year):
+    """Stream the year's completed cache record by record."""
+    path = find_cache(year)
+    if path is None:
+        raise FileNotFoundError(f"No complete award cache for {year}")
+    return iter_jsonl(path)
+
+
+def load_awards(year):
+    return list(iter_awards(year))
+
+
+def save_awards(year, awards):
+    """Atomically rewrite the year's cache with `awards` (any iterable). Returns the count."""
+    os.makedirs(year_folder(year), exist_ok=True)
+    return write_jsonl(find_cache(year) or cache_path(year), awards)
+
+
+def merge_by_id(existing, updates):
+    """
+    Merge `updates` into `existing` by award id.
+
+    Changed awards are replaced in place, new awards are appended. Returns
+    (merged, added, changed).
+    """
+    merged = list(existing)
+    position = {award.get("id"): i for i, award in enumerate(merged)}
+    added = changed = 0
+    for award in updates:
+        i = position.get(award.get("id"))
+        if i is None:
+            position[award.get("id")] = len(merged)
+            merged.append(award)
+            added += 1
+        elif merged[i] != award:
+            merged[i] = award
+            changed += 1
+    return merged, added, changed
+
+
+# --------------------- CHECKPOINTS --------------------- #
+class Checkpoint:
+    """
+    Page-level checkpoint for one year's download.
+
+    Pages are appended to `{cache}.partial` and fsynced before the partial
+    manifest is advanced, so after a crash the checkpoint never points past
+    data that is actually on disk. Anything written after the last commit is
+    truncated away when the download resumes. A completed cache and its
+    manifest are left alone until finish() renames the partial file into
+    place and marks the year complete.
+    """
+
+    def __init__(self, year, rpp, print_fields, resume=True, compression=None):
+        self.year = year
+        os.makedirs(year_folder(year), exist_ok=True)
+
+        manifest = load_manifest(year, partial=True)
+        if manifest is None:
+            # Downloads from before partial manifests checkpointed into the main one
+            manifest = load_manifest(year)
+        resumable = (
+            resume
+            and manifest is not None
+            and not manifest.get("complete")
+            and manifest.get("printFields") == print_fields
+            and download_pending(year)
+        )
+        if resumable:
+            self.manifest = manifest
+            # Offsets count records, so a resumed download may use a different page size
+            self.manifest["rpp"] = rpp
+            self.path = os.path.join(year_folder(year), manifest["cache_file"])
+            with open(self.path + PARTIAL_SUFFIX, "r+b") as f:
+                f.truncate(manifest["committed_bytes"])
+        else:
+            self.path = cache_path(year, compression)
+            self.manifest = {
+                "year": int(year),
+                "cache_file": os.path.basename(self.path),
+                "rpp": rpp,
+                "printFields": print_fields,
+                "last_offset": None,
+                "next_offset": 1,
+                "record_count": 0,
+                "total_count": None,
+                "committed_bytes": 0,
+                "started_at": _now(),
+                "fetched_at": None,
+                "complete": False,
+            }
+            open(self.path + PARTIAL_SUFFIX, "wb").close()
+        save_manifest(year, self.manifest, partial=True)
+        self.resumed = resumable and self.manifest["record_count"] > 0
+
+    @property
+    def next_offset(self):
+        return self.manifest["next_offset"]
+
+    @property
+    def record_count(self):
+        return self.manifest["record_count"]
+
+    def commit_page(self, page, awards):
+        """Durably append `awards` (the records of `page`) and advance the manifest."""
+        committed_bytes = append_block(self.path + PARTIAL_SUFFIX, awards)
+        self.manifest.update(
+            last_offset=page.offset,
+            next_offset=page.offset + self.manifest["rpp"],
+            record_count=self.manifest["record_count"] + len(awards),
+            committed_bytes=committed_bytes,
+            fetched_at=_now(),
+        )
+        if page.total is not None:
+            self.manifest["total_count"] = page.total
+        save_manifest(self.year, self.manifest, partial=True)
+
+    def finish(self):
+        """Promote the finished download to the year's cache and mark it complete."""
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        self.manifest.update(complete=True, fetched_at=_now())
+        save_manifest(self.year, self.manifest)
+        try:
+            os.remove(manifest_path(self.year, partial=True))
+        except FileNotFoundError:
+            pass
+        return self.path
@@ -0,0 +1,560 @@
+"""
+Headless command line for downloading, analyzing and reporting on NSF awards.
+
+    python -m nsf_cli download --years 2010-2025
+    python -m nsf_cli analyze --years 2020-2024 --tiers 1,2 --format csv -o matches.csv
+    python -m nsf_cli report --years 2024 --words "climate justice" -o report.pdf
+    python -m nsf_cli rollup --years 2015-2024 --by awardeeName --top 20
+    python -m nsf_cli rank --years 2015-2024 --by funding --top 50
+    python -m nsf_cli duplicates --years 2015-2024 -o clusters.csv
+    python -m nsf_cli similar --id 2439594 --top 10
+
+Nothing here imports tkinter or customtkinter, so it runs on servers and in
+cron. Heavier modules (requests, pyarrow, fpdf, pandas) are imported only by the
+commands that need them.
+
+Exit codes:
+    0  success
+    1  unexpected error
+    2  invalid arguments
+    3  a download failed or stopped before completion
+    4  a requested year has no completed cache (use --download)
+    5  the analysis found no matching awards (with --fail-on-empty)
+"""
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import nsf_metrics
+from nsf_keywords import RED_FLAG_WORDS
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_DOWNLOAD_FAILED = 3
+EXIT_MISSING_DATA = 4
+EXIT_NO_MATCHES = 5
+
+CUSTOM_TIER = "Custom"
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+@contextmanager
+def _open_output(args, what="Results"):
+    """Yield args.output opened for writing (logging it once written), or stdout when none was given."""
+    if not args.output:
+        yield sys.stdout
+        return
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        yield f
+    log(f"{what} saved as {args.output}")
+
+
+# --------------------- ARGUMENT PARSING --------------------- #
+def parse_years(text):
+    """'2010-2025', '2020,2022' or a mix of both -> sorted list of years."""
+    years = set()
+    try:
+        for part in text.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                first, last = (int(p) for p in part.split("-", 1))
+                if first > last:
+                    first, last = last, first
+                years.update(range(first, last + 1))
+            else:
+                years.add(int(part))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid years: {text!r} (use e.g. 2010-2025 or 2020,2022)")
+    if not years:
+        raise argparse.ArgumentTypeError("no years given")
+    return sorted(years)
+
+
+def select_words(tiers, words):
+    """
+    Build the {tier: [words]} selection from tier numbers/names and custom words.
+
+    With neither given, every tier is selected.
+    """
+    tier_names = list(RED_FLAG_WORDS)
+    selected = {}
+    for tier in tiers or []:
+        if tier.isdigit() and 1 <= int(tier) <= len(tier_names):
+            name = tier_names[int(tier) - 1]
+        else:
+            matches = [name for name in tier_names if name.lower().startswith(tier.lower())]
+            if len(matches) != 1:
+                raise ValueError(f"unknown tier {tier!r}; use 1-{len(tier_names)} or one of: {', '.join(tier_names)}")
+            name = matches[0]
+        selected[name] = list(RED_FLAG_WORDS[name])
+    if words:
+        selected[CUSTOM_TIER] = words
+    if not selected:
+        selected = {tier: list(words) for tier, words in RED_FLAG_WORDS.items()}
+    return selected
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m nsf_cli",
+        description="Download, analyze and report on NSF awards without the GUI.")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    # Instrumentation options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--metrics", action="store_true",
+                        help="print stage timings, counters and peak memory to stderr when done")
+    common.add_argument("--profile", metavar="FILE",
+                        help="write the run's metrics and stage spans as JSON (opens in chrome://tracing)")
+
+    download = commands.add_parser("download", parents=[common], help="download (or resume) award caches for years")
+    download.add_argument("--years", type=parse_years, required=True, help="e.g. 2010-2025 or 2020,2022")
+    download.add_argument("--refresh", action="store_true",
+                          help="only pull awards dated since the last fetch of each completed year")
+    download.add_argument("--max-years", type=int, default=3, help="years downloaded at the same time")
+    download.add_argument("--max-in-flight", type=int, default=8, help="simultaneous API requests")
+    download.add_argument("--quiet", action="store_true", help="only print errors and a summary")
+    download.add_argument("--offline", action="store_true",
+                          help="replay cached API responses only; never contact the API")
+
+    for name, default_format, help_text in (
+            ("analyze", "json", "scan cached years for red flag keywords"),
+            ("report", "pdf", "analyze and write a report (PDF by default)")):
+        command = commands.add_parser(name, parents=[common], help=help_text)
+        command.add_argument("--years", type=parse_years, required=True, help="e.g. 2010-2025 or 2020,2022")
+        command.add_argument("--tiers", type=lambda s: [t.strip() for t in s.split(",") if t.strip()],
+                             help="tier numbers or names, e.g. 1,2 (default: all tiers)")
+        command.add_argument("--words", type=lambda s: [w.strip() for w in s.split(",") if w.strip()],
+                             help="extra comma-separated keywords, reported under the 'Custom' tier")
+        command.add_argument("--format", choices=["json", "csv", "pdf"], default=default_format)
+        command.add_argument("-o", "--output", help="output file (default: stdout for JSON/CSV, "
+                                                    "nsf_analysis_<timestamp>.pdf for PDF)")
+        command.add_argument("--abstracts", action="store_true", help="include abstracts in JSON/CSV output")
+        command.add_argument("--top", type=int, default=None, help="PDF: only the N highest-funded awards per tier")
+        command.add_argument("--overall-top", type=int, default=None,
+                             help="PDF: open with the N highest-funded awards across all tiers")
+        command.add_argument("--max-per-file", type=int, default=None,
+                             help="PDF: split the report into files of at most N awards")
+        command.add_argument("--abstract-chars", type=int, default=None,
+                             help="PDF: truncate abstracts to N characters")
+        command.add_argument("--download", action="store_true", help="download missing years first")
+        command.add_argument("--workers", type=int, default=None, help="analysis processes (default: all cores)")
+        command.add_argument("--keep-duplicates", action="store_true",
+                             help="count awards cached in several years once per year")
+        command.add_argument("--collapse-near-duplicates", action="store_true",
+                             help="count near-identical abstracts (e.g. collaborative awards) once")
+        command.add_argument("--strip-boilerplate", action="store_true",
+                             help="ignore keywords inside text shared by many abstracts")
+        command.add_argument("--fail-on-empty", action="store_true",
+                             help=f"exit with {EXIT_NO_MATCHES} when nothing matches")
+
+    rollup = commands.add_parser("rollup", parents=[common],
+                                    help="weighted red flag scores and funding per awardee, program or officer")
+    rollup.add_argument("--years", type=parse_years, required=True, help="e.g. 2010-2025 or 2020,2022")
+    rollup.add_argument("--tiers", type=lambda s: [t.strip() for t in s.split(",") if t.strip()],
+                        help="tier numbers or names, e.g. 1,2 (default: all tiers)")
+    rollup.add_argument("--words", type=lambda s: [w.strip() for w in s.split(",") if w.strip()],
+                        help="extra comma-separated keywords, reported under the 'Custom' tier")
+    rollup.add_argument("--by", choices=["awardeeName", "primaryProgram", "poName", "tier", "keyword"],
+                        default="awardeeName",
+                        help="group by awardee, program or program officer, or total funding per tier/keyword")
+    rollup.add_argument("--top", type=int, default=None, help="only the N groups with the most flagged funding")
+    rollup.add_argument("--format", choices=["json", "csv"], default="csv")
+    rollup.add_argument("-o", "--output", help="output file (default: stdout)")
+    rollup.add_argument("--download", action="store_true", help="download missing years first")
+    rollup.add_argument("--keep-duplicates", action="store_true",
+                        help="count awards cached in several years once per year")
+    rollup.add_argument("--fail-on-empty", action="store_true",
+                        help=f"exit with {EXIT_NO_MATCHES} when nothing matches")
+
+    rank = commands.add_parser("rank", parents=[common],
+                               help="rank awards by keyword density (word-salad score)")
+    rank.add_argument("--years", type=parse_years, required=True, help="e.g. 2010-2025 or 2020,2022")
+    rank.add_argument("--tiers", type=lambda s: [t.strip() for t in s.split(",") if t.strip()],
+                      help="tier numbers or names, e.g. 1,2 (default: all tiers)")
+    rank.add_argument("--words", type=lambda s: [w.strip() for w in s.split(",") if w.strip()],
+                      help="extra comma-separated keywords, reported under the 'Custom' tier")
+    rank.add_argument("--by", choices=["score", "funding", "density", "distinct"], default="score",
+                      help="tier-weighted hits per 100 words, that times funding, hits per 100 words, "
+                           "or distinct keywords")
+    rank.add_argument("--top", type=int, default=50, help="number of awards listed (default 50)")
+    rank.add_argument("--format", choices=["json", "csv"], default="csv")
+    rank.add_argument("-o", "--output", help="output file (default: stdout)")
+    rank.add_argument("--abstracts", action="store_true", help="include abstracts")
+    rank.add_argument("--tokens", action="store_true",
+                      help="score from the pre-tokenized abstracts (built on first use; much faster on reruns)")
+    rank.add_argument("--download", action="store_true", help="download missing years first")
+    rank.add_argument("--keep-duplicates", action="store_true",
+                      help="rank awards cached in several years once per year")
+    rank.add_argument("--fail-on-empty", action="store_true",
+                      help=f"exit with {EXIT_NO_MATCHES} when nothing matches")
+
+    duplicates = commands.add_parser("duplicates", parents=[common],
+                                     help="list clusters of near-identical abstracts across years")
+    duplicates.add_argument("--years", type=parse_years, required=True, help="e.g. 2010-2025 or 2020,2022")
+    duplicates.add_argument("--threshold", type=float, default=0.8,
+                            help="estimated share of shared 5-word runs, 0-1 (default 0.8)")
+    duplicates.add_argument("--strip-boilerplate", action="store_true",
+                            help="ignore text shared by many abstracts when comparing")
+    duplicates.add_argument("--format", choices=["json", "csv"], default="csv")
+    duplicates.add_argument("-o", "--output", help="output file (default: stdout)")
+    duplicates.add_argument("--download", action="store_true", help="download missing years first")
+
+    similar = commands.add_parser("similar", parents=[common],
+                                  help="list the awards whose abstracts are most like an award's, across years")
+    query = similar.add_mutually_exclusive_group(required=True)
+    query.add_argument("--id", help="award id (looked up in the searched years)")
+    query.add_argument("--text", help="any text, e.g. an abstract")
+    similar.add_argument("--years", type=parse_years, default=None,
+                         help="years searched, e.g. 2010-2025 (default: every downloaded year)")
+    similar.add_argument("--top", type=int, default=10, help="number of awards listed (default 10)")
+    similar.add_argument("--format", choices=["json", "csv"], default="csv")
+    similar.add_argument("-o", "--output", help="output file (default: stdout)")
+    similar.add_argument("--abstracts", action="store_true", help="include abstracts")
+    return parser
+
+
+# --------------------- COMMANDS --------------------- #
+def download_years(years, refresh=False, max_years=3, max_in_flight=8, quiet=False, offline=False):
+    """Download years on the background scheduler, printing its events. Returns the failed years."""
+    from nsf_download import DownloadScheduler
+
+    fetcher = None
+    if offline:
+        from nsf_fetch import NSFFetcher
+        from nsf_http_cache import PageCache
+
+        fetcher = NSFFetcher(concurrency=4, max_in_flight=max_in_flight, cache=PageCache(offline=True))
+    scheduler = DownloadScheduler(max_years=max_years, max_in_flight=max_in_flight, fetcher=fetcher)
+    failed = []
+    try:
+        for year in years:
+            scheduler.submit(year, refresh=refresh)
+        pending = set(years)
+        while pending:
+            kind, year, payload = scheduler.events.get()
+            if kind == "log":
+                if not quiet:
+                    log(f"[{year}] {payload.strip()}")
+                continue
+            pending.discard(year)
+            if kind == "done":
+                log(f"[{year}] complete: {payload} records")
+            else:
+                log(f"[{year}] {kind}: {payload}")
+                failed.append(year)
+    except KeyboardInterrupt:
+        log("Interrupted; completed pages are checkpointed and will resume next time.")
+        scheduler.shutdown(wait=True)
+        raise
+    scheduler.shutdown(wait=True)
+    return sorted(failed)
+
+
+def cmd_download(args):
+    failed = download_years(args.years, args.refresh, args.max_years, args.max_in_flight, args.quiet,
+                            args.offline)
+    if failed:
+        log(f"Download failed or incomplete for: {', '.join(map(str, failed))}")
+        return EXIT_DOWNLOAD_FAILED
+    return EXIT_OK
+
+
+def ensure_years(years, download=False):
+    """Make sure every year has a completed cache. Returns an exit code, or None when all are ready."""
+    import nsf_cache
+
+    missing = [year for year in years if not nsf_cache.is_complete(year)]
+    if missing and download:
+        failed = download_years(missing, quiet=True)
+        if failed:
+            log(f"Download failed or incomplete for: {', '.join(map(str, failed))}")
+            return EXIT_DOWNLOAD_FAILED
+    elif missing:
+        log(f"No completed cache for: {', '.join(map(str, missing))} (run 'download' or pass --download)")
+        return EXIT_MISSING_DATA
+    return None
+
+
+def cmd_analyze(args):
+    try:
+        selected_words = select_words(args.tiers, args.words)
+    except ValueError as e:
+        log(f"error: {e}")
+        return EXIT_USAGE
+
+    status = ensure_years(args.years, args.download)
+    if status is not None:
+        return status
+
+    from nsf_analysis import analyze_years
+
+    started = datetime.now()
+    boilerplate = clusters = None
+    if args.strip_boilerplate or args.collapse_near_duplicates:
+        import nsf_dedup
+
+        if args.strip_boilerplate:
+            boilerplate = nsf_dedup.boilerplate_shingles(args.years)
+            log(f"Ignoring {len(boilerplate)} boilerplate phrases.")
+        if args.collapse_near_duplicates:
+            clusters = nsf_dedup.near_duplicates(args.years, boilerplate=boilerplate,
+                                                 dedupe=not args.keep_duplicates)
+            log(f"Collapsing {sum(len(c) - 1 for c in clusters)} near-duplicate abstracts "
+                f"in {len(clusters)} clusters.")
+    analysis = analyze_years(args.years, selected_words, workers=args.workers, dedupe=not args.keep_duplicates,
+                             boilerplate=boilerplate, near_duplicates=clusters)
+    matches = sum(len(awards) for awards in analysis.results.values())
+    log(f"Scanned {analysis.scanned} candidate awards in {(datetime.now() - started).total_seconds():.1f}s; "
+        f"{matches} tier matches.")
+
+    write_output(args, analysis.results, selected_words)
+    if args.fail_on_empty and matches == 0:
+        return EXIT_NO_MATCHES
+    return EXIT_OK
+
+
+def cmd_rollup(args):
+    try:
+        selected_words = select_words(args.tiers, args.words)
+    except ValueError as e:
+        log(f"error: {e}")
+        return EXIT_USAGE
+
+    status = ensure_years(args.years, args.download)
+    if status is not None:
+        return status
+
+    import nsf_scoring
+
+    started = datetime.now()
+    scores = nsf_scoring.score_years(args.years, selected_words, dedupe=not args.keep_duplicates)
+    flagged = int((scores.frame["keywords"] > 0).sum())
+    log(f"Scored {len(scores.frame)} awards in {(datetime.now() - started).total_seconds():.1f}s; "
+        f"{flagged} flagged.")
+
+    if args.by in ("tier", "keyword"):
+        totals = scores.tier_totals if args.by == "tier" else scores.keyword_totals
+        table = totals.sort_values(ascending=False).to_frame()
+        if args.top:
+            table = table.head(args.top)
+    else:
+        table = nsf_scoring.rollup(scores, args.by, args.top)
+
+    if args.format == "json":
+        text = table.reset_index().to_json(orient="records", indent=2, force_ascii=False) + "\n"
+    else:
+        text = table.to_csv()
+    with _open_output(args, "Rollup") as f:
+        f.write(text)
+    if args.fail_on_empty and flagged == 0:
+        return EXIT_NO_MATCHES
+    return EXIT_OK
+
+
+def cmd_rank(args):
+    try:
+        selected_words = select_words(args.tiers, args.words)
+    except ValueError as e:
+        log(f"error: {e}")
+        return EXIT_USAGE
+    if args.top < 1:
+        log("error: --top must be at least 1")
+        return EXIT_USAGE
+
+    status = ensure_years(args.years, args.download)
+    if status is not None:
+        return status
+
+    import csv
+    import json
+
+    import nsf_density
+
+    started = datetime.now()
+    ranker = nsf_density.rank_years(args.years, selected_words, top=args.top, by=args.by,
+                                    dedupe=not args.keep_duplicates, use_tokens=args.tokens)
+    log(f"Scored {ranker.flagged} flagged of {ranker.scanned} candidate awards in "
+        f"{(datetime.now() - started).total_seconds():.1f}s.")
+
+    columns = ["rank", "year", "id", "title", "awardee", "amount", "tier", "score", "density", "distinct",
+               "hits", "tokens", "matched_words"] + (["abstract"] if args.abstracts else [])
+    rows = []
+    for rank, result in enumerate(ranker.results(), 1):
+        row = dict(result, rank=rank, score=round(result["score"], 3), density=round(result["density"], 3))
+        rows.append({column: row.get(column) for column in columns})
+
+    with _open_output(args, "Ranking") as f:
+        if args.format == "json":
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(row, matched_words="; ".join(row["matched_words"])))
+    if args.fail_on_empty and not rows:
+        return EXIT_NO_MATCHES
+    return EXIT_OK
+
+
+def cmd_duplicates(args):
+    if not 0 < args.threshold <= 1:
+        log("error: --threshold must be between 0 and 1")
+        return EXIT_USAGE
+
+    status = ensure_years(args.years, args.download)
+    if status is not None:
+        return status
+
+    import csv
+    import json
+
+    import nsf_dedup
+    import nsf_store
+
+    started = datetime.now()
+    boilerplate = nsf_dedup.boilerplate_shingles(args.years) if args.strip_boilerplate else None
+    clusters = nsf_dedup.near_duplicates(args.years, args.threshold, boilerplate=boilerplate)
+    log(f"Found {len(clusters)} clusters of near-identical abstracts "
+        f"({sum(len(c) for c in clusters)} awards) in {(datetime.now() - started).total_seconds():.1f}s.")
+
+    # One read per year for all of its cluster members
+    wanted = {}
+    for members in clusters:
+        for year, row in members:
+            wanted.setdefault(year, set()).add(row)
+    awards = {}
+    for year, year_rows in wanted.items():
+        year_rows = sorted(year_rows)
+        records = nsf_store.take_records(year, year_rows, ["id", "title", "awardeeName", "fundsObligatedAmt"])
+        awards.update(((year, row), award) for row, award in zip(year_rows, records))
+
+    columns = ["cluster", "year", "id", "title", "awardee", "amount"]
+    rows = []
+    for number, members in enumerate(clusters, 1):
+        for year, row in members:
+            award = awards[(year, row)]
+            rows.append({"cluster": number, "year": year, "id": award.get("id"), "title": award.get("title"),
+                         "awardee": award.get("awardeeName"), "amount": award.get("fundsObligatedAmt")})
+
+    with _open_output(args, "Clusters") as f:
+        if args.format == "json":
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    return EXIT_OK
+
+
+def cmd_similar(args):
+    if args.top < 1:
+        log("error: --top must be at least 1")
+        return EXIT_USAGE
+
+    import csv
+    import json
+
+    import nsf_cache
+    import nsf_similar
+
+    years = args.years if args.years is not None else nsf_cache.completed_years()
+    if not years:
+        log("No downloaded years to search (run 'download' first)")
+        return EXIT_MISSING_DATA
+    status = ensure_years(years)
+    if status is not None:
+        return status
+
+    text = args.text
+    if args.id is not None:
+        import nsf_merge
+        import nsf_store
+
+        positions = nsf_merge.open_merge(years).positions(args.id)
+        if not positions:
+            log(f"Award {args.id} is not in the searched years")
+            return EXIT_MISSING_DATA
+        year, row = positions[-1]
+        text = nsf_store.take_records(year, [row], ["abstractText"])[0].get("abstractText") or ""
+
+    started = datetime.now()
+    awards = nsf_similar.similar_awards(text, args.top, exclude_id=args.id, years=years)
+    log(f"Searched {len(years)} year{'s' if len(years) != 1 else ''} in "
+        f"{(datetime.now() - started).total_seconds():.2f}s.")
+
+    columns = ["rank", "similarity", "year", "id", "title", "awardee", "amount"] + (
+        ["abstract"] if args.abstracts else [])
+    rows = [{"rank": rank, "similarity": round(award["similarity"], 4), "year": award["year"],
+             "id": award.get("id"), "title": award.get("title"), "awardee": award.get("awardeeName"),
+             "amount": award.get("fundsObligatedAmt"), "abstract": award.get("abstractText")}
+            for rank, award in enumerate(awards, 1)]
+    rows = [{column: row[column] for column in columns} for row in rows]
+
+    with _open_output(args, "Similar awards") as f:
+        if args.format == "json":
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    return EXIT_OK
+
+
+def write_output(args, results, selected_words):
+    import nsf_report
+
+    if args.format == "pdf":
+        path = args.output or f"nsf_analysis_{datetime.now():%Y%m%d_%H%M%S}.pdf"
+        years = f"{args.years[0]}" if len(args.years) == 1 else f"{args.years[0]}-{args.years[-1]}"
+        paths = nsf_report.write_pdf(results, path, title=f"NSF Awards Analysis Report ({years})",
+                                     top_n=args.top, overall_top=args.overall_top,
+                                     max_awards_per_file=args.max_per_file, abstract_chars=args.abstract_chars)
+        log(f"Report saved as {', '.join(paths)}")
+        return
+
+    with _open_output(args) as f:
+        if args.format == "json":
+            nsf_report.write_json(results, f, years=args.years, keywords=selected_words, abstracts=args.abstracts)
+        else:
+            nsf_report.write_csv(results, f, abstracts=args.abstracts)
+
+
+COMMANDS = {"download": cmd_download, "analyze": cmd_analyze, "report": cmd_analyze, "rollup": cmd_rollup,
+            "rank": cmd_rank, "duplicates": cmd_duplicates,
+            "similar": cmd_similar}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with nsf_metrics.collect() as metrics:
+        try:
+            status = COMMANDS[args.command](args)
+        except KeyboardInterrupt:
+            status = EXIT_ERROR
+        except Exception as e:
+            log(f"error: {e}")
+            if os.environ.get("NSF_CLI_DEBUG"):
+                raise
+            status = EXIT_ERROR
+    if args.metrics:
+        log(metrics.format_summary())
+    if args.profile:
+        log(f"Profile saved as {nsf_metrics.export_profile(metrics, args.profile)}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
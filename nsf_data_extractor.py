@@ -1,156 +1,48 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
-import requests
-import os
-import csv
-import json
+import queue
+from contextlib import ExitStack
 from datetime import datetime
 
-API_BASE_URL = "http://api.nsf.gov/services/v1/awards.json"
+import nsf_metrics
+from nsf_download import DownloadScheduler
 
-def fetch_awards_for_year(year, status_text):
-    """
-    Fetch all award data for a given year using the NSF API,
-    paginate through results, and save CSV and JSON.
-    """
-    # --- Debugging & Progress ---
-    status_text.insert(tk.END, f"\n[INFO] Starting data fetch for year {year}\n")
-    status_text.see(tk.END)
-    
-    # Build folder name
-    folder_name = f"awards_{year}"
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
-        status_text.insert(tk.END, f"[DEBUG] Created folder: {folder_name}\n")
-    else:
-        status_text.insert(tk.END, f"[DEBUG] Folder already exists: {folder_name}\n")
-    status_text.see(tk.END)
-    
-    # Output file paths
-    csv_file_path = os.path.join(folder_name, f"{year}_awards.csv")
-    json_file_path = os.path.join(folder_name, f"{year}_awards.json")
-    
-    # Prepare CSV
-    # Include the fields you requested plus our original fields
-    csv_headers = [
-        "id", "agency", "awardeeName", "title", "abstractText",
-        "fundsObligatedAmt",       # (1)
-        "estimatedTotalAmt",       # (2)
-        "pdPIName",                # (5)
-        "coPDPI",                  # (6)
-        "poName",                  # (7)
-        "startDate",               # (9)
-        "expDate",                 # (10)
-        "primaryProgram"           # (11)
-    ]
-    csv_file = open(csv_file_path, mode="w", newline="", encoding="utf-8")
-    csv_writer = csv.DictWriter(csv_file, fieldnames=csv_headers)
-    csv_writer.writeheader()
-    
-    # Prepare JSON aggregator
-    all_awards_json = []
-    
-    # Date range for that year
-    date_start = f"01/01/{year}"
-    date_end = f"12/31/{year}"
-    
-    # NSF only returns 25 items per page, so we must loop
-    offset = 1
-    rpp = 25
-    
-    total_records_fetched = 0
-    
-    while True:
-        # Prepare query params, including the new fields in printFields
-        params = {
-            "dateStart": date_start,      # Award Date Start
-            "dateEnd": date_end,          # Award Date End
-            "rpp": rpp,
-            "offset": offset,
-            "printFields": (
-                "id,agency,awardeeName,title,abstractText,"
-                "fundsObligatedAmt,estimatedTotalAmt,pdPIName,"
-                "coPDPI,poName,startDate,expDate,primaryProgram"
-            )
-        }
-        
-        # --- Debugging & Progress ---
-        status_text.insert(tk.END, f"[DEBUG] Fetching records {offset} to {offset + rpp - 1}...\n")
-        status_text.see(tk.END)
-        
-        try:
-            response = requests.get(API_BASE_URL, params=params, timeout=30)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            status_text.insert(tk.END, f"[ERROR] Request failed for year {year}: {e}\n")
-            status_text.see(tk.END)
-            break
-        
-        data = response.json()
-        
-        # Check if 'response' and 'award' exist in the returned data
-        if ("response" in data) and ("award" in data["response"]):
-            awards = data["response"]["award"]
-            if not awards:
-                # No more awards to fetch, break out of loop
-                status_text.insert(tk.END, f"[INFO] No more awards found for offset={offset}. Stopping.\n")
-                status_text.see(tk.END)
-                break
-            
-            # Write awards to CSV and also aggregate to JSON
-            for award in awards:
-                row_data = {
-                    "id": award.get("id", ""),
-                    "agency": award.get("agency", ""),
-                    "awardeeName": award.get("awardeeName", ""),
-                    "title": award.get("title", ""),
-                    "abstractText": award.get("abstractText", ""),
-                    "fundsObligatedAmt": award.get("fundsObligatedAmt", ""),
-                    "estimatedTotalAmt": award.get("estimatedTotalAmt", ""),
-                    "pdPIName": award.get("pdPIName", ""),
-                    "coPDPI": award.get("coPDPI", ""),
-                    "poName": award.get("poName", ""),
-                    "startDate": award.get("startDate", ""),
-                    "expDate": award.get("expDate", ""),
-                    "primaryProgram": award.get("primaryProgram", "")
-                }
-                csv_writer.writerow(row_data)
-                all_awards_json.append(row_data)
-            
-            fetched_count = len(awards)
-            total_records_fetched += fetched_count
-            
-            # --- Debugging & Progress ---
-            status_text.insert(tk.END, f"[INFO] Fetched {fetched_count} records in this batch. (Total so far: {total_records_fetched})\n")
-            status_text.see(tk.END)
-            
-            # Increment offset
-            offset += rpp
-        else:
-            # Possibly an error or no 'award' key found
-            status_text.insert(tk.END, "[WARN] No award data found in response. Possibly done or invalid params.\n")
-            status_text.see(tk.END)
-            break
-    
-    # Close CSV file
-    csv_file.close()
-    
-    # Write JSON file
-    with open(json_file_path, "w", encoding="utf-8") as jf:
-        json.dump(all_awards_json, jf, indent=2)
-    
-    # Check for empty files
-    if total_records_fetched == 0:
-        status_text.insert(tk.END, f"[WARN] No records downloaded for year {year}. CSV and JSON might be empty.\n")
-    else:
-        status_text.insert(tk.END, f"[INFO] Finished fetching {total_records_fetched} records for year {year}.\n")
-        status_text.insert(tk.END, f"[INFO] Data saved to:\n     {csv_file_path}\n     {json_file_path}\n")
-    status_text.see(tk.END)
+# How often (ms) the GUI drains the scheduler's event queue
+POLL_INTERVAL_MS = 100
+
+# Metrics of the downloads running now, collected from the first Download
+# click until every queued year is processed, and what keeps them active
+run_metrics = None
+metrics_session = None
+
+def start_metrics():
+    """Start collecting metrics for the scheduler's threads, unless a collection is running."""
+    global run_metrics, metrics_session
+    if run_metrics is None:
+        metrics_session = ExitStack()
+        run_metrics = metrics_session.enter_context(nsf_metrics.collect())
 
-def on_download_click(year_vars, status_text):
+def log_metrics(status_text):
+    """Stop collecting and append the run's stage timings and counters to the log pane (and export them if NSF_PROFILE is set)."""
+    global run_metrics, metrics_session
+    if run_metrics is None:
+        return
+    metrics_session.close()
+    metrics, run_metrics, metrics_session = run_metrics, None, None
+    status_text.insert(tk.END, "\n" + metrics.format_summary() + "\n")
+    try:
+        path = nsf_metrics.export_profile(metrics)
+    except OSError as e:
+        path = None
+        status_text.insert(tk.END, f"Could not write the profile: {e}\n")
+    if path:
+        status_text.insert(tk.END, f"Profile saved as {path}\n")
+
+def on_download_click(year_vars, scheduler, status_text, refresh=False):
     """
-    Callback for the "Download" button. Gathers selected years,
-    and calls fetch_awards_for_year() for each selected year.
+    Callback for the "Download" button. Gathers selected years
+    and queues each one on the background download scheduler.
+    With refresh, completed years only pull awards added since their last fetch.
     """
     selected_years = []
     for y_var in year_vars:
@@ -164,12 +56,55 @@ def on_download_click(year_vars, status_text):
     status_text.insert(tk.END, "[INFO] Starting download process...\n")
     status_text.see(tk.END)
     
+    start_metrics()
     for year in selected_years:
-        fetch_awards_for_year(year, status_text)
-    
-    status_text.insert(tk.END, "\n[INFO] All selected years processed.\n")
+        if not scheduler.submit(year, refresh=refresh):
+            status_text.insert(tk.END, f"[WARN] Year {year} is already downloading.\n")
     status_text.see(tk.END)
 
+def on_cancel_click(scheduler, year_list):
+    """Cancel the years selected in the active-downloads list; the others keep going."""
+    for index in year_list.curselection():
+        scheduler.cancel(int(year_list.get(index)))
+
+def poll_scheduler(root, scheduler, status_text, year_list):
+    """
+    Drain progress events from the worker threads into the log pane.
+    Runs on the Tk thread via root.after so widgets are only touched here.
+    """
+    # Taken before draining, so a year that finishes meanwhile has every event queued
+    active = [str(y) for y in scheduler.active_years()]
+    had_events = False
+    while True:
+        try:
+            kind, year, payload = scheduler.events.get_nowait()
+        except queue.Empty:
+            break
+        had_events = True
+        if kind == "log":
+            status_text.insert(tk.END, payload + "\n")
+        elif kind == "cancelled":
+            status_text.insert(tk.END, f"[WARN] Year {year} cancelled.\n")
+        elif kind == "error":
+            status_text.insert(tk.END, f"[ERROR] Year {year} failed: {payload}\n")
+    
+    previous = list(year_list.get(0, tk.END))
+    if previous != active:
+        year_list.delete(0, tk.END)
+        for y in active:
+            year_list.insert(tk.END, y)
+        if previous and not active:
+            status_text.insert(tk.END, "\n[INFO] All selected years processed.\n")
+            had_events = True
+    if not active and run_metrics is not None:
+        # Also covers years that finished between two polls
+        log_metrics(status_text)
+        had_events = True
+    if had_events:
+        status_text.see(tk.END)
+    
+    root.after(POLL_INTERVAL_MS, poll_scheduler, root, scheduler, status_text, year_list)
+
 def create_gui():
     """
     Create a Tkinter GUI that allows the user to select multiple years
@@ -177,6 +112,7 @@ def create_gui():
     """
     root = tk.Tk()
     root.title("NSF Awards Downloader")
+    scheduler = DownloadScheduler()
     
     # Frame to hold checkboxes
     frame_checkboxes = tk.Frame(root)
@@ -206,13 +142,33 @@ def create_gui():
     frame_buttons = tk.Frame(root)
     frame_buttons.pack(padx=10, pady=5, fill=tk.X)
     
-    btn_download = tk.Button(frame_buttons, text="Download", command=lambda: on_download_click(year_vars, text_log))
+    refresh_var = tk.IntVar()
+    btn_download = tk.Button(frame_buttons, text="Download",
+                             command=lambda: on_download_click(year_vars, scheduler, text_log, refresh_var.get() == 1))
     btn_download.pack(side=tk.LEFT, padx=5)
     
+    chk_refresh = tk.Checkbutton(frame_buttons, text="Refresh only (new/changed awards)", variable=refresh_var)
+    chk_refresh.pack(side=tk.LEFT, padx=5)
+    
+    btn_cancel = tk.Button(frame_buttons, text="Cancel Selected", command=lambda: on_cancel_click(scheduler, year_list))
+    btn_cancel.pack(side=tk.RIGHT, padx=5)
+    
+    # Years currently queued or downloading; select one and cancel it
+    year_list = tk.Listbox(frame_buttons, height=3, selectmode=tk.EXTENDED, exportselection=False)
+    year_list.pack(side=tk.RIGHT, padx=5)
+    tk.Label(frame_buttons, text="Active downloads:").pack(side=tk.RIGHT)
+    
     # Scrolled Text for status / debugging logs
     text_log = scrolledtext.ScrolledText(root, width=100, height=20)
     text_log.pack(padx=10, pady=5)
     
+    def on_close():
+        scheduler.shutdown(wait=False)
+        root.destroy()
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    
+    poll_scheduler(root, scheduler, text_log, year_list)
+    
     # Start Tk main loop
     root.mainloop()
 
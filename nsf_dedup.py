@@ -0,0 +1,344 @@
+"""
+Near-duplicate and boilerplate abstract detection with MinHash and LSH.
+
+Collaborative awards reuse one abstract under several ids, and many
+abstracts share boilerplate such as NSF's statutory-mission sentence. Both
+inflate hit counts and funding totals. Built on the token arrays of
+nsf_tokens:
+
+    shingles       every run of SHINGLE_SIZE tokens, hashed to 64 bits
+    signatures     NUM_PERM MinHash values per abstract, cached per year in
+                   {year}_awards.minhash.npy
+    clusters       abstracts whose signatures share a band (LSH) and agree on
+                   at least `threshold` of their values (estimated Jaccard
+                   similarity of their shingles), joined transitively
+    boilerplate    shingles occurring more often than BOILERPLATE_MIN_SHARE
+                   of the number of awards (and BOILERPLATE_MIN_AWARDS times)
+
+Abstracts are only compared when they land in a shared LSH bucket, so
+finding clusters takes near-linear time instead of comparing every pair.
+
+Shingles hash the token strings (crc32 of each token), not vocabulary ids,
+so strip_boilerplate() can remove boilerplate from any text without the
+vocabulary. BoilerplateStripper wraps a KeywordMatcher to do that before
+matching (see analyze_years(boilerplate=...)).
+"""
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+import nsf_metrics
+import nsf_tokens
+
+DEDUP_VERSION = 1
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16  # NUM_PERM / BANDS values per band
+THRESHOLD = 0.8
+SEED = 1
+
+BOILERPLATE_MIN_SHARE = 0.01
+BOILERPLATE_MIN_AWARDS = 20
+
+_EMPTY = np.iinfo(np.uint32).max  # signature of an abstract too short to shingle
+_MULT = np.uint64(0x100000001B3)
+_term_hashes = {}
+_hash_cache = {}
+_SPLIT_RE = re.compile(f"({nsf_tokens.TOKEN_RE.pattern})")  # token -> crc32, for stripping texts
+
+
+def _mix(x):
+    """splitmix64 finalizer over a uint64 array, spreading the rolling hashes."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _shingle_hashes(values, k=SHINGLE_SIZE):
+    """Hash of every k-long window of per-token hashes (uint64)."""
+    n = len(values) - k + 1
+    if n <= 0:
+        return np.zeros(0, np.uint64)
+    h = np.zeros(n, np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            h = h * _MULT + values[j:j + n]
+        return _mix(h)
+
+
+def _token_hash(token):
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def term_hashes(vocab):
+    """crc32 of every vocabulary term as uint64, indexed by token id."""
+    cached = _term_hashes.get(id(vocab))
+    if cached is None or len(cached) < len(vocab):
+        cached = np.fromiter((_token_hash(term) for term in vocab.ids), np.uint64, count=len(vocab))
+        _term_hashes[id(vocab)] = cached
+    return cached
+
+
+def shingles(arrays, k=SHINGLE_SIZE):
+    """(hashes, rows) of every shingle of a year's token arrays, in token order; none cross abstracts."""
+    hashes = _shingle_hashes(term_hashes(arrays.vocab)[arrays.tokens], k)
+    starts = np.arange(len(hashes))
+    rows = arrays.rows_of(starts)
+    keep = starts + k <= arrays.offsets[rows + 1]
+    return hashes[keep], rows[keep]
+
+
+# --------------------- MINHASH --------------------- #
+def minhash(hashes, rows, n_rows, num_perm=NUM_PERM, seed=SEED):
+    """(n_rows, num_perm) uint32 MinHash signatures; `rows` must be sorted. Rows without shingles are all _EMPTY."""
+    signatures = np.full((n_rows, num_perm), _EMPTY, np.uint32)
+    if not len(hashes):
+        return signatures
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True)
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    present = rows[starts]
+    with np.errstate(over="ignore"):
+        for p in range(num_perm):
+            # Multiply-shift hashing: the high 32 bits of a*x + b
+            values = ((a[p] * hashes + b[p]) >> np.uint64(32)).astype(np.uint32)
+            signatures[present, p] = np.minimum.reduceat(values, starts)
+    return signatures
+
+
+def _signature_paths(store):
+    base = store[:-len(".arrow")] if store.endswith(".arrow") else os.path.splitext(store)[0]
+    return base + ".minhash.npy", base + ".minhash.json"
+
+
+def signatures(year, boilerplate=None):
+    """
+    MinHash signatures of a year's abstracts. Without boilerplate they are
+    cached next to the store; with it, boilerplate shingles are left out and
+    nothing is cached.
+    """
+    import nsf_store
+
+    store = nsf_store.ensure_store(year)
+    arrays = nsf_tokens.tokens_for_store(store)
+    if boilerplate is not None:
+        hashes, rows = shingles(arrays)
+        keep = ~_is_boilerplate(hashes, boilerplate) if len(boilerplate) else slice(None)
+        return minhash(hashes[keep], rows[keep], arrays.size)
+
+    path, metadata_path = _signature_paths(store)
+    metadata = {"tokens": {k: v for k, v in arrays.metadata.items() if k != "vocab_size"},
+                "shingle_size": SHINGLE_SIZE, "num_perm": NUM_PERM, "seed": SEED, "dedup_version": DEDUP_VERSION}
+    try:
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            if json.load(f) == metadata:
+                return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    with nsf_metrics.stage("dedup.minhash"):
+        signature = minhash(*shingles(arrays), arrays.size)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, signature)
+    os.replace(path + ".tmp", path)
+    with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=1)
+    os.replace(metadata_path + ".tmp", metadata_path)
+    return signature
+
+
+# --------------------- LSH CLUSTERS --------------------- #
+def _band_keys(band):
+    """One uint64 key per row of a (rows, values) band."""
+    keys = np.zeros(len(band), np.uint64)
+    with np.errstate(over="ignore"):
+        for column in band.T:
+            keys = keys * _MULT + column.astype(np.uint64)
+        return _mix(keys)
+
+
+def cluster_signatures(signature, threshold=THRESHOLD, bands=BANDS):
+    """
+    Near-duplicate clusters of a (rows, num_perm) signature matrix, as a
+    list of sorted row arrays (only clusters of two or more).
+    """
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    n, num_perm = signature.shape
+    per_band = num_perm // bands
+    candidates = np.flatnonzero(signature[:, 0] != _EMPTY) if n else np.zeros(0, np.int64)
+    firsts, others = [], []
+    for band in range(bands):
+        keys = _band_keys(signature[candidates, band * per_band:(band + 1) * per_band])
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        boundary = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        if boundary.all():
+            continue
+        # Every bucket member is compared with the bucket's first member only
+        first = np.maximum.accumulate(np.where(boundary, np.arange(len(order)), 0))
+        a = candidates[order[first[~boundary]]]
+        b = candidates[order[~boundary]]
+        agreement = (signature[a] == signature[b]).mean(axis=1)
+        keep = agreement >= threshold
+        firsts.append(a[keep])
+        others.append(b[keep])
+    if not firsts or not sum(len(a) for a in firsts):
+        return []
+    a, b = np.concatenate(firsts), np.concatenate(others)
+    graph = sparse.coo_matrix((np.ones(len(a), np.int8), (a, b)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    order = np.argsort(labels, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(labels[order])) + 1)
+    return [group for group in groups if len(group) > 1]
+
+
+def near_duplicates(years, threshold=THRESHOLD, bands=BANDS, boilerplate=None, dedupe=True):
+    """
+    Near-duplicate clusters across the given years, largest first, each a
+    list of (year, row) in year and row order.
+
+    With dedupe, the copies nsf_merge drops (an award id cached more than
+    once) are left out first, so clusters hold distinct awards and only
+    ever the copy the analyzers keep.
+    """
+    years = [int(year) for year in years]
+    blocks = [signatures(year, boilerplate) for year in years]
+    if dedupe:
+        import nsf_merge
+
+        excluded = nsf_merge.open_merge(years).excluded_rows(years)
+        for i, year in enumerate(years):
+            if excluded.get(year):
+                blocks[i] = np.array(blocks[i])
+                blocks[i][sorted(excluded[year])] = _EMPTY
+    sizes = np.array([len(block) for block in blocks], np.int64)
+    starts = np.r_[0, np.cumsum(sizes)]
+    with nsf_metrics.stage("dedup.lsh"):
+        matrix = np.concatenate(blocks) if blocks else np.zeros((0, NUM_PERM), np.uint32)
+        clusters = cluster_signatures(matrix, threshold, bands)
+    result = []
+    for cluster in clusters:
+        owners = np.searchsorted(starts, cluster, side="right") - 1
+        result.append([(years[i], int(row - starts[i])) for i, row in zip(owners, cluster)])
+    result.sort(key=lambda members: (-len(members), members[0]))
+    return result
+
+
+def duplicate_copies(clusters, excluded=None):
+    """
+    {year: set(rows)} of every cluster member but one: the first (earliest
+    year, first row) that is not already in `excluded` ({year: set(rows)},
+    e.g. nsf_merge's dropped copies), so every cluster keeps an award.
+    """
+    excluded = excluded or {}
+    copies = {}
+    for members in clusters:
+        kept = next((member for member in members if member[1] not in excluded.get(member[0], ())), members[0])
+        for year, row in members:
+            if (year, row) != kept:
+                copies.setdefault(year, set()).add(row)
+    return copies
+
+
+# --------------------- BOILERPLATE --------------------- #
+def boilerplate_shingles(years, min_share=BOILERPLATE_MIN_SHARE, min_awards=BOILERPLATE_MIN_AWARDS):
+    """
+    Sorted uint64 hashes of the shingles that appear in many awards across
+    the years. Per year, only shingles occurring at least twice are carried
+    over, which keeps memory bounded on large sweeps.
+    """
+    hashes, counts = [], []
+    total = 0
+    with nsf_metrics.stage("dedup.boilerplate"):
+        for year in years:
+            arrays = nsf_tokens.open_tokens(year)
+            total += arrays.size
+            # Occurrences rather than distinct awards: a 5-token run repeated
+            # inside one abstract barely moves a 1% threshold, and a plain sort
+            # is several times faster than grouping by (hash, row)
+            h = np.sort(shingles(arrays)[0])
+            bounds = np.flatnonzero(np.r_[True, h[1:] != h[:-1]])
+            unique, count = h[bounds], np.diff(np.r_[bounds, len(h)])
+            repeated = count > 1 if len(years) > 1 else slice(None)
+            hashes.append(unique[repeated])
+            counts.append(count[repeated])
+        if not hashes:
+            return np.zeros(0, np.uint64)
+        unique, inverse = np.unique(np.concatenate(hashes), return_inverse=True)
+        awards = np.bincount(inverse, weights=np.concatenate(counts))
+    needed = max(min_awards, int(np.ceil(min_share * total)))
+    return unique[awards >= needed]
+
+
+def _is_boilerplate(hashes, boilerplate):
+    """Which of `hashes` are in the sorted `boilerplate` array."""
+    i = np.minimum(np.searchsorted(boilerplate, hashes), len(boilerplate) - 1)
+    return boilerplate[i] == hashes
+
+
+def strip_boilerplate(text, boilerplate, k=SHINGLE_SIZE):
+    """
+    `text` without the token runs covered by boilerplate shingles (a sorted
+    array, as boilerplate_shingles returns); each removed run becomes a line
+    break, so no phrase forms across it.
+    """
+    if not text or not len(boilerplate):
+        return text
+    lowered = text.lower()
+    # [gap, token, gap, token, ..., gap]: the tokens and, from the lengths, their offsets
+    parts = _SPLIT_RE.split(lowered)
+    tokens = parts[1::2]
+    if len(tokens) < k:
+        return text
+    try:
+        values = np.fromiter(map(_hash_cache.__getitem__, tokens), np.uint64, count=len(tokens))
+    except KeyError:
+        values = np.fromiter((_hash_cache.setdefault(t, _token_hash(t)) for t in tokens), np.uint64,
+                             count=len(tokens))
+    starts = np.flatnonzero(_is_boilerplate(_shingle_hashes(values, k), boilerplate))
+    if not len(starts):
+        return text
+    covered = np.zeros(len(tokens) + 1, np.int32)
+    np.add.at(covered, starts, 1)
+    np.add.at(covered, starts + k, -1)
+    covered = np.r_[False, np.cumsum(covered[:-1]) > 0, False]
+    edges = np.flatnonzero(covered[1:] != covered[:-1])
+    # Offsets only carry over when lowercasing keeps the length
+    source = text if len(lowered) == len(text) else lowered
+    ends = np.cumsum(np.fromiter(map(len, parts), np.int64, count=len(parts)))
+    pieces = []
+    position = 0
+    for first, last in zip(edges[::2], edges[1::2] - 1):
+        pieces.append(source[position:int(ends[2 * first])])
+        pieces.append("\n")
+        position = int(ends[2 * last + 1])
+    pieces.append(source[position:])
+    return "".join(pieces)
+
+
+class BoilerplateStripper:
+    """A KeywordMatcher that ignores boilerplate: abstracts are stripped before matching."""
+
+    def __init__(self, matcher, boilerplate):
+        self.matcher = matcher
+        self.boilerplate = boilerplate
+
+    def __bool__(self):
+        return bool(self.matcher)
+
+    def finditer(self, text):
+        return self.matcher.finditer(strip_boilerplate(text, self.boilerplate))
+
+    def hits(self, text):
+        return list(self.finditer(text))
+
+    def matched_words(self, text):
+        return self.matcher.matched_words(strip_boilerplate(text, self.boilerplate))
@@ -0,0 +1,296 @@
+"""
+Streaming "word-salad density" scoring with a bounded top-K ranking.
+
+The analyzers answer "did this abstract mention a tier's keyword at all", so
+an abstract that says "framework" once ranks like one stuffed with twenty
+buzzwords. DensityRanker scores every abstract in one matcher pass plus one
+token count:
+
+    tokens     words (whitespace-separated) in the abstract
+    hits       keyword occurrences (a keyword listed in several tiers counts once)
+    distinct   different keywords used
+    density    hits per 100 tokens
+    score      tier-weighted hits per 100 tokens (Tier 1 weighs most, see
+               TIER_WEIGHTS); abstracts shorter than MIN_TOKENS are scored as
+               if they had MIN_TOKENS, so one hit in a two-line abstract does
+               not top the list
+
+and keeps only the best `top` awards in a heap, ranked by score, by score x
+funding, by density or by distinct keywords. Awards stream through one at a
+time, so ranking a decade of awards never holds more than `top` of them.
+
+    ranker = DensityRanker(RED_FLAG_WORDS, top=50, by="funding")
+    for award in awards:
+        ranker.add(award)
+    ranker.results()
+
+rank_years() streams the years' Arrow stores, reading only the awards the
+keyword index reports as candidates (no other award can score above zero).
+With use_tokens it instead scores whole years at once from their token
+arrays (see nsf_tokens), with NumPy, and reads only the winners' records.
+"""
+import heapq
+from collections import namedtuple
+from itertools import islice
+
+import nsf_metrics
+from nsf_award import Award
+from nsf_keywords import RED_FLAG_WORDS, TIER_WEIGHTS
+from nsf_matcher import KeywordMatcher, normalize_keyword
+
+# Ranking orders: what the heap keeps the largest of
+RANK_KEYS = ("score", "funding", "density", "distinct")
+
+DEFAULT_TOP = 100
+MIN_TOKENS = 50
+
+# Columns read from the award store for ranking
+RANK_COLUMNS = ["id", "title", "abstractText", "awardeeName", "fundsObligatedAmt"]
+
+BATCH_SIZE = 2000
+
+Density = namedtuple("Density", ["tokens", "hits", "distinct", "density", "score", "tier", "matched_words"])
+
+
+def _count_tokens(text):
+    # Whitespace-separated words; str.split runs in C, unlike a regex tokenizer
+    return len(text.split())
+
+
+class DensityRanker:
+    """Score awards as they stream by and keep the `top` best by `by` (one of RANK_KEYS)."""
+
+    def __init__(self, selected_words=None, top=DEFAULT_TOP, by="score", min_tokens=MIN_TOKENS):
+        if by not in RANK_KEYS:
+            raise ValueError(f"unknown ranking {by!r}; use one of: {', '.join(RANK_KEYS)}")
+        self.selected_words = selected_words if selected_words is not None else RED_FLAG_WORDS
+        self.matcher = KeywordMatcher(self.selected_words)
+        # Lower rank = more severe tier, for reporting an award's worst tier
+        self.tier_rank = {tier: i for i, tier in enumerate(self.selected_words)}
+        self.top = top
+        self.by = by
+        self.min_tokens = min_tokens
+        self.scanned = 0
+        self.flagged = 0
+        self._heap = []
+        self._seq = 0
+
+    def score(self, text):
+        """The Density of one abstract, or None when no keyword occurs in it."""
+        hits = 0
+        weighted = 0
+        last_span = None
+        last_weight = 0
+        tier = None
+        words = {}
+        for hit in self.matcher.finditer(text):
+            weight = TIER_WEIGHTS.get(hit.tier, 1)
+            span = (hit.start, hit.end)
+            if span == last_span:
+                # The same occurrence listed under another tier counts once, at its heaviest
+                if weight > last_weight:
+                    weighted += weight - last_weight
+                    last_weight = weight
+            else:
+                hits += 1
+                weighted += weight
+                last_span, last_weight = span, weight
+            words.setdefault(hit.keyword.lower(), hit.keyword)
+            if tier is None or self.tier_rank.get(hit.tier, 0) < self.tier_rank.get(tier, 0):
+                tier = hit.tier
+        if not hits:
+            return None
+        tokens = _count_tokens(text)
+        return Density(tokens, hits, len(words), 100.0 * hits / max(tokens, 1),
+                       100.0 * weighted / max(tokens, self.min_tokens), tier, list(words.values()))
+
+    def _key(self, density, amount):
+        if self.by == "score":
+            return density.score
+        if self.by == "funding":
+            return density.score * amount
+        if self.by == "density":
+            return density.density
+        return density.distinct, density.score
+
+    def add(self, award, year=None):
+        """Score one award (a record or Award). Returns its Density, or None without hits."""
+        self.scanned += 1
+        abstract = award.get("abstractText") or ""
+        density = self.score(abstract)
+        if density is None:
+            return None
+        self.flagged += 1
+        amount = Award.from_record(award).amount
+        self._offer(self._key(density, amount), award, year, amount, density)
+        return density
+
+    def _offer(self, key, award, year, amount, density):
+        # Ties keep the award seen first
+        entry = (key, -self._seq, award, year, amount, density)
+        self._seq += 1
+        if len(self._heap) < self.top:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def add_many(self, awards, year=None):
+        for award in awards:
+            self.add(award, year)
+        return self
+
+    def results(self):
+        """The kept awards, best first, as result dicts (the analyzers' fields plus the scores)."""
+        results = []
+        for _, _, award, year, amount, density in sorted(self._heap, key=lambda entry: entry[:2], reverse=True):
+            result = {
+                "id": award.get("id", ""),
+                "title": award.get("title", ""),
+                "awardee": award.get("awardeeName", ""),
+                "amount": amount,
+                "abstract": award.get("abstractText") or "",
+                "tier": density.tier,
+                "matched_words": density.matched_words,
+                "score": density.score,
+                "density": density.density,
+                "distinct": density.distinct,
+                "hits": density.hits,
+                "tokens": density.tokens,
+            }
+            if year is not None:
+                result["year"] = year
+            results.append(result)
+        return results
+
+
+def rank_records(awards, selected_words=None, top=DEFAULT_TOP, by="score"):
+    """Rank an iterable of award records. Returns the DensityRanker (see .results())."""
+    with nsf_metrics.stage("density.scan"):
+        ranker = DensityRanker(selected_words, top, by).add_many(awards)
+    nsf_metrics.count("awards_scanned", ranker.scanned)
+    return ranker
+
+
+def rank_years(years, selected_words=None, top=DEFAULT_TOP, by="score", use_index=True, dedupe=True,
+               batch_size=BATCH_SIZE, use_tokens=False):
+    """
+    Rank the awards of several completed years from their stores, a batch at
+    a time. With dedupe, an award cached in more than one of the years is
+    scored once (see nsf_merge). Returns the DensityRanker.
+    """
+    import nsf_index
+    import nsf_store
+
+    ranker = DensityRanker(selected_words, top, by)
+    keywords = [word for words in ranker.selected_words.values() for word in words]
+    excluded = {}
+    if dedupe:
+        import nsf_merge
+
+        excluded = nsf_merge.open_merge(years).excluded_rows(years)
+    if use_tokens:
+        for year in years:
+            _rank_tokens(ranker, year, excluded.get(int(year)))
+        nsf_metrics.count("awards_scanned", ranker.scanned)
+        return ranker
+    for year in years:
+        path = nsf_store.ensure_store(year)
+        table = nsf_store.read_table(path, RANK_COLUMNS)
+        with nsf_metrics.stage("analysis.index"):
+            if use_index:
+                rows = nsf_index.open_index(year).candidates(keywords)
+            else:
+                rows = range(table.num_rows)
+        dropped = excluded.get(int(year))
+        rows = iter(rows if not dropped else [row for row in rows if row not in dropped])
+        with nsf_metrics.stage("density.scan"):
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                ranker.add_many(nsf_store.take_rows(table, batch), int(year))
+    nsf_metrics.count("awards_scanned", ranker.scanned)
+    return ranker
+
+
+# --------------------- TOKEN ARRAYS --------------------- #
+def _keyword_targets(ranker):
+    """normalized keyword -> [spelling, heaviest weight, most severe tier], like the matcher's hits."""
+    targets = {}
+    for tier, words in ranker.selected_words.items():
+        for word in words:
+            key = normalize_keyword(word)
+            if not key:
+                continue
+            weight = TIER_WEIGHTS.get(tier, 1)
+            target = targets.setdefault(key, [word, weight, tier])
+            target[1] = max(target[1], weight)
+            if ranker.tier_rank.get(tier, 0) < ranker.tier_rank.get(target[2], 0):
+                target[2] = tier
+    return targets
+
+
+def _rank_tokens(ranker, year, dropped=None):
+    """Score one year from its token arrays and offer its best awards to the ranker."""
+    import numpy as np
+
+    import nsf_store
+    import nsf_tokens
+
+    store = nsf_store.ensure_store(year)
+    with nsf_metrics.stage("density.tokens"):
+        arrays = nsf_tokens.open_tokens(year)
+    n = arrays.size
+    hits = np.zeros(n, np.int64)
+    weighted = np.zeros(n, np.float64)
+    distinct = np.zeros(n, np.int64)
+    found = []  # (spelling, tier, rows, first position in each row)
+    with nsf_metrics.stage("density.scan"):
+        for word, weight, tier in _keyword_targets(ranker).values():
+            positions = arrays.positions(word)
+            if not len(positions):
+                continue
+            rows, first, counts = np.unique(arrays.rows_of(positions), return_index=True, return_counts=True)
+            hits[rows] += counts
+            weighted[rows] += weight * counts
+            distinct[rows] += 1
+            found.append((word, tier, rows, positions[first]))
+
+        candidates = np.ones(n, bool)
+        if dropped:
+            candidates[list(dropped)] = False
+        ranker.scanned += int(candidates.sum())
+        flagged = np.flatnonzero(candidates & (hits > 0))
+        ranker.flagged += len(flagged)
+        if not len(flagged):
+            return
+
+        words = arrays.words[flagged].astype(np.float64)
+        density = 100.0 * hits[flagged] / np.maximum(words, 1)
+        score = 100.0 * weighted[flagged] / np.maximum(words, ranker.min_tokens)
+        amounts = nsf_store.read_table(store, ["fundsObligatedAmt"]).column(0).to_numpy(zero_copy_only=False)
+        amounts = np.nan_to_num(amounts[flagged].astype(np.float64))
+        if ranker.by == "score":
+            order = np.lexsort((flagged, -score))
+        elif ranker.by == "funding":
+            order = np.lexsort((flagged, -score * amounts))
+        elif ranker.by == "density":
+            order = np.lexsort((flagged, -density))
+        else:
+            order = np.lexsort((flagged, -score, -distinct[flagged]))
+        order = order[:ranker.top]
+
+    # Only the year's best awards are read from the store
+    best = flagged[order]
+    records = nsf_store.take_rows(nsf_store.read_table(store, RANK_COLUMNS), best)
+    for i, row, award in zip(order, best, records):
+        matched = []
+        for word, tier, rows, first in found:
+            j = np.searchsorted(rows, row)
+            if j < len(rows) and rows[j] == row:
+                matched.append((first[j], len(word), ranker.tier_rank.get(tier, 0), word, tier))
+        matched.sort()
+        tier = min(matched, key=lambda m: m[2])[4]
+        result = Density(int(arrays.words[row]), int(hits[row]), int(distinct[row]), float(density[i]),
+                         float(score[i]), tier, [m[3] for m in matched])
+        ranker._offer(ranker._key(result, float(amounts[i])), award, int(year), float(amounts[i]), result)
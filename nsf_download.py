@@ -0,0 +1,351 @@
+"""
+Headless year downloads and the multi-year download scheduler.
+
+fetch_awards_for_year() reports progress through a plain `log` callable, so
+it can run on any thread. DownloadScheduler runs several years at once on a
+thread pool and streams their log lines back through a thread-safe queue
+that a GUI can drain from its event loop (see nsf_data_extractor.py).
+"""
+import csv
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import requests
+
+import nsf_cache
+import nsf_index
+import nsf_metrics
+from nsf_award import FIELDS
+from nsf_fetch import NSFFetcher
+
+# Fields requested from the API (also the CSV column order)
+CSV_HEADERS = list(FIELDS)
+PRINT_FIELDS = ",".join(CSV_HEADERS)
+
+# Listings without abstracts, for jobs that decide from ids, dates and amounts
+# which awards need their abstracts at all (fetched by id in a second pass)
+SUMMARY_FIELDS = [field for field in CSV_HEADERS if field != "abstractText"]
+SUMMARY_PRINT_FIELDS = ",".join(SUMMARY_FIELDS)
+ABSTRACT_PRINT_FIELDS = "id,abstractText"
+
+
+def write_csv(year, awards):
+    """Write the year's CSV export from an iterable of award records."""
+    csv_file_path = nsf_cache.csv_cache_path(year)
+    with open(csv_file_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        csv_writer = csv.DictWriter(csv_file, fieldnames=CSV_HEADERS, extrasaction="ignore")
+        csv_writer.writeheader()
+        csv_writer.writerows(awards)
+    return csv_file_path
+
+
+def build_store(year, log):
+    """Rebuild the year's columnar Arrow store; skipped when pyarrow is not installed."""
+    try:
+        import nsf_store
+    except ImportError:
+        log("[WARN] pyarrow is not installed; skipping the columnar store.")
+        return None
+    path = nsf_store.ensure_store(year)
+    log(f"[INFO] Columnar store updated: {path}")
+    return path
+
+
+def build_index(year, log):
+    """Rebuild the year's keyword index so the first query after a download is instant."""
+    index = nsf_index.open_index(year)
+    log(f"[INFO] Keyword index updated: {index.size} awards, {len(index.terms)} terms.")
+    return index
+
+
+def build_merge(year, log):
+    """Fold the year into the cross-year merge index, so multi-year sweeps count each award once."""
+    try:
+        import nsf_merge
+    except ImportError:
+        return None
+    merge = nsf_merge.update_year(year)
+    dropped = sum(len(rows) for rows in merge.excluded_rows(merge.years).values())
+    years = len(merge.years)
+    log(f"[INFO] Merge index updated: {merge.size} distinct awards across {years} year{'s' if years != 1 else ''}"
+        f" ({dropped} duplicate copies).")
+    return merge
+
+
+def build_tokens(year, log):
+    """Tokenize the year's abstracts into integer token arrays for density ranking (see nsf_tokens)."""
+    try:
+        import nsf_tokens
+    except ImportError:
+        return None
+    arrays = nsf_tokens.open_tokens(year)
+    log(f"[INFO] Token arrays updated: {len(arrays.tokens)} tokens, vocabulary of {len(arrays.vocab)} terms.")
+    return arrays
+
+
+def build_similar(year, log):
+    """Build the year's term matrix for "More like this" searches (see nsf_similar)."""
+    try:
+        import nsf_similar
+    except ImportError:
+        return None
+    matrix = nsf_similar.open_terms(year)
+    log(f"[INFO] Similarity terms updated: {matrix.shape[0]} abstracts, {matrix.nnz} term entries.")
+    return matrix
+
+
+def fetch_awards_for_year(year, log, fetcher=None, cancel_event=None, refresh=False, progress=None):
+    """
+    Fetch all award data for a given year using the NSF API,
+    paginate through results, and save the JSON-lines cache and CSV export.
+
+    Every page is appended to the cache and checkpointed as it arrives, so a
+    download that fails or is cancelled resumes from its last committed
+    offset the next time it runs. With refresh=True a completed year only
+    pulls awards dated since its last fetch and merges them in by id.
+
+    `log` receives one status line per call; `progress(records, total)`, if
+    given, is called after every committed page with the API's total count
+    (None until it is known). Returns the number of records
+    in the year's cache (or committed so far, if the download stopped early).
+    """
+    # --- Debugging & Progress ---
+    log(f"\n[INFO] Starting data fetch for year {year}")
+
+    # Build folder name
+    folder_name = nsf_cache.year_folder(year)
+    if not os.path.exists(folder_name):
+        os.makedirs(folder_name)
+        log(f"[DEBUG] Created folder: {folder_name}")
+    else:
+        log(f"[DEBUG] Folder already exists: {folder_name}")
+
+    owns_fetcher = fetcher is None
+    if owns_fetcher:
+        fetcher = NSFFetcher()
+    try:
+        with nsf_metrics.stage("download"):
+            if refresh:
+                if nsf_cache.is_complete(year):
+                    return _refresh_year(year, nsf_cache.load_manifest(year), log, fetcher, cancel_event)
+                log(f"[WARN] No completed download to refresh for year {year}; fetching the full year.")
+            return _download_year(year, log, fetcher, cancel_event, progress)
+    finally:
+        if owns_fetcher:
+            fetcher.close()
+
+
+def _download_year(year, log, fetcher, cancel_event, progress=None):
+    # Full calendar year, Jan 1 - Dec 31; the manifest records the page size
+    # these params request, so resumed offsets line up with the pages
+    params = fetcher.year_params(year, PRINT_FIELDS)
+    checkpoint = nsf_cache.Checkpoint(year, params["rpp"], PRINT_FIELDS)
+    if checkpoint.resumed:
+        log(f"[INFO] Resuming at offset {checkpoint.next_offset} "
+            f"({checkpoint.record_count} records already downloaded).")
+
+    # NSF only returns 25 items per page; the fetcher keeps several pages
+    # in flight and hands them back in offset order
+    try:
+        pages = fetcher.iter_pages(params, start_offset=checkpoint.next_offset, cancel_event=cancel_event)
+        for page in pages:
+            # --- Debugging & Progress ---
+            log(f"[DEBUG] Fetched records {page.offset} to {page.offset + len(page.awards) - 1}...")
+
+            # Append the page to the cache and checkpoint it
+            rows = [{field: award.get(field, "") for field in CSV_HEADERS} for award in page.awards]
+            with nsf_metrics.stage("download.checkpoint"):
+                checkpoint.commit_page(page, rows)
+
+            # --- Debugging & Progress ---
+            log(f"[INFO] Fetched {len(rows)} records in this batch. (Total so far: {checkpoint.record_count})")
+            if progress is not None:
+                progress(checkpoint.record_count, checkpoint.manifest["total_count"])
+    except requests.exceptions.RequestException as e:
+        log(f"[ERROR] Request failed for year {year}: {e}")
+        log(f"[INFO] {checkpoint.record_count} records checkpointed; download again to resume.")
+        return checkpoint.record_count
+
+    if cancel_event is not None and cancel_event.is_set():
+        log(f"[WARN] Download for year {year} cancelled after {checkpoint.record_count} records; "
+            "download again to resume.")
+        return checkpoint.record_count
+    log("[INFO] No more awards found. Stopping.")
+
+    cache_file_path = checkpoint.finish()
+    with nsf_metrics.stage("download.csv"):
+        csv_file_path = write_csv(year, nsf_cache.iter_jsonl(cache_file_path))
+    with nsf_metrics.stage("download.store"):
+        build_store(year, log)
+    with nsf_metrics.stage("download.index"):
+        build_index(year, log)
+    with nsf_metrics.stage("download.merge"):
+        build_merge(year, log)
+    with nsf_metrics.stage("download.tokens"):
+        build_tokens(year, log)
+    with nsf_metrics.stage("download.similar"):
+        build_similar(year, log)
+
+    # Check for empty files
+    if checkpoint.record_count == 0:
+        log(f"[WARN] No records downloaded for year {year}. Cache and CSV might be empty.")
+    else:
+        log(f"[INFO] Finished fetching {checkpoint.record_count} records for year {year}.")
+        log(f"[INFO] Data saved to:\n     {cache_file_path}\n     {csv_file_path}")
+    return checkpoint.record_count
+
+
+def _listing_changed(cached, summary):
+    """True if an award is new, or its listing differs from the cached award."""
+    return cached is None or any(cached.get(field, "") != summary[field] for field in SUMMARY_FIELDS)
+
+
+def _refresh_year(year, manifest, log, fetcher, cancel_event):
+    """
+    Pull awards dated on or after the previous fetch and merge them by id.
+
+    The API can only filter by award date, so the window starts one day
+    before the previous fetch began to cover awards made while it ran.
+    The window is listed without abstracts first; only awards that are new
+    or whose listing changed are then fetched again with their abstracts.
+    An abstract edited without any other change is therefore only picked
+    up by a full download.
+    """
+    started_at = datetime.now()
+    since = datetime.fromisoformat(manifest["started_at"]).date() - timedelta(days=1)
+    since = max(since, date(int(year), 1, 1))
+    if since > date(int(year), 12, 31):
+        log(f"[INFO] Year {year} closed before the last fetch; nothing to refresh.")
+        return manifest.get("record_count", 0)
+
+    log(f"[INFO] Refreshing year {year} with awards dated since {since:%m/%d/%Y}.")
+    params = fetcher.year_params(year, SUMMARY_PRINT_FIELDS)
+    params["dateStart"] = since.strftime("%m/%d/%Y")
+
+    cached_awards = nsf_cache.load_awards(year)
+    summaries = []
+    try:
+        for page in fetcher.iter_pages(params, cancel_event=cancel_event):
+            summaries.extend({field: award.get(field, "") for field in SUMMARY_FIELDS} for award in page.awards)
+            log(f"[INFO] Listed {len(summaries)} recent awards...")
+
+        cached = {award.get("id"): award for award in cached_awards}
+        stale = [summary for summary in summaries if _listing_changed(cached.get(summary["id"]), summary)]
+        log(f"[INFO] {len(stale)} of {len(summaries)} recent awards are new or changed; fetching their abstracts.")
+        details = {}
+        if stale and not (cancel_event is not None and cancel_event.is_set()):
+            details = fetcher.fetch_by_ids([summary["id"] for summary in stale], ABSTRACT_PRINT_FIELDS,
+                                           cancel_event=cancel_event)
+    except requests.exceptions.RequestException as e:
+        log(f"[ERROR] Refresh failed for year {year}: {e}. The cache was left unchanged.")
+        return manifest.get("record_count", 0)
+    if cancel_event is not None and cancel_event.is_set():
+        log(f"[WARN] Refresh for year {year} cancelled. The cache was left unchanged.")
+        return manifest.get("record_count", 0)
+
+    updates = []
+    for summary in stale:
+        update = {field: summary.get(field, "") for field in CSV_HEADERS}
+        detail = details.get(summary["id"]) or cached.get(summary["id"]) or {}
+        update["abstractText"] = detail.get("abstractText", "")
+        updates.append(update)
+
+    awards, added, changed = nsf_cache.merge_by_id(cached_awards, updates)
+    nsf_cache.save_awards(year, awards)
+    write_csv(year, awards)
+    manifest = nsf_cache.load_manifest(year)
+    manifest.update(record_count=len(awards), started_at=started_at.isoformat(timespec="seconds"),
+                    fetched_at=datetime.now().isoformat(timespec="seconds"))
+    nsf_cache.save_manifest(year, manifest)
+    with nsf_metrics.stage("download.store"):
+        build_store(year, log)
+    with nsf_metrics.stage("download.index"):
+        build_index(year, log)
+    with nsf_metrics.stage("download.merge"):
+        build_merge(year, log)
+    with nsf_metrics.stage("download.tokens"):
+        build_tokens(year, log)
+    with nsf_metrics.stage("download.similar"):
+        build_similar(year, log)
+    log(f"[INFO] Refreshed year {year}: {added} new and {changed} changed awards ({len(awards)} total).")
+    return len(awards)
+
+
+class DownloadScheduler:
+    """
+    Download several years concurrently in the background.
+
+    max_years     -- years downloaded at the same time
+    max_in_flight -- global budget of simultaneous API requests shared by all years
+
+    Progress is published on `self.events` as (kind, year, payload) tuples:
+      ("log", year, line)           a status line
+      ("done", year, count)         the year finished
+      ("cancelled", year, count)    the year was cancelled
+      ("error", year, message)      the year failed or stopped early
+    """
+
+    def __init__(self, max_years=3, max_in_flight=8, fetcher=None):
+        self.events = queue.Queue()
+        self._fetcher = fetcher or NSFFetcher(concurrency=4, max_in_flight=max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_years), thread_name_prefix="nsf-year")
+        self._jobs = {}  # year -> (future, cancel_event)
+        self._lock = threading.Lock()
+
+    def submit(self, year, refresh=False):
+        """Queue a year for download. Returns False if it is already queued or running."""
+        with self._lock:
+            job = self._jobs.get(year)
+            if job is not None and not job[0].done():
+                return False
+            cancel_event = threading.Event()
+            future = self._executor.submit(self._run, year, cancel_event, refresh)
+            self._jobs[year] = (future, cancel_event)
+            return True
+
+    def _run(self, year, cancel_event, refresh):
+        if cancel_event.is_set():
+            self.events.put(("cancelled", year, 0))
+            return 0
+        try:
+            count = fetch_awards_for_year(
+                year, lambda line: self.events.put(("log", year, line)),
+                fetcher=self._fetcher, cancel_event=cancel_event, refresh=refresh)
+        except Exception as e:
+            self.events.put(("error", year, str(e)))
+            raise
+        if cancel_event.is_set():
+            self.events.put(("cancelled", year, count))
+        elif nsf_cache.is_complete(year) and not nsf_cache.download_pending(year):
+            self.events.put(("done", year, count))
+        else:
+            self.events.put(("error", year, f"stopped after {count} records; download again to resume"))
+        return count
+
+    def cancel(self, year):
+        """Cancel one year; the others keep running."""
+        with self._lock:
+            job = self._jobs.get(year)
+        if job is not None:
+            job[1].set()
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for _, cancel_event in jobs:
+            cancel_event.set()
+
+    def active_years(self):
+        """Years that are queued or still downloading, in submission order."""
+        with self._lock:
+            return [year for year, (future, _) in self._jobs.items() if not future.done()]
+
+    def shutdown(self, wait=True):
+        """Cancel every year; with wait=False running pages finish in the background."""
+        self.cancel_all()
+        self._executor.shutdown(wait=wait)
+        if wait:
+            self._fetcher.close()
@@ -0,0 +1,305 @@
+"""
+Shared fetch engine for the NSF Awards API.
+
+Both the downloader (nsf_data_extractor.py) and the analyzer (nsf.py) walk
+the API page by page. NSFFetcher keeps one pooled requests.Session, keeps
+several page requests in flight at once and hands the pages back strictly in
+offset order, so callers can treat it like the old serial loop.
+
+The page size is not hardcoded: unless one is given, the first request asks
+for a large page of ids only and the fetcher keeps using the largest page
+size the server actually honoured. Callers choose the printFields each job
+needs; fetch_by_ids() fills in expensive fields (abstracts) afterwards for
+just the awards that need them.
+
+Responses are kept in an on-disk page cache (see nsf_http_cache): a page
+still fresh there is served without a request, and a stale one is
+revalidated with a conditional request.
+"""
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import nsf_http_cache
+import nsf_metrics
+
+# The NSF_API_URL environment variable lets every tool be pointed at a local
+# stub server (see nsf_stub_server.py) instead of the live API.
+API_BASE_URL = os.environ.get("NSF_API_URL", "http://api.nsf.gov/services/v1/awards.json")
+
+# NSF has historically returned at most 25 records per page; used when probing fails
+DEFAULT_RPP = 25
+# Page sizes tried by the probe, largest first
+PROBE_RPPS = (3000, 1000, 500, 100, 50, 25)
+
+# HTTP statuses worth retrying; anything else is raised straight away
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+Page = namedtuple("Page", ["offset", "awards", "total"])
+
+
+class FetchError(requests.exceptions.RequestException):
+    """Raised when a page still fails after all retries."""
+
+
+class RateLimiter:
+    """Token bucket shared by every worker thread of a fetcher."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent. A rate of None/0 disables limiting."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class NSFFetcher:
+    """
+    Concurrent, order-preserving paginated fetcher for the NSF Awards API.
+
+    concurrency -- number of page requests kept in flight
+    max_in_flight -- global cap on simultaneous requests across every
+                     iter_pages() call sharing this fetcher (default: concurrency)
+    rate_limit  -- maximum requests per second across all threads (None = unlimited)
+    retries     -- retry attempts per page on network errors / 429 / 5xx
+    backoff     -- base delay in seconds for exponential backoff
+    rpp         -- records per page; None probes the server for its largest page
+    cache       -- PageCache for raw responses; None uses the default one, False disables caching
+    """
+
+    # Probed page sizes per API URL, shared by every fetcher in the process
+    _page_sizes = {}
+    _probe_lock = threading.Lock()
+
+    def __init__(self, base_url=None, concurrency=4, max_in_flight=None, rate_limit=8.0,
+                 retries=4, backoff=0.5, timeout=30, rpp=None, cache=None):
+        self.base_url = base_url or API_BASE_URL
+        self.concurrency = max(1, concurrency)
+        self.max_in_flight = max(1, max_in_flight or self.concurrency)
+        self._budget = threading.BoundedSemaphore(self.max_in_flight)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._rpp = rpp
+        self.limiter = RateLimiter(rate_limit, burst=self.max_in_flight)
+        self.cache = nsf_http_cache.default_cache() if cache is None else (cache or None)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    # --------------------- SINGLE PAGE --------------------- #
+    def fetch_page(self, params):
+        """GET one page with rate limiting and retry/backoff. Returns the decoded JSON."""
+        entry = self.cache.lookup(self.base_url, params) if self.cache is not None else None
+        if entry is not None and (entry.fresh or self.cache.offline):
+            nsf_metrics.count("http_cache_hits")
+            return entry.json()
+        headers = entry.validators() if entry is not None else None
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            delay = None
+            try:
+                nsf_metrics.count("requests")
+                with self._budget, nsf_metrics.stage("fetch.request"):
+                    response = self.session.get(self.base_url, params=params, headers=headers,
+                                                timeout=self.timeout)
+                nsf_metrics.count("bytes_received", len(response.content))
+                if response.status_code == 304 and entry is not None:
+                    nsf_metrics.count("http_not_modified")
+                    return self.cache.revalidated(entry, response.headers).json()
+                if response.status_code in RETRY_STATUSES:
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = float(retry_after)
+                    raise requests.exceptions.HTTPError(
+                        f"{response.status_code} from NSF API", response=response)
+                response.raise_for_status()
+                with nsf_metrics.stage("fetch.parse"):
+                    data = response.json()
+                if self.cache is not None:
+                    self.cache.store(self.base_url, params, response.content, response.headers)
+                return data
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                status = getattr(e.response, "status_code", None)
+                if status is not None and status not in RETRY_STATUSES:
+                    raise
+                if attempt >= self.retries:
+                    raise FetchError(f"Giving up on offset {params.get('offset')} "
+                                     f"after {attempt + 1} attempts: {e}") from e
+                if delay is None:
+                    delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                nsf_metrics.count("retries")
+                time.sleep(delay)
+                attempt += 1
+
+    def _get_page(self, params):
+        data = self.fetch_page(params)
+        response = data.get("response", {}) if isinstance(data, dict) else {}
+        awards = response.get("award") or []
+        total = (response.get("metadata") or {}).get("totalCount")
+        nsf_metrics.count("pages_fetched")
+        nsf_metrics.count("awards_fetched", len(awards))
+        return Page(params["offset"], awards, total)
+
+    # --------------------- PAGE SIZE --------------------- #
+    @property
+    def rpp(self):
+        """Records per page: the size given to the constructor, or the probed maximum."""
+        if self._rpp is None:
+            self._rpp = self.probe_page_size()
+        return self._rpp
+
+    def probe_page_size(self):
+        """
+        Largest page size the API honours, found by asking for a big page of
+        ids and counting what comes back. Remembered per API URL.
+        """
+        with self._probe_lock:
+            if self.base_url in self._page_sizes:
+                return self._page_sizes[self.base_url]
+            size = DEFAULT_RPP
+            for rpp in PROBE_RPPS:
+                try:
+                    page = self._get_page({"offset": 1, "rpp": rpp, "printFields": "id"})
+                except (requests.exceptions.HTTPError, nsf_http_cache.CacheMiss):
+                    continue  # rejected outright (e.g. 400), or offline and never probed; try a smaller page
+                except requests.exceptions.RequestException:
+                    break  # unreachable; keep the default and let the real request report it
+                returned = len(page.awards)
+                if returned >= rpp or (page.total is not None and returned >= page.total):
+                    size = rpp
+                elif returned:
+                    size = returned  # the server capped the page
+                else:
+                    continue
+                break
+            self._page_sizes[self.base_url] = size
+            return size
+
+    # --------------------- PAGINATION --------------------- #
+    def year_params(self, year, print_fields):
+        """Base query parameters for a full calendar year."""
+        return {
+            "dateStart": f"01/01/{year}",
+            "dateEnd": f"12/31/{year}",
+            "rpp": self.rpp,
+            "printFields": print_fields,
+        }
+
+    def iter_pages(self, base_params, start_offset=1, cancel_event=None):
+        """
+        Yield Page tuples in offset order until the API runs out of awards.
+
+        Up to `concurrency` offsets are requested ahead of the consumer; pages
+        that complete early are held back until every earlier page has been
+        yielded. Closing the generator, or setting `cancel_event`, cancels
+        outstanding requests.
+        """
+        # The page size is read once and sent with every request, so the
+        # offsets stepped here always match the pages the server returns
+        rpp = base_params.get("rpp") or self.rpp
+        base_params = dict(base_params, rpp=rpp)
+        pending = {}
+        next_submit = start_offset
+        next_yield = start_offset
+        last_offset = None  # known once a short/empty page or totalCount is seen
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="nsf-fetch")
+        try:
+            def submit_more():
+                nonlocal next_submit
+                while len(pending) < self.concurrency and (last_offset is None or next_submit <= last_offset):
+                    params = dict(base_params, offset=next_submit)
+                    pending[next_submit] = executor.submit(self._get_page, params)
+                    next_submit += rpp
+
+            submit_more()
+            while next_yield in pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                page = pending.pop(next_yield).result()
+                if page.total is not None:
+                    final = start_offset + ((max(page.total, 1) - start_offset) // rpp) * rpp
+                    last_offset = final if last_offset is None else min(last_offset, final)
+                if len(page.awards) < rpp:
+                    last_offset = page.offset if last_offset is None else min(last_offset, page.offset)
+                if page.awards:
+                    yield page
+                if last_offset is not None and next_yield >= last_offset:
+                    break
+                next_yield += rpp
+                submit_more()
+        finally:
+            for future in pending.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def fetch_by_ids(self, award_ids, print_fields, cancel_event=None):
+        """
+        Fetch the given fields of individual awards, `concurrency` at a time.
+
+        This is the second pass after a cheap listing: only the awards that
+        survived it pay for their large fields. Returns {id: award}; awards the
+        API no longer returns are left out.
+        """
+        found = {}
+        futures = []
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="nsf-fetch")
+        try:
+            futures = [executor.submit(self._get_page, {"id": award_id, "offset": 1, "rpp": 1,
+                                                        "printFields": print_fields})
+                       for award_id in award_ids]
+            for future in futures:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                for award in future.result().awards:
+                    found[award.get("id")] = award
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+        return found
+
+    def fetch_year(self, year, print_fields, progress=None, cancel_event=None):
+        """Fetch every award for `year`; progress(count, total) is called after each page."""
+        awards = []
+        for page in self.iter_pages(self.year_params(year, print_fields), cancel_event=cancel_event):
+            awards.extend(page.awards)
+            if progress:
+                progress(len(awards), page.total)
+        return awards
@@ -0,0 +1,202 @@
+"""
+On-disk cache of raw NSF API responses, revalidated with conditional requests.
+
+Every successful API response is kept under awards_http/, addressed by what
+was asked and by what came back:
+
+    awards_http/requests/ab/ab12...json   one per request (URL + sorted query parameters):
+                                          the body's hash, ETag, Last-Modified and when
+                                          it was stored and last confirmed
+    awards_http/bodies/cd/cd34...json.gz  response bodies by SHA-256, gzipped; identical
+                                          pages share one file
+
+How long an entry is trusted without asking the API depends on the dates it
+covers (see ttl_for):
+
+    a window that had closed CLOSED_AFTER_DAYS before the  never expires: awards of
+    response was stored or last confirmed                  past years do not change
+    a window reaching into the last CLOSED_AFTER_DAYS       CURRENT_TTL seconds
+    award lookups by id                                    CURRENT_TTL seconds
+    anything else (the page size probe)                    UNDATED_TTL seconds
+
+A fresh entry is served without any request, so downloading a closed year
+again costs no round trips. A stale one is revalidated with If-None-Match /
+If-Modified-Since; a 304 answer renews it without resending the page. In
+offline mode every cached entry is served whatever its age, and a request
+that was never cached fails with CacheMiss instead of reaching the network.
+
+NSF_HTTP_CACHE sets the directory (NSF_HTTP_CACHE=off disables the cache)
+and NSF_OFFLINE=1 turns on offline mode for every tool.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+import requests
+
+import nsf_metrics
+
+HTTP_CACHE_DIR = os.environ.get("NSF_HTTP_CACHE", "awards_http")
+OFFLINE = os.environ.get("NSF_OFFLINE", "").lower() in ("1", "true", "yes")
+
+HTTP_CACHE_VERSION = 1
+
+CLOSED_AFTER_DAYS = 90
+CURRENT_TTL = 3600
+UNDATED_TTL = 7 * 24 * 3600
+
+_DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})$")
+
+
+class CacheMiss(requests.exceptions.RequestException):
+    """Raised in offline mode for a request that was never cached."""
+
+
+def request_key(url, params):
+    """SHA-256 of the URL and the query parameters, in a canonical order."""
+    canonical = json.dumps([url, sorted((str(k), str(v)) for k, v in params.items())], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _parse_date(text):
+    match = _DATE_RE.match(str(text or "").strip())
+    if not match:
+        return None
+    month, day, year = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def ttl_for(params, validated=None):
+    """
+    Seconds an entry for these query parameters stays fresh; None = forever.
+    A window only counts as closed if it already was when the entry was last
+    stored or confirmed (`validated`, a date; default today).
+    """
+    if params.get("id"):
+        return CURRENT_TTL
+    end = _parse_date(params.get("dateEnd"))
+    if end is None and _parse_date(params.get("dateStart")) is not None:
+        end = date.max  # open-ended window: still growing
+    if end is None:
+        return UNDATED_TTL
+    validated = validated or date.today()
+    if end < validated - timedelta(days=CLOSED_AFTER_DAYS):
+        return None
+    return CURRENT_TTL
+
+
+class Entry:
+    """A cached response: where its body is and how to revalidate it."""
+
+    def __init__(self, cache, key, record):
+        self.cache = cache
+        self.key = key
+        self.record = record
+
+    @property
+    def fresh(self):
+        validated_at = self.record.get("validated_at", 0)
+        ttl = ttl_for(self.record.get("params", {}), date.fromtimestamp(validated_at))
+        return ttl is None or time.time() - validated_at < ttl
+
+    def validators(self):
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.record.get("etag"):
+            headers["If-None-Match"] = self.record["etag"]
+        if self.record.get("last_modified"):
+            headers["If-Modified-Since"] = self.record["last_modified"]
+        return headers
+
+    def content(self):
+        """The raw response body."""
+        with gzip.open(self.cache._body_path(self.record["body"]), "rb") as f:
+            return f.read()
+
+    def json(self):
+        with nsf_metrics.stage("fetch.parse"):
+            return json.loads(self.content())
+
+
+class PageCache:
+    """Raw API responses on disk, keyed by request. Safe to share between threads."""
+
+    def __init__(self, directory=None, offline=None):
+        self.directory = directory or HTTP_CACHE_DIR
+        self.offline = OFFLINE if offline is None else offline
+
+    def _request_path(self, key):
+        return os.path.join(self.directory, "requests", key[:2], key + ".json")
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, "bodies", digest[:2], digest + ".json.gz")
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url, params):
+        """The cached Entry for a request, or None (in offline mode: raises CacheMiss)."""
+        key = request_key(url, params)
+        try:
+            with open(self._request_path(key), "r", encoding="utf-8") as f:
+                record = json.load(f)
+            if record.get("version") != HTTP_CACHE_VERSION or not os.path.exists(self._body_path(record["body"])):
+                record = None
+        except (OSError, ValueError, KeyError, TypeError):
+            record = None
+        if record is None:
+            if self.offline:
+                raise CacheMiss(f"Offline, and no cached response for {params}")
+            return None
+        return Entry(self, key, record)
+
+    def store(self, url, params, content, headers=None):
+        """Cache a 200 response body with its validators. Returns the Entry."""
+        headers = headers or {}
+        digest = hashlib.sha256(content).hexdigest()
+        body_path = self._body_path(digest)
+        if not os.path.exists(body_path):
+            self._write(body_path, gzip.compress(content, compresslevel=1))
+        now = time.time()
+        record = {
+            "version": HTTP_CACHE_VERSION,
+            "url": url,
+            "params": {str(k): str(v) for k, v in params.items()},
+            "body": digest,
+            "size": len(content),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "stored_at": now,
+            "validated_at": now,
+        }
+        key = request_key(url, params)
+        self._write(self._request_path(key), json.dumps(record, indent=1).encode("utf-8"))
+        return Entry(self, key, record)
+
+    def revalidated(self, entry, headers=None):
+        """Record that the API confirmed an entry is unchanged (a 304 answer)."""
+        record = dict(entry.record, validated_at=time.time())
+        if headers and headers.get("ETag"):
+            record["etag"] = headers["ETag"]
+        self._write(self._request_path(entry.key), json.dumps(record, indent=1).encode("utf-8"))
+        entry.record = record
+        return entry
+
+
+def default_cache():
+    """The cache every fetcher uses unless told otherwise, or None when NSF_HTTP_CACHE=off."""
+    if HTTP_CACHE_DIR.lower() in ("off", "0", "none", ""):
+        return None
+    return PageCache()
@@ -0,0 +1,220 @@
+"""
+Inverted index over award abstracts for instant keyword queries.
+
+An index maps every lowercased word of a year's abstracts, plus every known
+multi-word or punctuated red flag keyword ("social justice", "LGBTQIA+"), to
+the sorted row numbers of the awards that contain it. Row numbers follow the
+order of the year's cache, which is also the order of its Arrow store.
+
+Keyword filters then become posting-list unions (any of) and intersections
+(all of) instead of rescanning every abstract. A keyword the index has not
+seen before is answered by intersecting the postings of its words and
+verifying only those candidates with KeywordMatcher; the answer is kept for
+the next query.
+
+The index is stored next to the cache as {year}_awards.idx and is rebuilt
+automatically when the cache changes.
+"""
+import os
+import pickle
+import re
+from array import array
+
+import nsf_cache
+from nsf_keywords import QUICK_ADD_WORDS, RED_FLAG_WORDS
+from nsf_matcher import MATCHER_VERSION, KeywordMatcher, normalize_keyword
+
+INDEX_VERSION = 1
+
+TOKEN_RE = re.compile(r"\w+")
+_SIMPLE_TERM = re.compile(r"\w+")
+
+# Keywords whose postings are computed with the matcher at build time
+KNOWN_KEYWORDS = sorted({normalize_keyword(w) for words in RED_FLAG_WORDS.values() for w in words}
+                        | {normalize_keyword(w) for w in QUICK_ADD_WORDS})
+
+
+def is_simple_term(keyword):
+    """True for single-word keywords, which the word postings answer exactly."""
+    return _SIMPLE_TERM.fullmatch(normalize_keyword(keyword)) is not None
+
+
+def _source_metadata(cache_file):
+    stat = os.stat(cache_file)
+    return {
+        "source": os.path.basename(cache_file),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "index_version": INDEX_VERSION,
+        "matcher_version": MATCHER_VERSION,
+    }
+
+
+class InvertedIndex:
+    """Postings of row numbers per word and per known phrase."""
+
+    def __init__(self, ids, terms, phrases, metadata=None):
+        self.ids = ids
+        self.terms = terms
+        self.phrases = phrases
+        self.metadata = metadata or {}
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, records, phrases=KNOWN_KEYWORDS, metadata=None):
+        """Index an iterable of award records (anything with .get("abstractText"))."""
+        ids = []
+        terms = {}
+        phrase_keys = [p for p in phrases if not is_simple_term(p)]
+        phrase_postings = {p: array("I") for p in phrase_keys}
+        matcher = KeywordMatcher(phrase_keys)
+        findall = TOKEN_RE.findall
+
+        for row, record in enumerate(records):
+            ids.append(str(record.get("id", "")))
+            text = record.get("abstractText") or ""
+            for term in set(findall(text.lower())):
+                postings = terms.get(term)
+                if postings is None:
+                    postings = terms[term] = array("I")
+                postings.append(row)
+            for key in {normalize_keyword(hit.keyword) for hit in matcher.finditer(text)}:
+                phrase_postings[key].append(row)
+        return cls(ids, terms, phrase_postings, metadata)
+
+    # --------------------- PERSISTENCE --------------------- #
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"metadata": self.metadata, "ids": self.ids,
+                         "terms": self.terms, "phrases": self.phrases},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["ids"], data["terms"], data["phrases"], data["metadata"])
+
+    # --------------------- QUERIES --------------------- #
+    def lookup(self, keyword, texts=None):
+        """
+        Sorted rows whose abstract contains `keyword` as a whole word/phrase.
+
+        Unseen phrases need `texts`, a sequence of abstracts indexed by row,
+        to verify the candidates found through their words.
+        """
+        key = normalize_keyword(keyword)
+        if not key:
+            return array("I")
+        if is_simple_term(key):
+            return self.terms.get(key, array("I"))
+        if key in self.phrases:
+            return self.phrases[key]
+
+        words = TOKEN_RE.findall(key)
+        if not words:
+            return array("I")
+        candidates = self.all_of(words)
+        if texts is None:
+            raise ValueError(f"'{keyword}' is not indexed as a phrase; pass texts to verify it")
+        matcher = KeywordMatcher([key])
+        rows = array("I", (row for row in candidates if any(True for _ in matcher.finditer(texts[row]))))
+        self.phrases[key] = rows
+        return rows
+
+    def any_of(self, keywords, texts=None):
+        """Sorted rows matching at least one keyword (posting-list union)."""
+        lists = [self.lookup(k, texts) for k in keywords]
+        if len(lists) == 1:
+            return list(lists[0])
+        return sorted(set().union(*lists))
+
+    def all_of(self, keywords, texts=None):
+        """Sorted rows matching every keyword (posting-list intersection)."""
+        lists = sorted((self.lookup(k, texts) for k in keywords), key=len)
+        if not lists:
+            return []
+        rows = set(lists[0])
+        for postings in lists[1:]:
+            if not rows:
+                break
+            rows.intersection_update(postings)
+        return sorted(rows)
+
+    def candidates(self, keywords):
+        """
+        Sorted rows that can match at least one keyword, for callers that
+        verify every row with the matcher anyway: an unseen phrase adds the
+        rows holding all of its words instead of needing the abstracts.
+        """
+        lists = []
+        for keyword in keywords:
+            key = normalize_keyword(keyword)
+            if key and not is_simple_term(key) and key not in self.phrases:
+                lists.append(self.all_of(TOKEN_RE.findall(key)))
+            else:
+                lists.append(self.lookup(key))
+        return sorted(set().union(*lists))
+
+
+# --------------------- PER-FILE / PER-YEAR INDEXES --------------------- #
+def _index_path_for(cache_file):
+    for suffix in nsf_cache.CACHE_SUFFIXES.values():
+        if cache_file.endswith(suffix):
+            return cache_file[:-len(suffix)] + ".idx"
+    return os.path.splitext(cache_file)[0] + ".idx"
+
+
+def index_for_file(cache_file, records=None):
+    """
+    Load the index stored next to any cache file, (re)building it when it is
+    missing or was built from a different version of the cache. `records`
+    may supply already-loaded records to build from.
+
+    An Arrow store is indexed through the cache it was built from; a store
+    whose cache is gone gets an index that is not saved.
+    """
+    if cache_file.endswith(".arrow"):
+        import nsf_store
+        source = nsf_store.source_of(cache_file)
+        if source is None:
+            table = nsf_store.read_table(cache_file, ["id", "abstractText"])
+            return InvertedIndex.build(table.to_pylist() if records is None else records)
+        cache_file = source
+    cache_file = nsf_cache.migrate_file(cache_file)
+    path = _index_path_for(cache_file)
+    metadata = _source_metadata(cache_file)
+    if os.path.exists(path):
+        try:
+            index = InvertedIndex.load(path)
+            if index.metadata == metadata:
+                return index
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            pass
+    if records is None:
+        records = nsf_cache.iter_jsonl(cache_file)
+    index = InvertedIndex.build(records, metadata=metadata)
+    index.save(path)
+    return index
+
+
+def open_index(year):
+    """The up-to-date index for a year's completed cache."""
+    cache_file = nsf_cache.find_cache(year)
+    if cache_file is None:
+        raise FileNotFoundError(f"No complete award cache for {year}")
+    return index_for_file(cache_file)
+
+
+def query_years(years, keywords, mode="any"):
+    """{year: sorted rows} for awards matching any (or all) of the keywords in each year."""
+    results = {}
+    for year in years:
+        index = open_index(year)
+        results[year] = index.all_of(keywords) if mode == "all" else index.any_of(keywords)
+    return results
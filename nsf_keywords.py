@@ -0,0 +1,84 @@
+"""Red flag keyword lists shared by the GUIs and the headless tools."""
+
+# Define tiered red flag words
+RED_FLAG_WORDS = {
+    "Tier 1 (Critical)": [  # Most "woke"
+        "social justice", "systemic racism", "anti-racism", "white privilege",
+        "decolonization", "intersectionality", "cultural appropriation",
+        "radical inclusion", "anti-oppression", "equity lens"
+    ],
+    "Tier 2 (High)": [
+        "diversity", "equity", "inclusion", "BIPOC", "LGBTQIA+",
+        "marginalized communities", "gender equity", "racial justice",
+        "microaggressions", "cultural humility"
+    ],
+    "Tier 3 (Moderate)": [
+        "accessibility", "representation", "community engagement",
+        "empowerment", "holistic approach", "disparity", "underserved",
+        "neurodiversity", "safe space", "allyship"
+    ],
+    "Tier 4 (Common)": [  # Least concerning
+        "innovative", "cutting-edge", "synergy", "leverage", "game-changing",
+        "revolutionary", "disruptive", "paradigm", "unprecedented", "scalable",
+        "framework", "sustainability", "impactful", "stakeholder", "inclusive"
+    ]
+}
+
+# Score weight of a keyword hit per tier: Tier 1 (Critical) weighs most, the
+# last tier 1; tiers not listed here (custom words) also weigh 1
+TIER_WEIGHTS = {tier: len(RED_FLAG_WORDS) - i for i, tier in enumerate(RED_FLAG_WORDS)}
+
+# Quick-add words offered by the Red Flag Analyzer (redflag-detector.py)
+QUICK_ADD_WORDS = [
+    # --- Original sample set ---
+    "innovative", "cutting-edge", "synergy", "leverage", "game-changing",
+    "revolutionary", "disruptive", "paradigm", "unprecedented", "scalable",
+    "diversity", "equity", "inclusion", "women", "underrepresented",
+    "gender", "race", "social justice", "holistic", "empowerment",
+    "framework", "sustainability", "impactful", "stakeholder", "inclusive",
+    "transformation", "intersectionality", "accessible", "empirical",
+    "methodology", "outreach", "collaboration", "potential", "scalability",
+    "climate change", "AI-driven", "blockchain", "metaverse", "cryptocurrency",
+    
+    # --- Newly added DEI/social-justice terms ---
+    "Equity",
+    "Inclusion",
+    "Diversity",
+    "Intersectionality",
+    "Social Justice",
+    "Systemic Racism",
+    "Anti-Racism",
+    "Cultural Competency",
+    "Microaggressions",
+    "Implicit Bias",
+    "White Privilege",
+    "BIPOC",
+    "LGBTQIA+",
+    "Gender Non-Conforming",
+    "Allyship",
+    "Decolonization",
+    "Restorative Justice",
+    "Safe Space",
+    "Trigger Warning",
+    "Cultural Appropriation",
+    "Marginalized Communities",
+    "Underserved Populations",
+    "Disparity",
+    "Representation",
+    "Accessibility",
+    "Neurodiversity",
+    "Empowerment",
+    "Affirmative Action",
+    "Equitable Access",
+    "Inclusive Practices",
+    "Cultural Humility",
+    "Anti-Oppression",
+    "Equity Lens",
+    "Radical Inclusion",
+    "Community Engagement",
+    "Diversity Training",
+    "Socioeconomic Disadvantage",
+    "Gender Equity",
+    "Racial Justice",
+    "Holistic Approach"
+]
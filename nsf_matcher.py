@@ -0,0 +1,236 @@
+"""
+Compiled multi-keyword matcher for scanning award abstracts.
+
+KeywordMatcher is built once from a keyword list (or the tiered
+RED_FLAG_WORDS mapping) and finds every keyword in a single pass over each
+abstract. Matches respect word boundaries, so "equity" does not fire inside
+"inequity", and every hit comes back with its character offsets and tier.
+
+When the optional `pyahocorasick` package is installed the scan runs on an
+Aho-Corasick automaton in C. Otherwise each keyword is searched for with
+str.find, like the substring scan the analyzers used before, and only its
+occurrences are checked for word boundaries. A regex shaped like a trie of
+the keywords serves text whose length changes when lowercased (and can be
+picked with engine="regex"). Every engine returns identical hits.
+"""
+import re
+from collections import namedtuple
+
+try:
+    import ahocorasick
+except ImportError:  # optional accelerator
+    ahocorasick = None
+
+# Bump whenever matching semantics change so cached results are invalidated
+MATCHER_VERSION = 1
+
+Hit = namedtuple("Hit", ["start", "end", "keyword", "tier"])
+
+_WORD_CHAR = re.compile(r"\w")
+
+# The only characters whose lowercase is (or contains) ASCII. Text without
+# them holds the same ASCII keywords whether every letter is lowercased or
+# only its ASCII letters, and lowercasing changes no character's \w-ness.
+_LOWERED_TO_ASCII = ("\u0130", "\u212a")
+
+
+def normalize_keyword(word):
+    """Case- and whitespace-insensitive form used to identify a keyword."""
+    return " ".join(word.split()).lower()
+
+
+def _trie_pattern(words):
+    """
+    Regex alternation for `words` with common prefixes factored out.
+
+    Longer continuations are tried before a word ends at the current node,
+    so "equity lens" wins over "equity" when both fit.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(node[ch]) for ch in sorted(k for k in node if k)]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Match many keywords in one pass.
+
+    `keywords` is either a {tier: [words]} mapping (like RED_FLAG_WORDS) or a
+    plain iterable of words, in which case every hit has tier None. A keyword
+    listed in several tiers produces one hit per tier. Matching ignores case;
+    whitespace inside a keyword matches a single space, as before.
+    """
+
+    def __init__(self, keywords, engine=None):
+        if isinstance(keywords, dict):
+            tiered = keywords.items()
+        else:
+            tiered = [(None, keywords)]
+
+        # normalized keyword -> [(tier, keyword as spelled in the list)]
+        self._targets = {}
+        self.keywords = []
+        for tier, words in tiered:
+            for word in words:
+                key = normalize_keyword(word)
+                if not key:
+                    continue
+                entries = self._targets.setdefault(key, [])
+                if all(t != tier for t, _ in entries):
+                    entries.append((tier, word))
+                    self.keywords.append((tier, word))
+
+        keys = sorted(self._targets)
+        self._ascii_keys = all(key.isascii() for key in keys)
+        if engine is None:
+            engine = "aho-corasick" if ahocorasick is not None else "scan"
+        self.engine = engine if keys else None
+
+        # The regex engine also serves text whose length changes when
+        # lowercased (a few non-ASCII characters), through IGNORECASE variants
+        trie = _trie_pattern(keys)
+        self._regex = re.compile(trie + r"(?!\w)")
+        self._regex_ic = re.compile(trie + r"(?!\w)", re.IGNORECASE)
+
+        # A keyword that is a whole-word prefix of a longer one ("equity" in
+        # "equity lens") is hidden by the regex when the longer one matches at
+        # the same position, so the regex engine re-checks those explicitly.
+        self._single = {}
+        self._prefixes = {}
+        for key in keys:
+            self._single[key] = (re.compile(re.escape(key) + r"(?!\w)"),
+                                 re.compile(re.escape(key) + r"(?!\w)", re.IGNORECASE))
+            shorter = [other for other in keys
+                       if other != key and key.startswith(other) and not _WORD_CHAR.match(key[len(other)])]
+            if shorter:
+                self._prefixes[key] = shorter
+
+        # The scan engine searches shorter keywords first and skips any
+        # keyword whose contained keyword ("equity" in "gender equity") is
+        # absent from the text
+        self._scan_order = []
+        for key in sorted(keys, key=len):
+            inner = [other for other in keys if len(other) < len(key) and other in key]
+            self._scan_order.append((key, max(inner, key=len) if inner else None))
+        self._automaton = None
+        if self.engine == "aho-corasick":
+            self._automaton = ahocorasick.Automaton()
+            for key in keys:
+                self._automaton.add_word(key, (len(key), key))
+            self._automaton.make_automaton()
+
+    def __bool__(self):
+        return self.engine is not None
+
+    def finditer(self, text):
+        """Yield a Hit for every keyword occurrence in `text`, ordered by position."""
+        targets = self._targets
+        for start, end, key in self.spans(text):
+            for tier, word in targets[key]:
+                yield Hit(start, end, word, tier)
+
+    def spans(self, text):
+        """
+        Sorted (start, end, key) of every keyword occurrence in `text`, key
+        being the normalized keyword (see tiers()). A keyword listed in
+        several tiers gives one span, not one hit per tier.
+        """
+        if not text or self.engine is None:
+            return []
+        # Matching runs on the lowercased text; offsets carry over unless
+        # lowercasing changed the length
+        if text.isascii() or not self._ascii_keys or any(ch in text for ch in _LOWERED_TO_ASCII):
+            lowered = text.lower()
+        else:
+            # ASCII keywords only need the ASCII letters lowercased, which is
+            # several times cheaper through the UTF-8 bytes than str.lower()
+            lowered = text.encode("utf-8", "surrogatepass").lower().decode("utf-8", "surrogatepass")
+        if len(lowered) != len(text):
+            return self._regex_spans(text, ignore_case=True)
+        if self._automaton is not None:
+            return self._automaton_spans(lowered)
+        if self.engine == "scan":
+            return self._scan_spans(lowered)
+        return self._regex_spans(lowered, ignore_case=False)
+
+    def tiers(self, key):
+        """The tiers listing a normalized keyword, in list order."""
+        return [tier for tier, _ in self._targets[key]]
+
+    def _automaton_spans(self, lowered):
+        word_char = _WORD_CHAR.match
+        spans = []
+        for last, (length, key) in self._automaton.iter(lowered):
+            start = last - length + 1
+            if (start and word_char(lowered, start - 1)) or word_char(lowered, last + 1):
+                continue
+            spans.append((start, last + 1, key))
+        spans.sort()
+        return spans
+
+    def _scan_spans(self, lowered):
+        word_char = _WORD_CHAR.match
+        find = lowered.find
+        spans = []
+        present = set()
+        for key, inner in self._scan_order:
+            if inner is not None and inner not in present:
+                continue
+            start = find(key)
+            if start >= 0:
+                present.add(key)
+            while start >= 0:
+                end = start + len(key)
+                if not ((start and word_char(lowered, start - 1)) or word_char(lowered, end)):
+                    spans.append((start, end, key))
+                start = find(key, start + 1)
+        spans.sort()
+        return spans
+
+    def _regex_spans(self, text, ignore_case):
+        search = (self._regex_ic if ignore_case else self._regex).search
+        spans = []
+        pos = 0
+        while True:
+            m = search(text, pos)
+            if m is None:
+                return spans
+            start, end = m.span()
+            # Restart just past this match's start rather than its end, so
+            # keywords overlapping it ("inclusion" in "radical inclusion")
+            # are still found
+            pos = start + 1
+            if start and _WORD_CHAR.match(text, start - 1):
+                continue
+            key = m.group().lower()
+            for shorter in self._prefixes.get(key, ()):
+                sm = self._single[shorter][ignore_case].match(text, start)
+                if sm:
+                    spans.append((start, sm.end(), shorter))
+            spans.append((start, end, key))
+
+    def hits(self, text):
+        return list(self.finditer(text))
+
+    def matched_words(self, text):
+        """{tier: [keywords found]} with each tier's keywords in list order."""
+        found = {(hit.tier, hit.keyword) for hit in self.finditer(text)}
+        result = {}
+        for tier, word in self.keywords:
+            if (tier, word) in found:
+                result.setdefault(tier, []).append(word)
+        return result
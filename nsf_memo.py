@@ -0,0 +1,251 @@
+"""
+Memoized analysis results.
+
+Results are keyed on what they actually depend on: a content hash of the
+award cache, the normalized keyword selection and MATCHER_VERSION. Re-running
+the same analysis (or returning to an earlier keyword set) is answered from
+an in-memory LRU first and from disk (.nsf_memo/) second.
+
+Memos are also incremental. Every keyword's hit rows are kept separately,
+so a selection that adds one keyword only looks up that keyword and merges
+its hits with the ones already known. Memoized results stay compact (rows,
+amounts and matched words); award fields are read back from the
+memory-mapped store when a result is used.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import nsf_cache
+import nsf_metrics
+from nsf_analysis import ANALYSIS_COLUMNS, Analysis, AnalysisCancelled, empty_results
+from nsf_award import AMOUNT_FIELD, Award
+from nsf_matcher import MATCHER_VERSION, normalize_keyword
+
+MEMO_DIR = os.environ.get("NSF_MEMO_DIR", ".nsf_memo")
+MEMO_VERSION = 1
+
+
+class LRUMemo:
+    """
+    Thread-safe LRU mapping with an optional on-disk tier.
+
+    Keys must have a stable repr(); on disk every entry is one pickle named
+    after a hash of its key. directory=None keeps the memo in memory only.
+    """
+
+    def __init__(self, maxsize=32, directory=MEMO_DIR):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr((MEMO_VERSION, key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".pkl")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if stored_key != key:
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # the disk tier is best effort
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# --------------------- FINGERPRINTS --------------------- #
+_fingerprints = LRUMemo(maxsize=256, directory=None)
+
+
+def dataset_fingerprint(path):
+    """
+    Content hash of a cache file.
+
+    The hash is remembered per (path, size, mtime), in memory and on disk, so
+    an unchanged file is only read once.
+    """
+    stat = os.stat(path)
+    # Remembered in the hits memo's disk tier alongside the hits themselves
+    stat_key = ("fingerprint", os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    fingerprint = _fingerprints.get(stat_key) or hits_memo.get(stat_key)
+    if fingerprint is None:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()
+        hits_memo.put(stat_key, fingerprint)
+    _fingerprints.put(stat_key, fingerprint)
+    return fingerprint
+
+
+def selection_key(selected_words):
+    """Normalized, order-independent form of a {tier: [words]} selection."""
+    return tuple(sorted(
+        (tier, normalize_keyword(word))
+        for tier, words in selected_words.items() for word in words if normalize_keyword(word)
+    ))
+
+
+# Hit rows per (dataset, keyword) and compact results per (dataset, selection)
+hits_memo = LRUMemo(maxsize=4096)
+results_memo = LRUMemo(maxsize=32)
+
+
+def keyword_hits(fingerprint, keyword, index, texts=None):
+    """Sorted rows whose abstract contains `keyword`, memoized per dataset."""
+    key = ("hits", fingerprint, normalize_keyword(keyword), MATCHER_VERSION)
+    rows = hits_memo.get(key)
+    if rows is None:
+        rows = index.lookup(keyword, texts)
+        hits_memo.put(key, rows)
+    return rows
+
+
+def _compact_results(selected_words, rows_by_word, amounts):
+    """
+    {tier: [(row, amount, matched_words)]} sorted by amount, exactly as the
+    analysis engine orders its results (rows ascending, then a stable sort).
+    """
+    compact = {}
+    for tier, words in selected_words.items():
+        matched = {}
+        seen = set()
+        for word in words:
+            key = normalize_keyword(word)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            for row in rows_by_word[key]:
+                matched.setdefault(row, []).append(word)
+        entries = [(row, amounts[row], matched[row]) for row in sorted(matched)]
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        compact[tier] = entries
+    return compact
+
+
+def analyze_year(year, selected_words, progress=None, cancel_event=None):
+    """
+    Memoized analysis of a year's completed cache for {tier: [words]}.
+
+    Returns Analysis(results, totals, scanned) with the same `results` the
+    analysis engine produces; `scanned` is the number of awards covered.
+    Like analyze_years, an award cached twice within the year is analyzed
+    once, from the copy nsf_merge keeps.
+    On a memo miss, `progress(done, total, matches)` is called after every
+    keyword looked up with the running count of matched awards per tier,
+    and a set `cancel_event` raises AnalysisCancelled between keywords.
+    """
+    import nsf_index
+    import nsf_merge
+    import nsf_store
+
+    cache_file = nsf_cache.find_cache(year)
+    if cache_file is None:
+        raise FileNotFoundError(f"No complete award cache for {year}")
+    fingerprint = dataset_fingerprint(cache_file)
+    store = nsf_store.ensure_store(year)
+    dropped = nsf_merge.open_merge([year]).excluded_rows([year]).get(int(year), set())
+
+    key = ("analysis", fingerprint, selection_key(selected_words), tuple(sorted(dropped)), MATCHER_VERSION)
+    memo = results_memo.get(key)
+    if memo is not None:
+        nsf_metrics.count("memo_hits")
+    else:
+        nsf_metrics.count("memo_misses")
+        with nsf_metrics.stage("analysis.index"):
+            index = nsf_index.index_for_file(cache_file)
+            texts = nsf_store.LazyTexts(store)
+            keywords = list(dict.fromkeys(normalize_keyword(word)
+                                          for words in selected_words.values() for word in words))
+            tiers_of = {}
+            for tier, words in selected_words.items():
+                for word in words:
+                    tiers_of.setdefault(normalize_keyword(word), set()).add(tier)
+            rows_by_word = {}
+            matched = {tier: set() for tier in selected_words}
+            for keyword in keywords:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise AnalysisCancelled()
+                rows_by_word[keyword] = keyword_hits(fingerprint, keyword, index, texts)
+                if dropped:
+                    rows_by_word[keyword] = [row for row in rows_by_word[keyword] if row not in dropped]
+                if progress is not None:
+                    for tier in tiers_of[keyword]:
+                        matched[tier].update(rows_by_word[keyword])
+                    progress(len(rows_by_word), len(keywords),
+                             {tier: len(rows) for tier, rows in matched.items()})
+            rows = sorted(set().union(*rows_by_word.values())) if rows_by_word else []
+            table = nsf_store.read_table(store, [AMOUNT_FIELD])
+            amounts = {row: Award.from_record(award).amount
+                       for row, award in zip(rows, nsf_store.take_rows(table, rows))}
+            memo = (index.size - len(dropped), _compact_results(selected_words, rows_by_word, amounts))
+        results_memo.put(key, memo)
+
+    size, compact = memo
+    with nsf_metrics.stage("analysis.materialize"):
+        analysis = materialize(store, size, compact)
+    nsf_metrics.count("awards_scanned", size)
+    nsf_metrics.count_keywords(analysis.results)
+    return analysis
+
+
+def materialize(store, size, compact):
+    """Turn a compact memo back into full results, reading only the matched rows."""
+    import nsf_store
+
+    rows = sorted({row for entries in compact.values() for row, _, _ in entries})
+    table = nsf_store.read_table(store, ANALYSIS_COLUMNS)
+    awards = dict(zip(rows, nsf_store.take_rows(table, rows)))
+
+    results = empty_results()
+    for tier, entries in compact.items():
+        tier_results = results.setdefault(tier, [])
+        for row, amount, matched_words in entries:
+            award = awards[row]
+            tier_results.append({
+                "id": award.get("id", ""),
+                "title": award.get("title", ""),
+                "awardee": award.get("awardeeName", ""),
+                "amount": amount,
+                "abstract": award.get("abstractText") or "",
+                "matched_words": list(matched_words)
+            })
+    totals = {tier: sum(award["amount"] for award in awards) for tier, awards in results.items()}
+    return Analysis(results, totals, size)
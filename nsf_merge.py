@@ -0,0 +1,212 @@
+"""
+Cross-year deduplication of awards by id.
+
+The API's date filters can return the same award in more than one year, so
+a sweep over several years would count its funding once per copy. The
+merge index maps every award id to the (year, row) positions where it is
+stored and decides which copy wins:
+
+    the copy from the most recently fetched cache (the newest amendment);
+    between caches fetched at the same time, the later year; within one
+    year, the later row.
+
+The index lives in awards_merged.idx next to the year folders and is kept
+up to date incrementally: each year's store is stamped, and only years whose
+store changed (or that are new) are re-read when the index is opened, or
+when the downloader finishes a year. Winners are resolved for the years a
+sweep actually covers, so a sweep over 2020-2022 never loses an award to a
+copy in 2023.
+
+    merge = open_merge([2021, 2022, 2023])
+    merge.kept_rows(2022, years)   # rows of 2022 that are not duplicates
+    merge.table(years, columns)    # one deduplicated Arrow table
+"""
+import os
+import pickle
+import threading
+
+import pyarrow as pa
+
+import nsf_cache
+import nsf_store
+
+MERGE_INDEX_PATH = "awards_merged.idx"
+MERGE_VERSION = 1
+
+# Positions are packed as year << 32 | row, so a single copy costs one int
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+_lock = threading.Lock()
+
+
+def _pack(year, row):
+    return (int(year) << _ROW_BITS) | row
+
+
+def _unpack(position):
+    return position >> _ROW_BITS, position & _ROW_MASK
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _rank(year):
+    """Sort key of a year's copies: when its cache was fetched, then the year itself."""
+    manifest = nsf_cache.load_manifest(year) or {}
+    return manifest.get("fetched_at") or manifest.get("started_at") or "", int(year)
+
+
+class MergeIndex:
+    """
+    award id -> positions of its copies, plus the ids of every merged year.
+
+    `owners` maps an id to one packed position, or to a tuple of positions
+    when the award is stored more than once.
+    """
+
+    def __init__(self):
+        self.years = {}    # year -> {"stamp", "rank", "ids"}
+        self.owners = {}
+
+    # --------------------- MAINTENANCE --------------------- #
+    def _add(self, award_id, position):
+        current = self.owners.get(award_id)
+        if current is None:
+            self.owners[award_id] = position
+        elif isinstance(current, tuple):
+            self.owners[award_id] = current + (position,)
+        else:
+            self.owners[award_id] = (current, position)
+
+    def _remove_year(self, year):
+        entry = self.years.pop(year, None)
+        if entry is None:
+            return
+        for award_id in set(entry["ids"]):
+            current = self.owners.get(award_id)
+            if isinstance(current, tuple):
+                rest = tuple(p for p in current if _unpack(p)[0] != year)
+                if len(rest) > 1:
+                    self.owners[award_id] = rest
+                elif rest:
+                    self.owners[award_id] = rest[0]
+                else:
+                    del self.owners[award_id]
+            elif current is not None:
+                del self.owners[award_id]
+
+    def update_year(self, year, store=None):
+        """(Re)merge one year from its store. Returns True if anything changed."""
+        year = int(year)
+        store = store or nsf_store.ensure_store(year)
+        stamp, rank = _stamp(store), _rank(year)
+        entry = self.years.get(year)
+        if entry is not None and entry["stamp"] == stamp and entry["rank"] == rank:
+            return False
+        ids = nsf_store.read_table(store, ["id"]).column(0).to_pylist()
+        self._remove_year(year)
+        for row, award_id in enumerate(ids):
+            self._add(award_id, _pack(year, row))
+        self.years[year] = {"stamp": stamp, "rank": rank, "ids": ids}
+        return True
+
+    def refresh(self, years):
+        """Bring the given years up to date, merging only those whose store changed. Returns the years updated."""
+        return [year for year in years if self.update_year(year)]
+
+    # --------------------- QUERIES --------------------- #
+    def duplicates(self):
+        """{id: [(year, row), ...]} for every award stored more than once."""
+        return {award_id: [_unpack(p) for p in positions]
+                for award_id, positions in self.owners.items() if isinstance(positions, tuple)}
+
+    def positions(self, award_id):
+        """[(year, row), ...] of every cached copy of an award, oldest year first."""
+        positions = self.owners.get(award_id, ())
+        return sorted(_unpack(p) for p in (positions if isinstance(positions, tuple) else (positions,)))
+
+    def excluded_rows(self, years):
+        """
+        {year: set(rows)} of the copies that lose to another copy within
+        `years`. Only duplicated ids are looked at, so this is cheap.
+        """
+        years = {int(year) for year in years}
+        ranks = {year: self.years[year]["rank"] for year in years if year in self.years}
+        excluded = {}
+        for positions in self.owners.values():
+            if not isinstance(positions, tuple):
+                continue
+            copies = [_unpack(p) for p in positions]
+            copies = [(year, row) for year, row in copies if year in ranks]
+            if len(copies) < 2:
+                continue
+            winner = max(copies, key=lambda copy: (ranks[copy[0]], copy[1]))
+            for copy in copies:
+                if copy != winner:
+                    excluded.setdefault(copy[0], set()).add(copy[1])
+        return excluded
+
+    def kept_rows(self, year, years, excluded=None):
+        """Sorted rows of `year` that survive deduplication across `years`."""
+        if excluded is None:
+            excluded = self.excluded_rows(years)
+        dropped = excluded.get(int(year), ())
+        return [row for row in range(len(self.years[int(year)]["ids"])) if row not in dropped]
+
+    def table(self, years, columns=None):
+        """One Arrow table over `years` with each award once (plus a `year` column)."""
+        excluded = self.excluded_rows(years)
+        tables = []
+        for year in years:
+            table = nsf_store.read_table(nsf_store.ensure_store(year), columns)
+            if excluded.get(int(year)):
+                table = table.take(pa.array(self.kept_rows(year, years, excluded), pa.uint32()))
+            tables.append(table.append_column("year", pa.array([int(year)] * table.num_rows, pa.int16())))
+        if not tables:
+            return nsf_store.open_years([], columns)
+        return pa.concat_tables(tables)
+
+    @property
+    def size(self):
+        """Distinct awards across every merged year."""
+        return len(self.owners)
+
+    # --------------------- PERSISTENCE --------------------- #
+    def save(self, path=MERGE_INDEX_PATH):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((MERGE_VERSION, self.years, self.owners), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=MERGE_INDEX_PATH):
+        """The saved index, or an empty one if it is missing, unreadable or from another version."""
+        merge = cls()
+        try:
+            with open(path, "rb") as f:
+                version, years, owners = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return merge
+        if version == MERGE_VERSION:
+            merge.years, merge.owners = years, owners
+        return merge
+
+
+def open_merge(years, path=MERGE_INDEX_PATH):
+    """
+    The merge index with `years` up to date. Years already merged from an
+    unchanged store are not read again; the index is saved only if it changed.
+    """
+    with _lock:
+        merge = MergeIndex.load(path)
+        if merge.refresh(years):
+            merge.save(path)
+        return merge
+
+
+def update_year(year, path=MERGE_INDEX_PATH):
+    """Merge a freshly downloaded year into the saved index. Returns the index."""
+    return open_merge([year], path)
@@ -0,0 +1,258 @@
+"""
+Run instrumentation: per-stage timers, counters and peak memory.
+
+    with nsf_metrics.collect() as metrics:
+        with nsf_metrics.stage("fetch.request"):
+            ...
+        nsf_metrics.count("pages_fetched")
+    print(metrics.format_summary())
+    metrics.export("run_profile.json")
+
+Instrumented code calls the module-level stage() and count() helpers, which
+do nothing unless a collector is active, so the hooks are close to free when
+nobody is measuring. While a collector is active it is shared by every
+thread (fetch workers, scheduler years, the GUI's worker); stage times are
+summed per stage, so stages that run on several threads at once can add up
+to more than the wall time. Work done inside analysis worker processes is
+timed by the parent around the whole scan.
+
+Stages and counters used across the suite:
+
+    fetch.request   waiting on the API (per request)      requests, retries, bytes_received
+    fetch.parse     decoding the API's JSON               pages_fetched, awards_fetched
+    download.*      checkpoint writes, CSV, store, index
+    analysis.*      scanning, memo lookups                awards_scanned, matches, keyword hits
+    render          filling the results table (GUI)
+    report.*        writing reports                       report_awards
+
+Exported profiles are JSON with the summary plus the individual stage spans
+as "traceEvents", so a profile opens directly in chrome://tracing or
+Perfetto.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource  # Unix only; peak RSS
+except ImportError:
+    resource = None
+
+# Stage spans kept for the exported trace; totals are always complete
+MAX_EVENTS = 100000
+
+# The GUIs export every run's profile here when it is set
+PROFILE_PATH = os.environ.get("NSF_PROFILE")
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """Stage timers, counters and keyword hits for one run. Thread-safe."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.started = None
+        self.finished = None
+        self.stages = {}           # name -> [seconds, calls]
+        self.counters = Counter()
+        self.keywords = Counter()  # keyword -> awards matched
+        self.events = []
+        self.dropped_events = 0
+        self.peak_traced = None
+        self._owns_tracing = False
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    # --------------------- COLLECTING --------------------- #
+    def start(self):
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            elif hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+
+    def stop(self):
+        self.finished = time.time()
+        if self.trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                self.peak_traced = tracemalloc.get_traced_memory()[1]
+                if self._owns_tracing:
+                    tracemalloc.stop()
+                    self._owns_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, start)
+
+    def add_time(self, name, seconds, start=None):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+            if start is not None:
+                if len(self.events) < MAX_EVENTS:
+                    self.events.append((name, start - self._origin, seconds, threading.get_ident()))
+                else:
+                    self.dropped_events += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def count_keywords(self, results):
+        """Add the awards matched per keyword (and the matches) from analysis results."""
+        hits = Counter()
+        matches = 0
+        for awards in results.values():
+            matches += len(awards)
+            for award in awards:
+                hits.update(award.get("matched_words") or ())
+        with self._lock:
+            self.keywords.update(hits)
+            self.counters["matches"] += matches
+
+    # --------------------- REPORTING --------------------- #
+    def summary(self):
+        """The run as a plain dict (JSON-serializable)."""
+        end = self.finished or time.time()
+        with self._lock:
+            stages = {name: {"seconds": round(seconds, 6), "calls": calls}
+                      for name, (seconds, calls) in sorted(self.stages.items(), key=lambda kv: -kv[1][0])}
+            counters = dict(sorted(self.counters.items()))
+            keywords = dict(self.keywords.most_common())
+        return {
+            "started_at": self.started,
+            "wall_seconds": round(end - self.started, 6) if self.started else None,
+            "stages": stages,
+            "counters": counters,
+            "keyword_hits": keywords,
+            "peak_rss_bytes": _peak_rss(),
+            "peak_traced_bytes": self.peak_traced,
+        }
+
+    def format_summary(self, top_keywords=10):
+        """A few human-readable lines for a log pane or stderr."""
+        summary = self.summary()
+        lines = ["Run metrics:"]
+        if summary["wall_seconds"] is not None:
+            lines.append(f"  wall time            {summary['wall_seconds']:10.2f} s")
+        for name, stage in summary["stages"].items():
+            lines.append(f"  {name:20s} {stage['seconds']:10.2f} s  ({stage['calls']:,} calls)")
+        for name, value in summary["counters"].items():
+            value = f"{value / 1e6:,.1f} MB" if name.endswith("bytes_received") else f"{value:,}"
+            lines.append(f"  {name:20s} {value:>10s}")
+        if summary["keyword_hits"]:
+            top = list(summary["keyword_hits"].items())[:top_keywords]
+            lines.append("  top keywords         " + ", ".join(f"{word} ({n:,})" for word, n in top))
+        for key, label in (("peak_rss_bytes", "peak memory"), ("peak_traced_bytes", "peak Python heap")):
+            if summary[key]:
+                lines.append(f"  {label:20s} {summary[key] / 1e6:10.1f} MB")
+        return "\n".join(lines)
+
+    def export(self, path):
+        """Write the summary and stage spans as a JSON profile (Chrome trace format)."""
+        with self._lock:
+            events = list(self.events)
+        threads = {}
+        trace = []
+        for name, start, seconds, thread in events:
+            tid = threads.setdefault(thread, len(threads) + 1)
+            trace.append({"name": name, "cat": name.split(".")[0], "ph": "X", "pid": os.getpid(), "tid": tid,
+                          "ts": round(start * 1e6, 1), "dur": round(seconds * 1e6, 1)})
+        document = {"summary": self.summary(), "dropped_events": self.dropped_events,
+                    "traceEvents": trace, "displayTimeUnit": "ms"}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=1)
+            f.write("\n")
+        os.replace(tmp_path, path)
+        return path
+
+
+# --------------------- ACTIVE COLLECTOR --------------------- #
+_active = None
+
+
+@contextmanager
+def collect(metrics=None, trace_memory=False):
+    """Activate a collector (a new Metrics unless one is given) for the duration of the block."""
+    global _active
+    metrics = metrics or Metrics(trace_memory=trace_memory)
+    previous = _active
+    _active = metrics
+    metrics.start()
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
+        _active = previous
+
+
+def active():
+    """The active collector, or None."""
+    return _active
+
+
+@contextmanager
+def _no_stage():
+    yield
+
+
+def stage(name):
+    """Context manager timing a block under `name` when a collector is active."""
+    metrics = _active
+    return metrics.stage(name) if metrics is not None else _no_stage()
+
+
+def count(name, n=1):
+    metrics = _active
+    if metrics is not None:
+        metrics.count(name, n)
+
+
+def count_keywords(results):
+    metrics = _active
+    if metrics is not None:
+        metrics.count_keywords(results)
+
+
+def export_profile(metrics, path=None):
+    """Export to `path` (default: $NSF_PROFILE). Returns the path written, or None."""
+    path = path or PROFILE_PATH
+    if not path:
+        return None
+    return metrics.export(path)
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,316 @@
+"""
+Report writers for analysis results (JSON, CSV and PDF).
+
+Every writer takes the `results` mapping produced by nsf_analysis
+({tier: [award result, ...]}, each tier sorted by amount), never text
+scraped from a widget. PDF reports are written award by award from lazily
+generated sections (summary, top N overall, per tier) and can be split
+into volumes so that very large reports build in bounded memory. fpdf is
+only imported when a PDF is actually written.
+"""
+import csv
+import heapq
+import json
+import os
+from datetime import datetime
+
+import nsf_metrics
+
+CSV_FIELDS = ["tier", "year", "id", "title", "awardee", "amount", "matched_words"]
+
+
+def summarize(results):
+    """{tier: {"count", "total_funding"}} for every tier with matches."""
+    return {
+        tier: {"count": len(awards), "total_funding": sum(award["amount"] for award in awards)}
+        for tier, awards in results.items() if awards
+    }
+
+
+def _award_row(award, abstracts):
+    row = {key: value for key, value in award.items() if key != "abstract"}
+    if abstracts:
+        row["abstract"] = award.get("abstract", "")
+    return row
+
+
+@nsf_metrics.timed("report.json")
+def write_json(results, f, years=None, keywords=None, abstracts=True):
+    """Write results as one JSON document to an open text file."""
+    document = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "years": list(years) if years is not None else None,
+        "keywords": keywords,
+        "summary": summarize(results),
+        "results": {
+            tier: [_award_row(award, abstracts) for award in awards]
+            for tier, awards in results.items() if awards
+        },
+    }
+    json.dump(document, f, indent=2, ensure_ascii=False)
+    f.write("\n")
+
+
+@nsf_metrics.timed("report.csv")
+def write_csv(results, f, abstracts=False):
+    """Write one CSV row per (tier, award) match to an open text file."""
+    fields = CSV_FIELDS + (["abstract"] if abstracts else [])
+    writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for tier, awards in results.items():
+        for award in awards:
+            row = dict(award, tier=tier, matched_words="; ".join(award["matched_words"]))
+            writer.writerow(row)
+
+
+def _latin1(text):
+    # The core PDF fonts only cover latin-1; replace anything else
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+
+def top_awards(awards, n):
+    """The n highest-funded awards of any iterable, in bounded memory (all of them when n is None)."""
+    if n is None:
+        return sorted(awards, key=lambda award: award["amount"], reverse=True)
+    return heapq.nlargest(n, awards, key=lambda award: award["amount"])
+
+
+def _overall(results):
+    """Each matched award once, with the tiers it matched in."""
+    seen = {}
+    for tier, awards in results.items():
+        for award in awards:
+            key = (award.get("year"), award["id"])
+            if key in seen:
+                seen[key]["tiers"].append(tier)
+            else:
+                seen[key] = dict(award, tiers=[tier])
+    return seen.values()
+
+
+def report_sections(results, top_n=None, overall_top=None, per_tier=True):
+    """
+    (heading, awards) sections of a report, generated lazily.
+
+    overall_top -- a "Top N Overall" section across all tiers
+    per_tier    -- one section per tier, limited to top_n awards each
+    Tier results from the analysis engine are already sorted by amount, so
+    their sections are sliced rather than re-sorted.
+    """
+    if overall_top:
+        yield f"Top {overall_top} Overall", top_awards(_overall(results), overall_top)
+    if per_tier:
+        for tier, awards in results.items():
+            if awards:
+                heading = f"{tier} Matches" if top_n is None else f"{tier} - Top {min(top_n, len(awards))}"
+                yield heading, awards if top_n is None else awards[:top_n]
+
+
+class _PDFBuffer:
+    """
+    Append-only stand-in for the string buffer of fpdf 1.7, which otherwise
+    copies the whole document on every write while it is being assembled.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+
+    def __iadd__(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+        return self
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return "".join(self.parts)
+
+    def encode(self, encoding):
+        return str(self).encode(encoding)
+
+
+class PDFReport:
+    """
+    PDF writer that adds awards one at a time and splits long reports into
+    volumes ({name}_part2.pdf, ...) of at most `max_awards_per_file` awards.
+    FPDF keeps a whole document in memory until it is written, so volumes are
+    what bound the memory of a very large report.
+    """
+
+    def __init__(self, path, title, max_awards_per_file=None, abstract_chars=None):
+        self.path = path
+        self.title = title
+        self.max_awards = max_awards_per_file
+        self.abstract_chars = abstract_chars
+        self.paths = []
+        self.pdf = None
+        self.in_volume = 0
+        self._word_widths = {}
+        self._new_volume()
+
+    def _volume_path(self):
+        if not self.paths:
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return f"{base}_part{len(self.paths) + 1}{ext or '.pdf'}"
+
+    def _new_volume(self):
+        from fpdf import FPDF  # pip install fpdf
+
+        self.pdf = FPDF()
+        if isinstance(getattr(self.pdf, "buffer", None), str):
+            self.pdf.buffer = _PDFBuffer()
+        self.pdf.set_auto_page_break(True, margin=15)
+        self.pdf.add_page()
+        self.pdf.set_font("Arial", "B", 16)
+        part = f" (part {len(self.paths) + 1})" if self.paths else ""
+        self.pdf.cell(0, 10, _latin1(self.title + part), ln=True, align="C")
+        self.pdf.set_font("Arial", "", 10)
+        self.pdf.cell(0, 8, f"Generated {datetime.now():%Y-%m-%d %H:%M}", ln=True, align="C")
+        self.pdf.ln(5)
+        self.in_volume = 0
+
+    def _flush(self):
+        path = self._volume_path()
+        with nsf_metrics.stage("report.output"):
+            self.pdf.output(path)
+        self.paths.append(path)
+        self.pdf = None
+
+    def summary(self, results):
+        pdf = self.pdf
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, "Summary", ln=True)
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(80, 8, "Tier", border=1)
+        pdf.cell(35, 8, "Awards", border=1)
+        pdf.cell(60, 8, "Total Funding", border=1, ln=True)
+        pdf.set_font("Arial", "", 11)
+        for tier, stats in summarize(results).items():
+            pdf.cell(80, 8, _latin1(tier), border=1)
+            pdf.cell(35, 8, f"{stats['count']:,}", border=1)
+            pdf.cell(60, 8, f"${stats['total_funding']:,.2f}", border=1, ln=True)
+        pdf.ln(5)
+
+    def ranking(self, heading, awards):
+        """A compact rank / awardee / funding / title table."""
+        pdf = self.pdf
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, _latin1(heading), ln=True)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(20, 10, "Rank", border=1)
+        pdf.cell(50, 10, "Awardee", border=1)
+        pdf.cell(40, 10, "Funding", border=1)
+        pdf.cell(80, 10, "Title", border=1, ln=True)
+        pdf.set_font("Arial", "", 12)
+        for rank, award in enumerate(awards, 1):
+            pdf.cell(20, 10, str(rank), border=1)
+            pdf.cell(50, 10, _latin1(str(award["awardee"])[:20]), border=1)  # truncated
+            pdf.cell(40, 10, f"${award['amount']:,.2f}", border=1)
+            pdf.cell(80, 10, _latin1(str(award["title"])[:30]), border=1, ln=True)  # truncated
+        pdf.ln(5)
+
+    def section(self, heading, awards, rank=False):
+        """Stream a section's awards into the document, starting new volumes as needed."""
+        self._heading(heading)
+        for i, award in enumerate(awards, 1):
+            if self.max_awards and self.in_volume >= self.max_awards:
+                self._flush()
+                self._new_volume()
+                self._heading(f"{heading} (continued)")
+            self.award(award, i if rank else None)
+
+    def _heading(self, heading):
+        self.pdf.set_font("Arial", "B", 14)
+        self.pdf.cell(0, 10, _latin1(heading), ln=True)
+        self.pdf.ln(2)
+
+    def paragraph(self, text, h=6):
+        """
+        Word-wrapped text, like multi_cell but measured a word at a time.
+
+        Word widths are cached per font, and abstracts reuse most of their
+        vocabulary, so long abstracts wrap far faster than fpdf's
+        character-by-character multi_cell. Text with a word wider than the
+        page falls back to multi_cell, which can break inside words.
+        """
+        pdf = self.pdf
+        text = _latin1(text)
+        max_width = pdf.w - pdf.l_margin - pdf.r_margin - 2 * getattr(pdf, "c_margin", 1)
+        widths = self._word_widths.setdefault((pdf.font_family, pdf.font_style, pdf.font_size_pt), {})
+        space = pdf.get_string_width(" ")
+        lines = []
+        for para in text.split("\n"):
+            line, line_width = [], 0.0
+            for word in para.split():
+                width = widths.get(word)
+                if width is None:
+                    width = widths[word] = pdf.get_string_width(word)
+                    if width > max_width:
+                        pdf.multi_cell(0, h, text)
+                        return
+                if line and line_width + space + width > max_width:
+                    lines.append(" ".join(line))
+                    line, line_width = [], 0.0
+                line_width += width + (space if line else 0)
+                line.append(word)
+            lines.append(" ".join(line))
+        for line in lines:
+            pdf.cell(0, h, line, ln=1)
+
+    def award(self, award, rank=None):
+        pdf = self.pdf
+        pdf.set_font("Arial", "B", 11)
+        prefix = f"#{rank} - " if rank is not None else "Title: "
+        pdf.multi_cell(0, 6, _latin1(f"{prefix}{award['title']}"))
+        pdf.set_font("Arial", "", 10)
+        year = f" ({award['year']})" if award.get("year") is not None else ""
+        pdf.multi_cell(0, 6, _latin1(f"Award {award['id']}{year} - Awardee: {award['awardee']}"))
+        pdf.multi_cell(0, 6, f"Amount: ${award['amount']:,.2f}")
+        if award.get("tiers"):
+            pdf.multi_cell(0, 6, _latin1(f"Tiers: {', '.join(award['tiers'])}"))
+        if award.get("matched_words"):
+            pdf.multi_cell(0, 6, _latin1(f"Matched Words: {', '.join(award['matched_words'])}"))
+        abstract = str(award.get("abstract") or "")
+        if self.abstract_chars is not None and len(abstract) > self.abstract_chars:
+            abstract = abstract[:self.abstract_chars].rstrip() + "..."
+        if abstract:
+            self.paragraph(f"Abstract: {abstract}")
+        pdf.ln(3)
+        self.in_volume += 1
+        nsf_metrics.count("report_awards")
+
+    def close(self):
+        """Write the last volume. Returns the paths of every volume written."""
+        if self.pdf is not None:
+            self._flush()
+        return self.paths
+
+
+@nsf_metrics.timed("report.pdf")
+def write_pdf(results, path, title="NSF Awards Analysis Report", top_n=None, overall_top=None,
+              per_tier=True, max_awards_per_file=None, abstract_chars=None):
+    """
+    Write a PDF report from structured results: a summary table, an optional
+    "Top N Overall" section and one section per tier (top_n awards each).
+    Returns the list of files written (more than one when the report is
+    split into volumes by max_awards_per_file).
+    """
+    report = PDFReport(path, title, max_awards_per_file, abstract_chars)
+    report.summary(results)
+    for heading, awards in report_sections(results, top_n, overall_top, per_tier):
+        report.section(heading, awards, rank=top_n is not None or heading.startswith("Top "))
+    return report.close()
+
+
+@nsf_metrics.timed("report.pdf")
+def write_top_report(awards, path, n=10, title=None):
+    """The classic top-N report: a ranking table followed by the full abstracts."""
+    top = top_awards(awards, n)
+    report = PDFReport(path, title or f"Top {n} Most-Funded Projects Report")
+    report.ranking("Ranking", top)
+    report.pdf.add_page()
+    report.section("Full Abstracts", top, rank=True)
+    return report.close()
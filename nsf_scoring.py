@@ -0,0 +1,157 @@
+"""
+Vectorized red flag scoring and funding aggregation.
+
+The keyword index already knows which awards mention each keyword, so a
+sparse award x keyword hit matrix is assembled straight from its postings,
+without rescanning any abstract. Everything else is matrix and pandas
+arithmetic over that matrix:
+
+    scores         weighted tier score per award (hits @ keyword weights)
+    tier_hits      award x tier matrix of keyword counts
+    tier_totals    funding of the awards flagged in each tier
+    keyword_totals funding of the awards mentioning each keyword
+    rollup()       the same per awardee, program or program officer
+
+Awards cached in more than one year are scored once (see nsf_merge).
+
+Needs numpy, pandas, pyarrow and scipy.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from scipy import sparse
+
+import nsf_index
+import nsf_merge
+import nsf_store
+from nsf_award import AMOUNT_FIELD
+from nsf_keywords import RED_FLAG_WORDS, TIER_WEIGHTS
+from nsf_matcher import normalize_keyword
+
+AMOUNT_COLUMN = AMOUNT_FIELD
+GROUP_COLUMNS = ("awardeeName", "primaryProgram", "poName")
+FRAME_COLUMNS = ["id", "awardeeName", "primaryProgram", "poName", AMOUNT_COLUMN]
+
+Scores = namedtuple("Scores", ["frame", "hits", "keywords", "tier_hits", "tier_totals", "keyword_totals"])
+
+
+def keyword_columns(selected_words):
+    """(keywords, tiers, weights) with one entry per (tier, keyword) column."""
+    keywords, tiers, weights = [], [], []
+    for tier, words in selected_words.items():
+        seen = set()
+        for word in words:
+            key = normalize_keyword(word)
+            if key and key not in seen:
+                seen.add(key)
+                keywords.append(word)
+                tiers.append(tier)
+                weights.append(TIER_WEIGHTS.get(tier, 1))
+    return keywords, tiers, np.asarray(weights, dtype=np.float64)
+
+
+def hit_matrix(postings, n_awards):
+    """CSC award x keyword matrix (1 = the award mentions the keyword) from sorted row postings."""
+    indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([len(rows) for rows in postings], out=indptr[1:])
+    # array('I') postings convert through the buffer protocol without a copy loop
+    indices = np.concatenate([np.asarray(rows, dtype=np.int32) for rows in postings] or [np.empty(0, np.int32)])
+    data = np.ones(len(indices), dtype=np.float64)
+    return sparse.csc_matrix((data, indices, indptr), shape=(n_awards, len(postings)))
+
+
+def score_years(years, selected_words=None, amount_column=AMOUNT_COLUMN, dedupe=True):
+    """
+    Score every award of the given (completed) years. With dedupe, an award
+    cached in more than one year appears once, from its newest copy.
+
+    Returns Scores:
+      frame          DataFrame with one row per award: year, id, awardee,
+                     program, officer, amount, score and one flag per tier
+      hits           sparse award x keyword matrix (rows follow `frame`)
+      keywords       the matrix columns as (tier, keyword) pairs
+      tier_hits      award x tier keyword counts (dense, small)
+      tier_totals    Series: funding of flagged awards per tier
+      keyword_totals Series indexed by (tier, keyword): funding per keyword
+    """
+    if selected_words is None:
+        selected_words = RED_FLAG_WORDS
+    keywords, tiers, weights = keyword_columns(selected_words)
+    columns = FRAME_COLUMNS if amount_column in FRAME_COLUMNS else FRAME_COLUMNS + [amount_column]
+
+    merge = nsf_merge.open_merge(years) if dedupe else None
+    excluded = merge.excluded_rows(years) if merge else {}
+
+    frames, blocks = [], []
+    for year in years:
+        store = nsf_store.ensure_store(year)
+        table = nsf_store.read_table(store, columns)
+        index = nsf_index.open_index(year)
+        # Only unseen multi-word phrases ever need the abstracts
+        texts = nsf_store.LazyTexts(store)
+        postings = [index.lookup(word, texts) for word in keywords]
+        block = hit_matrix(postings, table.num_rows)
+        if excluded.get(int(year)):
+            # Typed explicitly: a year whose every award is newer elsewhere keeps no rows
+            kept = np.asarray(merge.kept_rows(year, years, excluded), dtype=np.int64)
+            block = block[kept] if len(kept) else sparse.csc_matrix((0, len(keywords)))
+            table = table.take(pa.array(kept, pa.uint32()))
+        blocks.append(block)
+        frame = table.to_pandas()
+        frame.insert(0, "year", np.int16(int(year)))
+        frames.append(frame)
+
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["year"] + columns)
+    hits = sparse.vstack(blocks, format="csr") if blocks else sparse.csr_matrix((0, len(keywords)))
+    amounts = frame[amount_column].fillna(0).to_numpy(dtype=np.float64)
+
+    # Keyword -> tier indicator, so tier counts are one sparse product
+    tier_names = list(dict.fromkeys(tiers))
+    tier_of = np.array([tier_names.index(t) for t in tiers], dtype=np.int64)
+    to_tier = sparse.csr_matrix((np.ones(len(tiers)), (np.arange(len(tiers)), tier_of)),
+                                shape=(len(tiers), len(tier_names)))
+    tier_hits = np.asarray((hits @ to_tier).todense())
+
+    frame["amount"] = amounts
+    frame["score"] = hits @ weights if len(keywords) else 0.0
+    frame["keywords"] = np.asarray(hits.sum(axis=1)).ravel().astype(np.int32)
+    for i, tier in enumerate(tier_names):
+        frame[tier] = tier_hits[:, i] > 0
+
+    flagged = (tier_hits > 0).astype(np.float64)
+    tier_totals = pd.Series(amounts @ flagged, index=pd.Index(tier_names, name="tier"), name="funding")
+    keyword_totals = pd.Series(hits.T @ amounts, index=pd.MultiIndex.from_arrays([tiers, keywords],
+                                                                                 names=["tier", "keyword"]),
+                               name="funding")
+    return Scores(frame, hits, list(zip(tiers, keywords)), tier_hits, tier_totals, keyword_totals)
+
+
+def rollup(scores, by, top=None):
+    """
+    Group the scored awards by one of GROUP_COLUMNS (or any frame column).
+
+    One row per group: awards, flagged awards, total and flagged funding,
+    summed and mean score, and the flagged share of funding. Sorted by
+    flagged funding.
+    """
+    frame = scores.frame
+    flagged = frame["keywords"] > 0
+    grouped = frame.assign(
+        flagged=flagged,
+        flagged_amount=np.where(flagged, frame["amount"], 0.0),
+    ).groupby(frame[by].fillna("(unknown)"), sort=False)
+    result = pd.DataFrame({
+        "awards": grouped.size(),
+        "flagged_awards": grouped["flagged"].sum(),
+        "funding": grouped["amount"].sum(),
+        "flagged_funding": grouped["flagged_amount"].sum(),
+        "score": grouped["score"].sum(),
+        "mean_score": grouped["score"].mean(),
+    })
+    result["flagged_share"] = np.divide(result["flagged_funding"], result["funding"],
+                                        out=np.zeros(len(result)), where=result["funding"].to_numpy() > 0)
+    result = result.sort_values(["flagged_funding", "score"], ascending=False)
+    result.index.name = by
+    return result.head(top) if top else result
@@ -0,0 +1,329 @@
+"""
+"More like this": the abstracts most similar to a given one, across every
+cached year, by TF-IDF cosine similarity.
+
+Each year's abstracts are turned into a sparse term matrix once, from their
+token arrays (see nsf_tokens), and saved next to the year's store:
+
+    awards_{year}/{year}_awards.tf.indptr.npy   \\
+    awards_{year}/{year}_awards.tf.rows.npy      > SciPy CSC matrix, awards x vocabulary,
+    awards_{year}/{year}_awards.tf.weights.npy  /  weights 1 + log(term count)
+    awards_{year}/{year}_awards.tf.json          what the matrix was built from
+
+The vocabulary is shared and append-only, so the matrices of different years
+line up column by column and a new year only needs its own matrix. What
+depends on the whole corpus (document frequencies, IDF, every abstract's
+vector length) is small and is kept in awards_similar.npz; it is recomputed
+with a few vectorized passes when a year is added or changes.
+
+A query keeps its MAX_QUERY_TERMS highest-weighted words, as Lucene's
+MoreLikeThis does, and scores every abstract with one sparse product over
+just those columns. Rare words have short columns, so a query touches a
+small part of the corpus and takes milliseconds even at a million awards.
+The best RERANK_POOL candidates are then scored exactly, by the cosine of
+their full TF-IDF vectors (1 for identical abstracts).
+
+    index = open_similar()                 # every completed year in the working directory
+    index.similar_to(2024, 17, k=10)       # [(year, row, score), ...], best first
+    similar_awards(abstract, exclude_id=award_id)
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+import nsf_cache
+import nsf_metrics
+import nsf_tokens
+
+SIMILAR_VERSION = 1
+SIMILAR_PATH = "awards_similar.npz"
+
+MAX_QUERY_TERMS = 40
+RERANK_POOL = 100
+DEFAULT_K = 10
+
+# Columns read for the awards a query returns
+SIMILAR_COLUMNS = ["id", "title", "awardeeName", "fundsObligatedAmt", "abstractText"]
+
+_lock = threading.Lock()
+_index = None
+_word_terms = {}
+
+
+def word_terms(vocab):
+    """Boolean mask over token ids: True for words, False for punctuation."""
+    cached = _word_terms.get(id(vocab))
+    if cached is None or len(cached) < len(vocab):
+        cached = np.fromiter((term[:1].isalnum() or term[:1] == "_" for term in vocab.ids), bool,
+                             count=len(vocab))
+        _word_terms[id(vocab)] = cached
+    return cached
+
+
+# --------------------- TERM MATRICES --------------------- #
+def _paths(store):
+    base = store[:-len(".arrow")] if store.endswith(".arrow") else os.path.splitext(store)[0]
+    return {"indptr": base + ".tf.indptr.npy", "rows": base + ".tf.rows.npy",
+            "weights": base + ".tf.weights.npy", "metadata": base + ".tf.json"}
+
+
+def build_terms(store, arrays=None):
+    """Build and save the year's awards x vocabulary term matrix. Returns it (CSC)."""
+    from scipy import sparse
+
+    arrays = arrays or nsf_tokens.tokens_for_store(store)
+    tokens = np.asarray(arrays.tokens)
+    rows = np.repeat(np.arange(arrays.size, dtype=np.int32), np.diff(arrays.offsets))
+    keep = word_terms(arrays.vocab)[tokens]
+    rows, tokens = rows[keep], tokens[keep]
+    # Duplicate (row, term) entries are summed into term counts
+    matrix = sparse.csc_matrix((np.ones(len(tokens), np.float32), (rows, tokens)),
+                               shape=(arrays.size, len(arrays.vocab)))
+    matrix.sum_duplicates()
+    np.log(matrix.data, out=matrix.data)
+    matrix.data += 1
+
+    paths = _paths(store)
+    for name, values in (("indptr", matrix.indptr.astype(np.int64)), ("rows", matrix.indices.astype(np.int32)),
+                         ("weights", matrix.data)):
+        with open(paths[name] + ".tmp", "wb") as f:
+            np.save(f, values)
+        os.replace(paths[name] + ".tmp", paths[name])
+    # Metadata last, so a half-replaced set is never mistaken for a fresh one
+    with open(paths["metadata"] + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(_metadata(arrays, matrix.shape), f, indent=1)
+    os.replace(paths["metadata"] + ".tmp", paths["metadata"])
+    return matrix
+
+
+def _metadata(arrays, shape):
+    return {"tokens": {k: v for k, v in arrays.metadata.items() if k != "vocab_size"},
+            "shape": [int(shape[0]), int(shape[1])], "similar_version": SIMILAR_VERSION}
+
+
+def terms_for_store(store):
+    """The up-to-date term matrix of an Arrow store (memory-mapped), building it if missing or stale."""
+    from scipy import sparse
+
+    arrays = nsf_tokens.tokens_for_store(store)
+    paths = _paths(store)
+    try:
+        with open(paths["metadata"], "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        expected = _metadata(arrays, metadata["shape"])
+    except (OSError, ValueError, KeyError, TypeError):
+        metadata = expected = None
+    if metadata is None or metadata != expected:
+        with nsf_metrics.stage("similar.build"):
+            return build_terms(store, arrays)
+    indptr = np.load(paths["indptr"], mmap_mode="r")
+    rows = np.load(paths["rows"], mmap_mode="r")
+    weights = np.load(paths["weights"], mmap_mode="r")
+    return sparse.csc_matrix((weights, rows, indptr), shape=tuple(metadata["shape"]), copy=False)
+
+
+def open_terms(year):
+    """The up-to-date term matrix of a year's completed cache."""
+    import nsf_store
+
+    return terms_for_store(nsf_store.ensure_store(year))
+
+
+# --------------------- CORPUS --------------------- #
+class SimilarIndex:
+    """Term matrices of several years plus the corpus-wide IDF and vector lengths."""
+
+    def __init__(self, years, matrices, tokens, idf, norms, excluded=None, key=None):
+        self.years = [int(year) for year in years]
+        self.matrices = matrices   # year -> CSC matrix
+        self.tokens = tokens       # year -> TokenArrays, for exact scores
+        self.idf = idf
+        self.norms = norms         # year -> length of every abstract's TF-IDF vector
+        self.excluded = excluded or {}
+        self.key = key
+        self.deduped = bool(excluded)
+
+    @property
+    def size(self):
+        return sum(matrix.shape[0] for matrix in self.matrices.values())
+
+    def _weights(self, term_ids):
+        """(terms, TF-IDF weights) of a bag of token ids."""
+        terms, counts = np.unique(term_ids, return_counts=True)
+        return terms, (1 + np.log(counts)) * self.idf[terms]
+
+    def query(self, term_ids, k=DEFAULT_K, skip=None):
+        """
+        Top `k` abstracts for a bag of token ids, as [(year, row, score)]
+        best first. `skip` is a (year, row) left out (the query itself).
+        """
+        term_ids = np.asarray(term_ids, np.int64)
+        term_ids = term_ids[term_ids < len(self.idf)]
+        if not len(term_ids) or k < 1:
+            return []
+        all_terms, all_weights = self._weights(term_ids)
+        norm = np.sqrt(np.dot(all_weights, all_weights))
+        if not norm:
+            return []
+        terms, weights = all_terms, all_weights
+        if len(terms) > MAX_QUERY_TERMS:
+            strongest = np.argpartition(-weights, MAX_QUERY_TERMS)[:MAX_QUERY_TERMS]
+            terms, weights = terms[strongest], weights[strongest]
+        # Abstract weights are stored without IDF: it goes into the query side
+        vector = weights * self.idf[terms] / norm
+        pool = max(RERANK_POOL, k)
+
+        found = []
+        with nsf_metrics.stage("similar.query"):
+            for year, matrix in self.matrices.items():
+                inside = terms < matrix.shape[1]
+                if not inside.any():
+                    continue
+                scores = matrix[:, terms[inside]] @ vector[inside]
+                norms = self.norms[year]
+                np.divide(scores, norms, out=scores, where=norms > 0)
+                dropped = self.excluded.get(year)
+                if dropped:
+                    scores[list(dropped)] = 0
+                if skip is not None and skip[0] == year:
+                    scores[skip[1]] = 0
+                best = np.argpartition(-scores, pool)[:pool] if len(scores) > pool else np.arange(len(scores))
+                found.extend((float(scores[row]), year, int(row)) for row in best if scores[row] > 0)
+            found = sorted(found, reverse=True)[:pool]
+
+            # The pruned query only ranks candidates; their score is the cosine over every term
+            dense = np.zeros(len(self.idf))
+            dense[all_terms] = all_weights / norm
+            rows, terms = [], []
+            for i, (_, year, row) in enumerate(found):
+                arrays = self.tokens[year]
+                tokens = np.asarray(arrays.row(row))
+                tokens = tokens[word_terms(arrays.vocab)[tokens]]
+                rows.append(np.full(len(tokens), i, np.int64))
+                terms.append(tokens)
+            pairs, counts = np.unique(np.concatenate(rows) * len(self.idf) + np.concatenate(terms) if rows else
+                                      np.zeros(0, np.int64), return_counts=True)
+            candidate, term = np.divmod(pairs, len(self.idf))
+            weights = (1 + np.log(counts)) * self.idf[term] * dense[term]
+            scores = np.bincount(candidate, weights=weights, minlength=len(found))
+            hits = [(year, row, min(float(score / self.norms[year][row]), 1.0))
+                    for (_, year, row), score in zip(found, scores)]
+        hits.sort(key=lambda hit: (-hit[2], hit[0], hit[1]))
+        return hits[:k]
+
+    def similar_to(self, year, row, k=DEFAULT_K):
+        """Top `k` abstracts like the one at (year, row), which is left out."""
+        arrays = self.tokens[int(year)]
+        tokens = np.asarray(arrays.row(row))
+        return self.query(tokens[word_terms(arrays.vocab)[tokens]], k, skip=(int(year), int(row)))
+
+    def similar_text(self, text, k=DEFAULT_K):
+        """Top `k` abstracts like any text; words the corpus has never seen are ignored."""
+        vocab = nsf_tokens.vocabulary()
+        ids = [vocab.ids.get(token) for token in nsf_tokens.tokenize(text or "")]
+        ids = np.array([i for i in ids if i is not None], np.int64)
+        if len(ids):
+            ids = ids[word_terms(vocab)[ids]]
+        return self.query(ids, k)
+
+
+def _corpus(matrices):
+    """(idf, {year: norms}) of a set of term matrices."""
+    width = max((matrix.shape[1] for matrix in matrices.values()), default=0)
+    df = np.zeros(width, np.int64)
+    total = 0
+    for matrix in matrices.values():
+        df[:matrix.shape[1]] += np.diff(matrix.indptr)
+        total += matrix.shape[0]
+    # Smoothed IDF: terms in every abstract still weigh a little
+    idf = (np.log((1 + total) / (1 + df)) + 1).astype(np.float32)
+    norms = {}
+    for year, matrix in matrices.items():
+        columns = np.repeat(np.arange(matrix.shape[1]), np.diff(matrix.indptr))
+        weights = np.asarray(matrix.data, np.float64) * idf[columns]
+        norms[year] = np.sqrt(np.bincount(matrix.indices, weights=weights * weights,
+                                          minlength=matrix.shape[0])).astype(np.float32)
+    return idf, norms
+
+
+def _load_corpus(path, key):
+    try:
+        with np.load(path) as saved:
+            if str(saved["key"]) != key:
+                return None
+            return saved["idf"], {int(name[6:]): saved[name] for name in saved.files if name.startswith("norms_")}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_corpus(path, key, idf, norms):
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, key=np.array(key), idf=idf, **{f"norms_{year}": values for year, values in norms.items()})
+    os.replace(tmp_path, path)
+
+
+def open_similar(years=None, dedupe=True, path=SIMILAR_PATH):
+    """
+    The similarity index over `years` (default: every completed cache).
+    Only years whose store changed are re-read; the corpus statistics are
+    recomputed when the set of matrices changed and saved to `path`. With
+    dedupe, an award cached more than once, in several years or twice in
+    one, is returned once (see nsf_merge).
+    """
+    import nsf_store
+
+    global _index
+    years = sorted(int(year) for year in (years if years is not None else nsf_cache.completed_years()))
+    with _lock:
+        with nsf_metrics.stage("similar.open"):
+            stores = {year: nsf_store.ensure_store(year) for year in years}
+            matrices = {year: terms_for_store(store) for year, store in stores.items()}
+        # A matrix's metadata file is rewritten exactly when the matrix is
+        stamps = {str(year): [os.stat(_paths(store)["metadata"]).st_mtime_ns, list(matrices[year].shape)]
+                  for year, store in stores.items()}
+        key = json.dumps({"version": SIMILAR_VERSION, "years": stamps}, sort_keys=True)
+        if _index is not None and _index.key == key and _index.deduped == dedupe:
+            return _index
+        corpus = _load_corpus(path, key)
+        if corpus is None:
+            with nsf_metrics.stage("similar.corpus"):
+                corpus = _corpus(matrices)
+            _save_corpus(path, key, *corpus)
+        excluded = {}
+        if dedupe:
+            import nsf_merge
+
+            excluded = nsf_merge.open_merge(years).excluded_rows(years)
+        tokens = {year: nsf_tokens.tokens_for_store(store) for year, store in stores.items()}
+        _index = SimilarIndex(years, matrices, tokens, corpus[0], corpus[1], excluded, key)
+        _index.deduped = dedupe
+        return _index
+
+
+def similar_awards(text, k=DEFAULT_K, exclude_id=None, years=None, columns=None):
+    """
+    The `k` awards whose abstracts are most like `text`, as records with
+    `year` and `similarity` added, best first. Copies of the award
+    `exclude_id` (usually the one the text came from) are left out.
+    """
+    import nsf_store
+
+    index = open_similar(years)
+    # Extra hits make up for copies of the excluded award
+    hits = index.similar_text(text, k + 5 if exclude_id is not None else k)
+    rows = {}
+    for year, row, _ in hits:
+        rows.setdefault(year, []).append(row)
+    records = {}
+    for year, year_rows in rows.items():
+        for row, record in zip(year_rows, nsf_store.take_records(year, year_rows, columns or SIMILAR_COLUMNS)):
+            records[(year, row)] = record
+    awards = []
+    for year, row, score in hits:
+        record = records[(year, row)]
+        if exclude_id is not None and str(record.get("id")) == str(exclude_id):
+            continue
+        awards.append(dict(record, year=year, similarity=score))
+    return awards[:k]
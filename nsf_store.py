@@ -0,0 +1,179 @@
+"""
+Columnar award store: one Arrow IPC file per year, memory-mapped on load.
+
+    awards_{year}/{year}_awards.arrow
+
+The store is built from the year's JSON-lines cache with every column typed
+once at write time (amounts as float64, dates as date32). Opening it maps
+the file instead of parsing it, so a decade of awards opens almost
+instantly and only the columns a caller selects are ever paged in.
+"""
+import os
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+import nsf_cache
+from nsf_award import Award
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("agency", pa.string()),
+    ("awardeeName", pa.string()),
+    ("title", pa.string()),
+    ("abstractText", pa.large_string()),
+    ("fundsObligatedAmt", pa.float64()),
+    ("estimatedTotalAmt", pa.float64()),
+    ("pdPIName", pa.string()),
+    ("coPDPI", pa.string()),
+    ("poName", pa.string()),
+    ("startDate", pa.date32()),
+    ("expDate", pa.date32()),
+    ("primaryProgram", pa.string()),
+])
+
+BATCH_SIZE = 10000
+
+
+def store_path(year):
+    return os.path.join(nsf_cache.year_folder(year), f"{year}_awards.arrow")
+
+
+def _record_batch(records):
+    # Every field is parsed once, by the shared award model
+    awards = [Award.from_record(record) for record in records]
+    columns = [pa.array([getattr(award, field.name) for award in awards], type=field.type) for field in SCHEMA]
+    return pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+
+def _source_metadata(cache_file):
+    stat = os.stat(cache_file)
+    return {
+        b"source": os.path.basename(cache_file).encode(),
+        b"source_size": str(stat.st_size).encode(),
+        b"source_mtime_ns": str(stat.st_mtime_ns).encode(),
+    }
+
+
+def write_store(records, path, metadata=None):
+    """Write an iterable of award records to an Arrow IPC file. Returns the row count."""
+    tmp_path = path + ".tmp"
+    rows = 0
+    with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, SCHEMA.with_metadata(metadata or {})) as writer:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                writer.write_batch(_record_batch(batch))
+                rows += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_record_batch(batch))
+            rows += len(batch)
+    os.replace(tmp_path, path)
+    return rows
+
+
+def _store_path_for(cache_file):
+    for suffix in nsf_cache.CACHE_SUFFIXES.values():
+        if cache_file.endswith(suffix):
+            return cache_file[:-len(suffix)] + ".arrow"
+    return os.path.splitext(cache_file)[0] + ".arrow"
+
+
+def _is_fresh(path, cache_file):
+    if not os.path.exists(path):
+        return False
+    try:
+        metadata = ipc.open_file(pa.memory_map(path, "r")).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return False
+    return all(metadata.get(k) == v for k, v in _source_metadata(cache_file).items())
+
+
+def store_for_file(cache_file):
+    """
+    Path of an up-to-date Arrow store next to any cache file (JSON lines,
+    legacy JSON or CSV), building it if it is missing or stale.
+    """
+    cache_file = nsf_cache.migrate_file(cache_file)
+    path = _store_path_for(cache_file)
+    if not _is_fresh(path, cache_file):
+        write_store(nsf_cache.iter_jsonl(cache_file), path, _source_metadata(cache_file))
+    return path
+
+
+def ensure_store(year):
+    """Path of an up-to-date store for the year's completed cache, building it if needed."""
+    cache_file = nsf_cache.find_cache(year)
+    if cache_file is None:
+        raise FileNotFoundError(f"No complete award cache for {year}")
+    return store_for_file(cache_file)
+
+
+def read_table(path, columns=None):
+    """Memory-map an Arrow IPC file; selecting columns never touches the others."""
+    table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.select(columns) if columns else table
+
+
+def open_years(years, columns=None):
+    """
+    One table over several years, building any missing or stale stores first.
+
+    A `year` column is added so rows can be traced back to their cache.
+    """
+    tables = []
+    for year in years:
+        table = read_table(ensure_store(year), columns)
+        tables.append(table.append_column("year", pa.array([int(year)] * table.num_rows, pa.int16())))
+    if not tables:
+        empty = SCHEMA.empty_table()
+        return empty.select(columns) if columns else empty
+    return pa.concat_tables(tables)
+
+
+def iter_records(year, columns=None):
+    """Yield the year's awards as dicts with typed amounts and dates, one batch at a time (see nsf_award for Awards)."""
+    table = read_table(ensure_store(year), columns)
+    for batch in table.to_batches():
+        yield from batch.to_pylist()
+
+
+def take_rows(table, rows):
+    """Rows of a table by row number (e.g. index postings), as dicts in the given order."""
+    return table.take(pa.array(rows, pa.uint32())).to_pylist()
+
+
+def take_records(year, rows, columns=None):
+    """The year's awards at the given row numbers, as dicts."""
+    return take_rows(read_table(ensure_store(year), columns), rows)
+
+
+class LazyTexts:
+    """Abstracts of a store by row number, mapped only when first indexed."""
+
+    def __init__(self, path):
+        self.path = path
+        self._column = None
+
+    def __getitem__(self, row):
+        if self._column is None:
+            self._column = read_table(self.path, ["abstractText"]).column(0)
+        return self._column[row].as_py() or ""
+
+
+def source_of(path):
+    """Path of the cache file an Arrow store was built from, or None if it is gone."""
+    metadata = ipc.open_file(pa.memory_map(path, "r")).schema.metadata or {}
+    source = metadata.get(b"source")
+    if not source:
+        return None
+    source_path = os.path.join(os.path.dirname(path), source.decode())
+    return source_path if os.path.exists(source_path) else None
+
+
+def load_dataframe(cache_file, columns=None):
+    """Open any cache file through its memory-mapped store as a pandas DataFrame."""
+    path = cache_file if cache_file.endswith(".arrow") else store_for_file(cache_file)
+    return read_table(path, columns).to_pandas()
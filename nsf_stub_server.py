@@ -0,0 +1,160 @@
+"""
+Local stand-in for the NSF Awards API that serves canned pages.
+
+Point any tool at it with the NSF_API_URL environment variable:
+
+    python nsf_stub_server.py awards_2025/2025_awards.json --port 8765
+    NSF_API_URL=http://127.0.0.1:8765/services/v1/awards.json python nsf.py
+
+It honours offset/rpp/printFields and single-award lookups by id the way
+the real API does, caps pages at --max-rpp records, and can inject latency
+and transient failures to exercise the fetcher's retry path. Pages carry an
+ETag and Last-Modified, and conditional requests for an unchanged page are
+answered with 304 Not Modified.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+AWARDS_PATH = "/services/v1/awards.json"
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API, so pooled sessions reuse their connections
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            self._answer()
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _answer(self):
+        url = urlparse(self.path)
+        if url.path != AWARDS_PATH:
+            self.send_error(404)
+            return
+
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failure_rate and random.random() < server.failure_rate:
+            self.send_error(503, "Injected failure")
+            return
+
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        offset = max(1, int(query.get("offset", 1)))
+        rpp = min(int(query.get("rpp", 25)), server.max_rpp)
+        fields = [f for f in query.get("printFields", "").split(",") if f]
+
+        awards = server.awards
+        if query.get("id"):
+            awards = server.by_id.get(query["id"], [])
+        batch = awards[offset - 1:offset - 1 + rpp]
+        if fields:
+            batch = [{f: a[f] for f in fields if f in a} for a in batch]
+        body = json.dumps({
+            "response": {
+                "metadata": {"totalCount": len(awards)},
+                "award": batch,
+            }
+        }).encode("utf-8")
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            with server.lock:
+                server.not_modified_count += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(awards, host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0,
+          max_rpp=25, verbose=False):
+    """
+    Start a stub server on a background thread.
+
+    Returns (server, url); call server.shutdown() when done. The server
+    counts what its clients did: request_count, not_modified_count,
+    connection_count (TCP connections opened) and peak_in_flight (most
+    requests served at once).
+    """
+    server = ThreadingHTTPServer((host, port), StubAPIHandler)
+    server.daemon_threads = True
+    server.awards = list(awards)
+    server.by_id = {}
+    for award in server.awards:
+        server.by_id.setdefault(str(award.get("id")), []).append(award)
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.max_rpp = max_rpp
+    server.verbose = verbose
+    server.request_count = 0
+    server.not_modified_count = 0
+    server.connection_count = 0
+    server.in_flight = 0
+    server.peak_in_flight = 0
+    server.last_modified = formatdate(usegmt=True)
+    server.lock = threading.Lock()
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_address[1]}{AWARDS_PATH}"
+    return server, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned NSF award pages locally.")
+    parser.add_argument("awards_json", help="JSON array of awards, e.g. awards_2025/2025_awards.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--max-rpp", type=int, default=25)
+    args = parser.parse_args()
+
+    with open(args.awards_json, "r", encoding="utf-8") as f:
+        awards = json.load(f)
+
+    server, url = serve(awards, args.host, args.port, args.latency, args.failure_rate,
+                        args.max_rpp, verbose=True)
+    print(f"Serving {len(awards)} awards at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Pre-tokenized abstracts: integer token arrays stored next to each year's cache.
+
+Every abstract is lowercased and tokenized once, into words (\\w+) and single
+punctuation marks, and the tokens are stored as ids into one vocabulary that
+all years share:
+
+    awards_vocab.txt                   one term per line; line number = id (append-only)
+    awards_{year}/{year}_awards.tokens int32 token ids of every abstract, back to back
+    awards_{year}/{year}_awards.offsets int64, rows + 1: abstract i is tokens[offsets[i]:offsets[i + 1]]
+    awards_{year}/{year}_awards.words  int32 per row: whitespace-separated words (density denominator)
+    awards_{year}/{year}_awards.tokens.json  what the arrays were built from
+
+The arrays are raw little-endian files, memory-mapped with NumPy, so opening
+a year costs nothing and four bytes per token replace the abstract strings.
+Keyword and phrase searches are vectorized comparisons over the token array
+(see TokenArrays.positions), so phrase matching and density scoring run
+without re-tokenizing any abstract.
+
+Matching works on tokens, so whitespace between the words of a phrase (a line
+break, two spaces) does not matter, and neither does whitespace next to
+punctuation: "cutting-edge" is the tokens cutting, -, edge and also matches
+"cutting - edge". Otherwise hits are the matcher's whole-word hits.
+
+The arrays are rebuilt automatically when the year's store changes.
+"""
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from nsf_matcher import normalize_keyword
+
+TOKENS_VERSION = 1
+
+VOCAB_PATH = "awards_vocab.txt"
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+TOKEN_DTYPE = np.dtype("<i4")
+OFFSET_DTYPE = np.dtype("<i8")
+WORDS_DTYPE = np.dtype("<i4")
+
+BATCH_SIZE = 2000
+
+_lock = threading.Lock()
+_vocabulary = None
+
+
+def tokenize(text):
+    """Lowercased word and punctuation tokens of a text."""
+    return TOKEN_RE.findall(text.lower())
+
+
+# --------------------- VOCABULARY --------------------- #
+class Vocabulary:
+    """term <-> id, shared by every year. Terms are only ever appended, so stored ids stay valid."""
+
+    def __init__(self, terms=(), path=VOCAB_PATH):
+        self.path = path
+        self.ids = {}
+        for term in terms:
+            self.ids.setdefault(term, len(self.ids))
+        self.terms = list(self.ids)
+        self._saved = len(self.terms)
+        self._saved_size = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, tokens):
+        """Ids of `tokens`, adding unseen terms."""
+        ids = self.ids
+        try:
+            # Most abstracts only use known terms; map() then stays in C
+            return list(map(ids.__getitem__, tokens))
+        except KeyError:
+            return [ids.setdefault(token, len(ids)) for token in tokens]
+
+    def lookup(self, tokens):
+        """Ids of `tokens`, or None if any of them has never been seen (so it matches nothing)."""
+        ids = [self.ids.get(token) for token in tokens]
+        return None if any(i is None for i in ids) else ids
+
+    def term(self, token_id):
+        if token_id >= len(self.terms):
+            self.terms = list(self.ids)
+        return self.terms[token_id]
+
+    def save(self):
+        """Append the terms added since the last save."""
+        if len(self.ids) > self._saved:
+            self.terms = list(self.ids)
+            with open(self.path, "a", encoding="utf-8", newline="\n") as f:
+                f.write("".join(term + "\n" for term in self.terms[self._saved:]))
+                f.flush()
+                os.fsync(f.fileno())
+            self._saved = len(self.terms)
+        self._saved_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    @classmethod
+    def load(cls, path=VOCAB_PATH):
+        terms = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", newline="\n") as f:
+                terms = f.read().split("\n")[:-1]
+        vocabulary = cls(terms, path)
+        vocabulary._saved_size = os.path.getsize(path) if os.path.exists(path) else 0
+        return vocabulary
+
+
+def vocabulary(path=VOCAB_PATH):
+    """The shared vocabulary, reloaded when another process has appended to it."""
+    global _vocabulary
+    with _lock:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if _vocabulary is None or _vocabulary.path != path or _vocabulary._saved_size != size:
+            _vocabulary = Vocabulary.load(path)
+        return _vocabulary
+
+
+# --------------------- TOKEN ARRAYS --------------------- #
+def _paths(store):
+    base = store[:-len(".arrow")] if store.endswith(".arrow") else os.path.splitext(store)[0]
+    return {"tokens": base + ".tokens", "offsets": base + ".offsets", "words": base + ".words",
+            "metadata": base + ".tokens.json"}
+
+
+def _source_metadata(store):
+    stat = os.stat(store)
+    return {"source": os.path.basename(store), "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns, "tokens_version": TOKENS_VERSION}
+
+
+def _map(path, dtype):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class TokenArrays:
+    """One year's abstracts as memory-mapped token ids."""
+
+    def __init__(self, tokens, offsets, words, vocab, metadata=None):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.words = words
+        self.vocab = vocab
+        self.metadata = metadata or {}
+
+    @property
+    def size(self):
+        """Number of abstracts."""
+        return len(self.offsets) - 1
+
+    def row(self, i):
+        """Token ids of abstract i."""
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def terms(self, i):
+        return [self.vocab.term(int(t)) for t in self.row(i)]
+
+    def token_counts(self):
+        return np.diff(self.offsets)
+
+    def keyword_ids(self, keyword):
+        """Token ids of a keyword or phrase, or None when some token never occurs."""
+        tokens = tokenize(normalize_keyword(keyword))
+        return self.vocab.lookup(tokens) if tokens else None
+
+    def positions(self, keyword):
+        """Sorted token positions where `keyword` starts, never crossing from one abstract into the next."""
+        ids = self.keyword_ids(keyword)
+        tokens = self.tokens
+        if ids is None or len(tokens) < len(ids):
+            return np.zeros(0, np.int64)
+        # Candidates on the first token, narrowed by each following token
+        positions = np.flatnonzero(tokens[:len(tokens) - len(ids) + 1] == ids[0])
+        for j, token_id in enumerate(ids[1:], 1):
+            positions = positions[tokens[positions + j] == token_id]
+        if len(ids) > 1 and len(positions):
+            rows = self.rows_of(positions)
+            positions = positions[positions + len(ids) <= self.offsets[rows + 1]]
+        return positions
+
+    def rows_of(self, positions):
+        """Abstract (row) of each token position."""
+        return np.searchsorted(self.offsets, positions, side="right") - 1
+
+    def counts(self, keyword):
+        """(rows, occurrences) of the abstracts containing `keyword`, rows sorted."""
+        return np.unique(self.rows_of(self.positions(keyword)), return_counts=True)
+
+    def find(self, keyword):
+        """Sorted rows whose abstract contains `keyword`."""
+        return np.unique(self.rows_of(self.positions(keyword)))
+
+    def nbytes(self):
+        return self.tokens.nbytes + self.offsets.nbytes + self.words.nbytes
+
+
+def build_tokens(store, vocab=None):
+    """Tokenize a store's abstracts into the arrays next to it (and the shared vocabulary)."""
+    import nsf_store
+
+    vocab = vocab or vocabulary()
+    paths = _paths(store)
+    column = nsf_store.read_table(store, ["abstractText"]).column(0)
+    offsets = np.zeros(len(column) + 1, OFFSET_DTYPE)
+    words = np.zeros(len(column), WORDS_DTYPE)
+    tmp = {name: path + ".tmp" for name, path in paths.items()}
+    total = 0
+    row = 0
+    with _lock, open(tmp["tokens"], "wb") as f:
+        for chunk in column.chunks:
+            for start in range(0, len(chunk), BATCH_SIZE):
+                ids = []
+                for text in chunk.slice(start, BATCH_SIZE).to_pylist():
+                    text = text or ""
+                    encoded = vocab.encode(TOKEN_RE.findall(text.lower()))
+                    ids += encoded
+                    words[row] = len(text.split())
+                    total += len(encoded)
+                    row += 1
+                    offsets[row] = total
+                np.asarray(ids, TOKEN_DTYPE).tofile(f)
+        # The vocabulary goes first: arrays never refer to ids it does not have
+        vocab.save()
+    offsets.tofile(tmp["offsets"])
+    words.tofile(tmp["words"])
+    metadata = dict(_source_metadata(store), rows=int(len(column)), tokens=int(total), vocab_size=len(vocab),
+                    vocab=os.path.basename(vocab.path))
+    with open(tmp["metadata"], "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=1)
+    # Metadata last, so a half-replaced set is never mistaken for a fresh one
+    for name in ("tokens", "offsets", "words", "metadata"):
+        os.replace(tmp[name], paths[name])
+    return paths
+
+
+def tokens_for_store(store):
+    """Up-to-date TokenArrays for an Arrow store, building them if missing or stale."""
+    paths = _paths(store)
+    vocab = vocabulary()
+    try:
+        with open(paths["metadata"], "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        metadata = None
+    fresh = (metadata is not None
+             and all(metadata.get(k) == v for k, v in _source_metadata(store).items())
+             and metadata.get("vocab_size", 0) <= len(vocab)
+             and all(os.path.exists(paths[name]) for name in ("tokens", "offsets", "words")))
+    if not fresh:
+        build_tokens(store, vocab)
+        with open(paths["metadata"], "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    return TokenArrays(_map(paths["tokens"], TOKEN_DTYPE), _map(paths["offsets"], OFFSET_DTYPE),
+                       _map(paths["words"], WORDS_DTYPE), vocab, metadata)
+
+
+def open_tokens(year):
+    """The up-to-date token arrays of a year's completed cache."""
+    import nsf_store
+
+    return tokens_for_store(nsf_store.ensure_store(year))
@@ -0,0 +1,251 @@
+"""
+Virtualized table widget shared by the analyzer GUIs.
+
+A plain ttk.Treeview keeps one item per row, so showing tens of thousands of
+matches means tens of thousands of inserts before the window responds.
+VirtualTreeview instead keeps only as many items as fit on screen and
+rewrites their values as the user scrolls. Rows come from a `get_row(i)`
+callable, so nothing is formatted until it becomes visible.
+
+Abstracts are highlighted from KeywordMatcher spans (one per keyword
+occurrence, however many tiers list it), found once per abstract and merged
+in one pass, and the whole abstract goes into the text widget in a single
+insert with a tag on every span. The original text,
+casing included, is shown unchanged.
+"""
+import tkinter as tk
+from functools import lru_cache
+from tkinter import ttk
+
+from nsf_matcher import KeywordMatcher
+
+# Highlight background per tier, most severe first; the last colour is used
+# for any further tier
+HIGHLIGHT_COLORS = ("#ff8787", "#ffc078", "#ffe066", "#a5d8ff", "#b2f2bb")
+
+# Keyword sets up to this size are highlighted with the matcher's str.find scan
+SCAN_KEYWORDS = 16
+
+# Fallback row height (pixels) when the theme does not define one
+DEFAULT_ROW_HEIGHT = 20
+HEADER_HEIGHT = 25
+
+
+def preview(text, length=200):
+    """First line-ish of a long text for a table cell; the full text is loaded when the row is opened."""
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= length else text[:length - 1] + "…"
+
+
+class VirtualTreeview:
+    """
+    A Treeview that only materializes its visible rows.
+
+    columns  -- column headings
+    widths   -- optional {heading: width}
+    on_open  -- called with the source row index on double-click or Enter
+    """
+
+    def __init__(self, master, columns, widths=None, height=20, on_open=None):
+        self.frame = ttk.Frame(master)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=height, selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=(widths or {}).get(col, 150))
+
+        self.columns = columns
+        self.on_open = on_open
+        self.count = 0
+        self.get_row = None
+        self.offset = 0
+        self.visible = height
+        self.selected = None
+        self._items = []
+
+        style = ttk.Style(self.tree)
+        try:
+            self.row_height = int(style.lookup("Treeview", "rowheight") or DEFAULT_ROW_HEIGHT)
+        except (TypeError, ValueError):
+            self.row_height = DEFAULT_ROW_HEIGHT
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self.visible))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self.visible))
+        self.tree.bind("<Home>", lambda e: self._select(0))
+        self.tree.bind("<End>", lambda e: self._select(self.count - 1))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Double-1>", self._on_open)
+        self.tree.bind("<Return>", self._on_open)
+
+    # Geometry is managed through the outer frame
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    # --------------------- DATA --------------------- #
+    def set_source(self, count, get_row):
+        """Show `count` rows, where get_row(i) returns the values of row i."""
+        self.count = count
+        self.get_row = get_row
+        self.offset = 0
+        self.selected = None
+        self.refresh()
+
+    def clear(self):
+        self.set_source(0, None)
+
+    def selected_row(self):
+        """Source index of the selected row, or None."""
+        return self.selected
+
+    def refresh(self):
+        """Rewrite the visible items from the source; only ever touches `visible` items."""
+        needed = max(1, self.visible)
+        while len(self._items) < needed:
+            self._items.append(self.tree.insert("", "end", values=()))
+        self.offset = max(0, min(self.offset, self.count - needed))
+
+        for position, iid in enumerate(self._items):
+            row = self.offset + position
+            if position < needed and row < self.count:
+                self.tree.move(iid, "", position)
+                self.tree.item(iid, values=self.get_row(row))
+            elif self.tree.exists(iid):
+                self.tree.detach(iid)
+
+        # Keep the selection on the same source row while scrolling
+        position = None if self.selected is None else self.selected - self.offset
+        if position is not None and 0 <= position < min(needed, self.count - self.offset):
+            self.tree.selection_set(self._items[position])
+        else:
+            self.tree.selection_set(())
+
+        if self.count:
+            self.scrollbar.set(self.offset / self.count, min(1.0, (self.offset + needed) / self.count))
+        else:
+            self.scrollbar.set(0, 1)
+
+    # --------------------- SCROLLING --------------------- #
+    def scroll(self, rows):
+        self.offset += rows
+        self.refresh()
+        return "break"
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * self.count)
+            self.refresh()
+        elif action == "scroll":
+            step = int(value) * (self.visible if unit == "pages" else 1)
+            self.scroll(step)
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll(-3 * delta)
+
+    def _on_resize(self, event):
+        visible = max(1, (event.height - HEADER_HEIGHT) // self.row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.refresh()
+
+    # --------------------- SELECTION --------------------- #
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] in self._items:
+            self.selected = self.offset + self._items.index(selection[0])
+
+    def _select(self, row):
+        if not self.count:
+            return "break"
+        row = max(0, min(row, self.count - 1))
+        self.selected = row
+        if row < self.offset:
+            self.offset = row
+        elif row >= self.offset + self.visible:
+            self.offset = row - self.visible + 1
+        self.refresh()
+        return "break"
+
+    def _move_selection(self, step):
+        return self._select((self.selected if self.selected is not None else self.offset - 1) + step)
+
+    def _on_open(self, event):
+        if event.type == tk.EventType.ButtonPress and not self.tree.identify_row(event.y):
+            return
+        self._on_select(event)
+        if self.on_open is not None and self.selected is not None:
+            self.on_open(self.selected)
+
+
+# --------------------- HIGHLIGHTING --------------------- #
+@lru_cache(maxsize=256)
+def keyword_matcher(keywords):
+    """A KeywordMatcher for a tuple of keywords, built once per keyword set."""
+    # An award's few matched words are found faster with str.find than through an automaton
+    return KeywordMatcher(keywords, engine="scan" if len(keywords) <= SCAN_KEYWORDS else None)
+
+
+@lru_cache(maxsize=1024)
+def keyword_spans(text, keywords):
+    """keyword_matcher(keywords).spans(text), found once per abstract and keyword set."""
+    return keyword_matcher(keywords).spans(text)
+
+
+def highlight_spans(text, keywords, rank_of=None):
+    """
+    Occurrences of a tuple of keywords in `text` as sorted, non-overlapping
+    (start, end, rank) spans. Overlapping hits ("radical inclusion" and
+    "inclusion") merge into one span. `rank_of` maps a keyword's tier to its
+    colour rank (0 = most severe); a keyword listed in several tiers, and a
+    merged span, keep the most severe rank. An abstract shown again (the
+    same award under another tier, or reopened) is not searched again.
+    """
+    matcher = keyword_matcher(keywords)
+    spans = []
+    ranks = {}
+    for start, end, key in keyword_spans(text, keywords):
+        rank = ranks.get(key)
+        if rank is None:
+            rank = ranks[key] = min(rank_of.get(tier, 0) for tier in matcher.tiers(key)) if rank_of else 0
+        if spans and start < spans[-1][1]:
+            previous_start, previous_end, previous = spans[-1]
+            spans[-1] = (previous_start, max(previous_end, end), min(previous, rank))
+        else:
+            spans.append((start, end, rank))
+    return spans
+
+
+def highlight_tag(rank):
+    return f"flag{min(rank, len(HIGHLIGHT_COLORS) - 1)}"
+
+
+def configure_highlight_tags(widget):
+    """Define the highlight tags on a Text (or CTkTextbox) widget."""
+    widget = getattr(widget, "_textbox", widget)  # CTkTextbox wraps a tk.Text
+    for rank, color in enumerate(HIGHLIGHT_COLORS):
+        widget.tag_configure(highlight_tag(rank), background=color, foreground="black")
+
+
+def insert_highlighted(widget, text, spans, index="end"):
+    """Insert `text` with the highlight tag of each span, in one Tk call."""
+    widget = getattr(widget, "_textbox", widget)
+    segments = []
+    position = 0
+    for start, end, rank in spans:
+        segments += [text[position:start], (), text[start:end], (highlight_tag(rank),)]
+        position = end
+    segments += [text[position:], ()]
+    widget.insert(index, *segments)
@@ -1,91 +1,86 @@
 import customtkinter as ctk  # pip install customtkinter
+import importlib.util
 import pandas as pd
-from tkinter import filedialog, ttk, messagebox
+from tkinter import filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
-from fpdf import FPDF  # pip install fpdf
+
+import nsf_cache
+import nsf_index
+import nsf_memo
+import nsf_metrics
+import nsf_report
+from nsf_matcher import MATCHER_VERSION, normalize_keyword
+from nsf_keywords import QUICK_ADD_WORDS
+from nsf_views import VirtualTreeview, configure_highlight_tags, highlight_spans, insert_highlighted, preview
 
 # --------------------- CONFIGURE APPEARANCE & THEME --------------------- #
 ctk.set_appearance_mode("System")   # "System", "Dark", or "Light"
 ctk.set_default_color_theme("blue") # "blue", "green", "dark-blue"
 
 # --------------------- RED-FLAG WORDS LIST --------------------- #
-RED_FLAG_WORDS = [
-    # --- Original sample set ---
-    "innovative", "cutting-edge", "synergy", "leverage", "game-changing",
-    "revolutionary", "disruptive", "paradigm", "unprecedented", "scalable",
-    "diversity", "equity", "inclusion", "women", "underrepresented",
-    "gender", "race", "social justice", "holistic", "empowerment",
-    "framework", "sustainability", "impactful", "stakeholder", "inclusive",
-    "transformation", "intersectionality", "accessible", "empirical",
-    "methodology", "outreach", "collaboration", "potential", "scalability",
-    "climate change", "AI-driven", "blockchain", "metaverse", "cryptocurrency",
-    
-    # --- Newly added DEI/social-justice terms ---
-    "Equity",
-    "Inclusion",
-    "Diversity",
-    "Intersectionality",
-    "Social Justice",
-    "Systemic Racism",
-    "Anti-Racism",
-    "Cultural Competency",
-    "Microaggressions",
-    "Implicit Bias",
-    "White Privilege",
-    "BIPOC",
-    "LGBTQIA+",
-    "Gender Non-Conforming",
-    "Allyship",
-    "Decolonization",
-    "Restorative Justice",
-    "Safe Space",
-    "Trigger Warning",
-    "Cultural Appropriation",
-    "Marginalized Communities",
-    "Underserved Populations",
-    "Disparity",
-    "Representation",
-    "Accessibility",
-    "Neurodiversity",
-    "Empowerment",
-    "Affirmative Action",
-    "Equitable Access",
-    "Inclusive Practices",
-    "Cultural Humility",
-    "Anti-Oppression",
-    "Equity Lens",
-    "Radical Inclusion",
-    "Community Engagement",
-    "Diversity Training",
-    "Socioeconomic Disadvantage",
-    "Gender Equity",
-    "Racial Justice",
-    "Holistic Approach"
-]
+# Shared with the headless tools (index, CLI); see nsf_keywords.py
+RED_FLAG_WORDS = QUICK_ADD_WORDS
+
+# Awards listed by "More like this"
+SIMILAR_COUNT = 10
+
+# Funding column this tool totals, lists and ranks the report by: the estimated
+# total amount, as it always has. The Awards Analyzer and the CLI use the
+# obligated amount instead (nsf_award.AMOUNT_FIELD); set this to
+# "fundsObligatedAmt" to match their totals.
+FUNDING_FIELD = "estimatedTotalAmt"
 
-# Global variable to store the DataFrame
+# Columns loaded from the award store
+DISPLAY_COLUMNS = ["id", "awardeeName", "title", "abstractText", FUNDING_FIELD]
+
+# Global variables to store the DataFrame, its keyword index and the rows on display
 data = None
+index = None
+displayed = None
+# Content hash of the loaded file, and (rows, total funding) of recent filters
+# keyed on (fingerprint, keyword set, matcher version)
+fingerprint = None
+filter_memo = nsf_memo.LRUMemo(maxsize=64, directory=None)
 
 # --------------------- FUNCTIONS --------------------- #
 def filter_by_keywords(df, keywords):
-    """Filter abstracts containing any of the specified keywords (case-insensitive)."""
+    """Filter abstracts containing any of the specified keywords as whole words (case-insensitive)."""
     if not keywords:
         # If no keywords provided, just return original DataFrame and sum
-        return df, df["estimatedTotalAmt"].sum()
+        return df, df[FUNDING_FIELD].sum()
     
-    pattern = "|".join(keywords)
-    filtered = df[df["abstractText"].str.contains(pattern, case=False, na=False)]
-    total_funding = filtered["estimatedTotalAmt"].sum()
-    return filtered, total_funding
+    # Toggling a keyword off and on again (or re-running a report) reuses the
+    # rows already computed for that keyword set
+    key = (fingerprint, frozenset(normalize_keyword(k) for k in keywords), MATCHER_VERSION)
+    memo = filter_memo.get(key) if df is data else None
+    if memo is None:
+        # Union of the keywords' postings in the inverted index; rows follow
+        # the store order, so they index the DataFrame directly
+        rows = index.any_of(keywords, df["abstractText"].values)
+        memo = (rows, df[FUNDING_FIELD].values[rows].sum())
+        if df is data:
+            filter_memo.put(key, memo)
+    rows, total_funding = memo
+    return df.iloc[rows], total_funding
 
 def analyze_file(filepath):
-    """Read CSV into a DataFrame, ensuring types are correct."""
+    """Load an award cache (Arrow store, JSON lines, legacy JSON or CSV) into a DataFrame, ensuring types are correct."""
     try:
-        df = pd.read_csv(filepath)
+        try:
+            import nsf_store
+        except ImportError:
+            # Without pyarrow the cache itself is parsed
+            df = pd.DataFrame(list(nsf_cache.iter_awards_file(filepath)), columns=DISPLAY_COLUMNS)
+        else:
+            # Opened through the memory-mapped columnar store next to the cache
+            # (built on first use); only the columns shown here are paged in
+            df = nsf_store.load_dataframe(filepath, DISPLAY_COLUMNS)
         # Ensure columns exist; fill missing abstract text with empty strings
-        df["abstractText"] = df.get("abstractText", "").fillna("").astype(str)
-        # Convert funding column to float; fill missing with 0
-        df["estimatedTotalAmt"] = df.get("estimatedTotalAmt", 0).fillna(0).astype(float)
+        df["abstractText"] = df.get("abstractText", pd.Series("", index=df.index)).fillna("").astype(str)
+        # Convert funding column to float; fill missing (or empty-string) amounts with 0
+        df[FUNDING_FIELD] = pd.to_numeric(
+            df.get(FUNDING_FIELD, pd.Series(0.0, index=df.index)), errors="coerce"
+        ).fillna(0).astype(float)
         return df
     except Exception as e:
         messagebox.showerror("Error", f"Failed to process the file: {e}")
@@ -94,15 +89,28 @@ def analyze_file(filepath):
 def upload_file():
     """Handle file upload and display initial data if successful."""
     filepath = filedialog.askopenfilename(
-        filetypes=[("CSV Files", "*.csv")],
-        title="Select a CSV File"
+        filetypes=[
+            ("Award Caches", "*.arrow *.jsonl *.jsonl.gz *.jsonl.zst *.json *.csv"),
+            ("CSV Files", "*.csv"),
+        ],
+        title="Select an Award Cache"
     )
     if not filepath:
         return
     
-    global data
+    global data, index, fingerprint
+    # A year's CSV export (or legacy JSON) opens the cache its manifest owns
+    filepath = nsf_cache.migrate_file(filepath)
     data = analyze_file(filepath)
     if data is not None:
+        # Built once per cache and saved next to it; later loads reuse it
+        try:
+            index = nsf_index.index_for_file(filepath)
+            fingerprint = nsf_memo.dataset_fingerprint(filepath)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to index the file: {e}")
+            data = None
+            return
         # After loading new data, display everything or apply current filters
         display_data(data)
         update_display()  # Refresh display to apply any existing keywords
@@ -133,42 +141,83 @@ def add_keyword(word):
     update_display()
 
 def display_data(filtered_df):
-    """Populate the Treeview with the filtered DataFrame."""
-    # Clear existing rows
-    for row in tree.get_children():
-        tree.delete(row)
+    """Point the results table at the filtered DataFrame; rows are formatted only when scrolled into view."""
+    global displayed
+    displayed = filtered_df
+    
+    # Plain column arrays make per-row access cheap while scrolling
+    ids = filtered_df["id"].astype(str).values
+    awardees = filtered_df["awardeeName"].fillna("").astype(str).values
+    titles = filtered_df["title"].fillna("").astype(str).values
+    abstracts = filtered_df["abstractText"].values
+    amounts = filtered_df[FUNDING_FIELD].values
     
-    # Insert new rows
-    for _, row_data in filtered_df.iterrows():
-        # Use str(...) for safety in case columns are missing
-        tree.insert(
-            "",
-            "end",
-            values=(
-                str(row_data.get("id", "")),
-                str(row_data.get("awardeeName", "")),
-                str(row_data.get("title", "")),
-                str(row_data.get("abstractText", "")),
-                f"{row_data.get('estimatedTotalAmt', 0):,.2f}"
-            )
-        )
+    def row_values(i):
+        return (ids[i], awardees[i], titles[i], preview(abstracts[i]), f"{amounts[i]:,.2f}")
+    
+    tree.set_source(len(filtered_df), row_values)
 
-def show_full_abstract(event):
-    """Open a new window to display the full abstract text on double-click."""
-    selected_item = tree.selection()
-    if not selected_item:
+def show_full_abstract(row):
+    """Open a new window to display the full abstract text of a table row, with the filter keywords highlighted."""
+    if displayed is None:
         return
-    abstract = tree.item(selected_item)["values"][3]
+    open_abstract("Full Abstract", displayed["abstractText"].iloc[row], str(displayed["id"].iloc[row]))
+
+def open_abstract(title, abstract, award_id=None):
+    """Show an abstract with the filter keywords highlighted, and a button to find abstracts like it."""
+    keywords = tuple(k.strip() for k in keyword_entry.get().split(",") if k.strip())
     
     abstract_window = ctk.CTkToplevel(root)
-    abstract_window.title("Full Abstract")
+    abstract_window.title(title)
     abstract_window.geometry("800x600")
     
+    similar_button = ctk.CTkButton(abstract_window, text="More like this", width=140,
+                                   command=lambda: show_similar(abstract, award_id))
+    similar_button.pack(anchor="e", padx=10, pady=5)
+    
     scrolled_text = ScrolledText(abstract_window, wrap="word", font=("Arial", 12))
     scrolled_text.pack(expand=True, fill="both")
-    scrolled_text.insert(ctk.END, abstract)
+    configure_highlight_tags(scrolled_text)
+    insert_highlighted(scrolled_text, abstract, highlight_spans(abstract, keywords))
     scrolled_text.config(state="disabled")
 
+def show_similar(abstract, award_id=None):
+    """List the cached awards (any year) whose abstracts are most like this one; double-click opens one."""
+    # The search reads the award stores, which import pyarrow only when used
+    if any(importlib.util.find_spec(module) is None for module in ("numpy", "pyarrow")):
+        messagebox.showerror("Error", "Finding similar abstracts needs numpy and pyarrow (pip install numpy pyarrow).")
+        return
+    import nsf_similar
+    try:
+        # The index is built on first use and updated as years are downloaded
+        similar = nsf_similar.similar_awards(abstract, k=SIMILAR_COUNT, exclude_id=award_id)
+    except Exception as e:
+        messagebox.showerror("Error", f"Failed to search similar abstracts: {e}")
+        return
+    if not similar:
+        messagebox.showinfo("No Matches", "No similar abstracts in the downloaded years.")
+        return
+    
+    similar_window = ctk.CTkToplevel(root)
+    similar_window.title("More Like This")
+    similar_window.geometry("1000x400")
+    
+    def row_values(i):
+        award = similar[i]
+        return (f"{award['similarity']:.2f}", award["year"], award.get("id", ""), award.get("awardeeName") or "",
+                award.get("title") or "")
+    
+    def open_row(i):
+        award = similar[i]
+        open_abstract(f"{award.get('title') or 'Abstract'} ({award['year']})", award.get("abstractText") or "",
+                      str(award.get("id", "")))
+    
+    similar_tree = VirtualTreeview(similar_window, ("Similarity", "Year", "ID", "Awardee Name", "Title"),
+                                   widths={"Similarity": 80, "Year": 60, "Title": 450}, height=SIMILAR_COUNT,
+                                   on_open=open_row)
+    similar_tree.pack(pady=10, fill="both", expand=True)
+    similar_tree.set_source(len(similar), row_values)
+
 def generate_report():
     """
     Generate a PDF report of the top 10 most-funded abstracts 
@@ -187,9 +236,6 @@ def generate_report():
         messagebox.showinfo("No Data", "No records match the current filter.")
         return
     
-    # Sort by 'estimatedTotalAmt' descending and get top 10
-    top_10 = filtered.nlargest(10, "estimatedTotalAmt")
-
     # Prompt user to save the PDF
     save_path = filedialog.asksaveasfilename(
         defaultextension=".pdf",
@@ -199,55 +245,31 @@ def generate_report():
     if not save_path:
         return  # User canceled saving
     
-    # --------------------- Generate PDF with FPDF --------------------- #
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    
-    # Title
-    pdf.cell(0, 10, "Top 10 Most-Funded Projects Report", ln=True, align="C")
-    pdf.ln(10)  # extra space
-    
-    # Table headers
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(20, 10, "Rank", border=1)
-    pdf.cell(50, 10, "Awardee", border=1)
-    pdf.cell(40, 10, "Funding", border=1)
-    pdf.cell(80, 10, "Title", border=1, ln=True)
-    
-    # Table rows
-    pdf.set_font("Arial", "", 12)
-    rank = 1
-    for _, row_data in top_10.iterrows():
-        awardee = str(row_data.get("awardeeName", "")[:20])  # truncated
-        title = str(row_data.get("title", "")[:30])          # truncated
-        funding_str = f"${row_data.get('estimatedTotalAmt', 0):,.2f}"
-        
-        pdf.cell(20, 10, str(rank), border=1)
-        pdf.cell(50, 10, awardee, border=1)
-        pdf.cell(40, 10, funding_str, border=1)
-        pdf.cell(80, 10, title, border=1, ln=True)
-        rank += 1
-    
-    # Add second page for full abstracts
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "Full Abstracts", ln=True, align="C")
-    pdf.ln(10)
-    
-    pdf.set_font("Arial", "", 12)
-    rank = 1
-    for _, row_data in top_10.iterrows():
-        pdf.multi_cell(0, 10, f"#{rank} - {row_data.get('title', '')}")
-        pdf.multi_cell(0, 10, f"Awardee: {row_data.get('awardeeName', '')}")
-        pdf.multi_cell(0, 10, f"Funding: ${row_data.get('estimatedTotalAmt', 0):,.2f}")
-        pdf.multi_cell(0, 10, f"Abstract:\n{row_data.get('abstractText', '')}")
-        pdf.ln(5)  # space between entries
-        rank += 1
-    
-    # Save PDF
-    pdf.output(save_path)
-    messagebox.showinfo("Success", f"Report generated and saved:\n{save_path}")
+    with nsf_metrics.collect() as metrics:
+        # Top 10 by funding; only those rows are converted for the report
+        with nsf_metrics.stage("report.select"):
+            top_10 = filtered.nlargest(10, FUNDING_FIELD)
+            awards = [
+                {
+                    "id": str(row_data.get("id", "")),
+                    "title": str(row_data.get("title", "")),
+                    "awardee": str(row_data.get("awardeeName", "")),
+                    "amount": float(row_data.get(FUNDING_FIELD, 0)),
+                    "abstract": str(row_data.get("abstractText", "")),
+                }
+                for _, row_data in top_10.iterrows()
+            ]
+        nsf_report.write_top_report(awards, save_path, n=10)
+    # The detector has no log pane; the run's metrics go in the confirmation
+    summary = "\n\n" + metrics.format_summary()
+    try:
+        profile = nsf_metrics.export_profile(metrics)
+    except OSError as e:
+        profile = None
+        summary += f"\nCould not write the profile: {e}"
+    if profile:
+        summary += f"\nProfile saved as {profile}"
+    messagebox.showinfo("Success", f"Report generated and saved:\n{save_path}{summary}")
 
 # --------------------- CREATE THE MAIN UI --------------------- #
 root = ctk.CTk()
@@ -258,7 +280,7 @@ root.geometry("1400x900")
 frame_top = ctk.CTkFrame(root)
 frame_top.pack(pady=10, fill="x", padx=10)
 
-upload_button = ctk.CTkButton(frame_top, text="Upload CSV", command=upload_file, width=120)
+upload_button = ctk.CTkButton(frame_top, text="Open Awards", command=upload_file, width=120)
 upload_button.pack(side="left", padx=10)
 
 keyword_label = ctk.CTkLabel(frame_top, text="Enter Keywords (comma-separated):")
@@ -293,18 +315,10 @@ for idx, word in enumerate(RED_FLAG_WORDS):
     btn.grid(row=row, column=col, padx=5, pady=5)
 
 # ----- Table for Results ----- #
+# Only the visible rows exist as Treeview items; double-click loads the full abstract
 tree_columns = ("ID", "Awardee Name", "Title", "Abstract", "Funding Amount")
-tree = ttk.Treeview(root, columns=tree_columns, show="headings", height=20)
-
-for col in tree_columns:
-    tree.heading(col, text=col)
-    if col == "Abstract":
-        tree.column(col, width=500)
-    else:
-        tree.column(col, width=150)
-
+tree = VirtualTreeview(root, tree_columns, widths={"Abstract": 500}, height=20, on_open=show_full_abstract)
 tree.pack(pady=10, fill="both", expand=True)
-tree.bind("<Double-1>", show_full_abstract)
 
 # ----- Generate Report Button ----- #
 report_button = ctk.CTkButton(root, text="Generate Report", command=generate_report, width=200)
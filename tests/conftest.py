@@ -0,0 +1,115 @@
+"""
+Shared fixtures. Every test runs in its own empty working directory, since
+the caches, indexes and merge files all live next to the year folders.
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nsf_cache  # noqa: E402
+import nsf_fetch  # noqa: E402
+import nsf_stub_server  # noqa: E402
+
+SENTENCES = [
+    "This project will broaden participation of underrepresented students in computing.",
+    "The team studies protein folding with new simulation methods.",
+    "Results will promote diversity, equity and inclusion across the institution.",
+    "A transformative framework for sensor networks is developed.",
+    "The inequity of access to field sites is measured with survey data.",
+    "Graduate students receive training in climate modeling.",
+]
+PLAIN_ABSTRACT = "The team studies protein folding with new simulation methods."
+
+
+def make_award(i, year=2020):
+    """One API-shaped award; every third abstract has no red flag words at all."""
+    start = date(int(year), 1, 1) + timedelta(days=i % 365)
+    return {
+        "id": f"{int(year) % 100:02d}{i:05d}",
+        "agency": "NSF",
+        "awardeeName": f"University {i % 7}",
+        "title": f"Award {i} of {year}",
+        "abstractText": PLAIN_ABSTRACT if i % 3 == 0 else f"{SENTENCES[i % 6]} {SENTENCES[(i + 2) % 6]}",
+        "fundsObligatedAmt": str(1000 * (i + 1)),
+        "estimatedTotalAmt": str(1500 * (i + 1)),
+        "pdPIName": f"PI {i}",
+        "coPDPI": [f"Co-PI {i}", f"Co-PI {i + 1}"],
+        "poName": f"Officer {i % 3}",
+        "startDate": start.strftime("%m/%d/%Y"),
+        "expDate": (start + timedelta(days=730)).strftime("%m/%d/%Y"),
+        "primaryProgram": ["CISE", "BIO", "GEO"][i % 3],
+    }
+
+
+def make_awards(n, year=2020, first=0):
+    return [make_award(i, year) for i in range(first, first + n)]
+
+
+def write_year(year, awards, fetched_at="2024-01-01T00:00:00"):
+    """Store `awards` as the year's completed cache, as a finished download would."""
+    os.makedirs(nsf_cache.year_folder(year), exist_ok=True)
+    path = nsf_cache.cache_path(year)
+    count = nsf_cache.write_jsonl(path, awards)
+    nsf_cache.save_manifest(year, {
+        "year": int(year),
+        "cache_file": os.path.basename(path),
+        "record_count": count,
+        "total_count": count,
+        "started_at": fetched_at,
+        "fetched_at": fetched_at,
+        "complete": True,
+    })
+    return path
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Process-wide state that would otherwise leak between working directories
+    monkeypatch.setattr(nsf_fetch.NSFFetcher, "_page_sizes", {})
+    for module, name, value in (("nsf_tokens", "_vocabulary", None), ("nsf_similar", "_index", None),
+                                ("nsf_similar", "_word_terms", {})):
+        if module in sys.modules:
+            monkeypatch.setattr(sys.modules[module], name, value)
+    if "nsf_memo" in sys.modules:
+        for memo in ("results_memo", "hits_memo", "_fingerprints"):
+            getattr(sys.modules["nsf_memo"], memo).clear()
+    return tmp_path
+
+
+@pytest.fixture
+def stub():
+    """Start stub API servers: stub(awards, **options) -> (server, url). All are shut down afterwards."""
+    servers = []
+
+    def start(awards, **options):
+        server, url = nsf_stub_server.serve(awards, **options)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fetcher_for():
+    """Build NSFFetchers without the on-disk page cache or rate limit; all are closed afterwards."""
+    fetchers = []
+
+    def build(url, **options):
+        options.setdefault("cache", False)
+        options.setdefault("rate_limit", None)
+        options.setdefault("backoff", 0.001)
+        fetcher = nsf_fetch.NSFFetcher(base_url=url, **options)
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield build
+    for fetcher in fetchers:
+        fetcher.close()
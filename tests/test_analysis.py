@@ -0,0 +1,99 @@
+"""The analysis engine and its memoized front end agree, report progress and can be cancelled."""
+import threading
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import nsf_analysis  # noqa: E402
+import nsf_cache  # noqa: E402
+import nsf_memo  # noqa: E402
+from nsf_keywords import RED_FLAG_WORDS  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+YEAR = 2020
+
+
+@pytest.fixture
+def year():
+    write_year(YEAR, make_awards(90))
+    return YEAR
+
+
+def without_year(results):
+    return {tier: [{k: v for k, v in award.items() if k != "year"} for award in awards]
+            for tier, awards in results.items()}
+
+
+def test_engines_agree(year):
+    records = nsf_analysis.analyze_records(nsf_cache.iter_awards(year), RED_FLAG_WORDS, workers=1, shard_size=20)
+    stores = nsf_analysis.analyze_years([year], RED_FLAG_WORDS, workers=1, shard_size=20)
+    memo = nsf_memo.analyze_year(year, RED_FLAG_WORDS)
+
+    assert any(records.results.values())
+    assert without_year(stores.results) == records.results
+    assert memo.results == records.results
+    assert memo.scanned == records.scanned == 90
+
+
+def test_memo_and_engine_analyze_a_duplicated_award_once():
+    awards = make_awards(30)
+    # The same award twice within the year, amended; the later copy is kept
+    write_year(YEAR, awards + [dict(awards[1], fundsObligatedAmt="99999")])
+
+    stores = nsf_analysis.analyze_years([YEAR], RED_FLAG_WORDS, workers=1, use_index=False)
+    memo = nsf_memo.analyze_year(YEAR, RED_FLAG_WORDS)
+
+    assert memo.totals == stores.totals
+    assert memo.results == without_year(stores.results)
+    assert memo.scanned == stores.scanned == 30
+    amounts = {award["id"]: award["amount"] for matches in memo.results.values() for award in matches}
+    assert amounts[awards[1]["id"]] == 99999
+
+
+def test_records_are_sharded_across_processes(year):
+    parallel = nsf_analysis.analyze_records(nsf_cache.iter_awards(year), RED_FLAG_WORDS, workers=2, shard_size=20)
+    serial = nsf_analysis.analyze_records(nsf_cache.iter_awards(year), RED_FLAG_WORDS, workers=1)
+    assert parallel.results == serial.results
+
+
+def test_engine_progress_and_cancel(year):
+    progress = []
+    nsf_analysis.analyze_records(nsf_cache.iter_awards(year), RED_FLAG_WORDS, workers=1, shard_size=20,
+                                 progress=lambda *args: progress.append(args))
+    assert [done for done, _, _ in progress] == [20, 40, 60, 80, 90]
+    assert all(total == 90 for _, total, _ in progress)
+
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(nsf_analysis.AnalysisCancelled):
+        nsf_analysis.analyze_records(nsf_cache.iter_awards(year), RED_FLAG_WORDS, workers=1, cancel_event=cancel)
+
+
+def test_unindexed_phrases_are_verified_by_the_matcher(year):
+    selected = {"Custom": ["protein folding", "sensor networks", "quantum widget"]}
+    analysis = nsf_analysis.analyze_years([year], selected, workers=1)
+    records = nsf_analysis.analyze_records(nsf_cache.iter_awards(year), selected, workers=1)
+
+    assert [award["id"] for award in analysis.results["Custom"]] == [award["id"] for award in records.results["Custom"]]
+    assert analysis.results["Custom"]
+
+
+def test_memo_miss_reports_progress_and_can_be_cancelled(year):
+    selected = {tier: words[:3] for tier, words in RED_FLAG_WORDS.items()}
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(nsf_analysis.AnalysisCancelled):
+        nsf_memo.analyze_year(year, selected, cancel_event=cancel)
+
+    progress = []
+    analysis = nsf_memo.analyze_year(year, selected, progress=lambda *args: progress.append(args))
+    keywords = sum(len(words) for words in selected.values())
+    assert [done for done, _, _ in progress] == list(range(1, keywords + 1))
+    assert progress[-1][2] == {tier: len(awards) for tier, awards in analysis.results.items()}
+
+    # A memo hit neither scans nor reports
+    progress.clear()
+    assert nsf_memo.analyze_year(year, selected, progress=lambda *args: progress.append(args)) == analysis
+    assert progress == []
@@ -0,0 +1,91 @@
+"""Award: fields are parsed once, read like a record and written back in the API's form."""
+import json
+import os
+from datetime import date
+
+import pytest
+
+import nsf_award
+from nsf_award import AMOUNT_FIELD, Award, parse_amount, parse_date
+
+from conftest import make_award, make_awards, write_year
+
+YEAR = 2020
+
+
+def test_parse_amount():
+    assert parse_amount("123456") == 123456.0
+    assert parse_amount(42) == 42.0
+    assert parse_amount("1.5") == 1.5
+    assert parse_amount("") is None
+    assert parse_amount(None) is None
+    assert parse_amount("n/a") is None
+
+
+def test_parse_date():
+    assert parse_date("03/09/2020") == date(2020, 3, 9)
+    assert parse_date("2020-03-09") == date(2020, 3, 9)
+    assert parse_date(date(2020, 3, 9)) == date(2020, 3, 9)
+    assert parse_date("") is None
+    assert parse_date("9 March") is None
+
+
+def test_from_record_parses_every_field():
+    record = make_award(4)
+    award = Award.from_record(record, YEAR)
+
+    assert award.year == YEAR
+    assert award.fundsObligatedAmt == 5000.0 and award.estimatedTotalAmt == 7500.0
+    assert award.startDate == date(2020, 1, 5)
+    assert award.coPDPI == "Co-PI 4; Co-PI 5"
+    assert award.amount == getattr(award, AMOUNT_FIELD)
+    # Repeated names are shared between awards
+    other = Award.from_record(make_award(11))
+    assert award.awardeeName is other.awardeeName
+
+
+def test_award_reads_like_a_record():
+    award = Award.from_record(make_award(1))
+
+    assert award.get("title") == award["title"] == award.title == "Award 1 of 2020"
+    assert award.get("missing", "default") == "default"
+    assert award.get("abstractText", "") == make_award(1)["abstractText"]
+    with pytest.raises(KeyError):
+        award["missing"]
+
+
+def test_unknown_amount_counts_as_zero():
+    award = Award.from_record(dict(make_award(1), fundsObligatedAmt="", estimatedTotalAmt=None))
+    assert award.fundsObligatedAmt is None
+    assert award.amount == 0.0
+
+
+def test_to_record_round_trips_through_the_api_form():
+    record = make_award(7)
+    written = Award.from_record(record).to_record()
+
+    assert written["fundsObligatedAmt"] == record["fundsObligatedAmt"]
+    assert written["startDate"] == record["startDate"]
+    assert Award.from_record(written).to_dict() == Award.from_record(record).to_dict()
+
+
+def test_legacy_json_file_loads_as_awards():
+    os.makedirs("legacy")
+    with open(os.path.join("legacy", "awards.json"), "w", encoding="utf-8") as f:
+        json.dump(make_awards(5), f)
+
+    awards = nsf_award.load_file(os.path.join("legacy", "awards.json"), YEAR)
+
+    assert [award.id for award in awards] == [record["id"] for record in make_awards(5)]
+    assert all(award.year == YEAR and isinstance(award.amount, float) for award in awards)
+
+
+def test_store_and_cache_give_the_same_awards():
+    pytest.importorskip("pyarrow")
+    write_year(YEAR, make_awards(12))
+
+    from_store = nsf_award.load_year(YEAR)
+    from_cache = nsf_award.load_year(YEAR, use_store=False)
+
+    assert [award.to_dict() for award in from_store] == [award.to_dict() for award in from_cache]
+    assert {award.year for award in from_store} == {YEAR}
@@ -0,0 +1,138 @@
+"""nsf_cache: JSON-lines caches, legacy migration and manifests."""
+import csv
+import json
+import os
+
+import pytest
+
+import nsf_cache
+from nsf_download import write_csv
+
+from conftest import make_awards, write_year
+
+YEAR = 2020
+
+
+@pytest.mark.parametrize("compression", ["", "gz", "zst"])
+def test_jsonl_round_trip(compression):
+    if compression == "zst":
+        pytest.importorskip("zstandard")
+    awards = make_awards(1200)
+    os.makedirs(nsf_cache.year_folder(YEAR))
+    path = nsf_cache.cache_path(YEAR, compression)
+
+    assert nsf_cache.write_jsonl(path, awards, block_size=500) == 1200
+    assert list(nsf_cache.iter_jsonl(path)) == awards
+
+
+def test_append_block_reports_committed_bytes():
+    path = "cache.jsonl"
+    first = nsf_cache.append_block(path, make_awards(3))
+    second = nsf_cache.append_block(path, make_awards(2, first=3))
+    assert first == os.path.getsize(path) - (second - first)
+    assert second == os.path.getsize(path)
+    assert [award["id"] for award in nsf_cache.iter_jsonl(path)] == [award["id"] for award in make_awards(5)]
+
+
+def test_legacy_json_year_is_migrated_with_a_manifest():
+    awards = make_awards(10)
+    os.makedirs(nsf_cache.year_folder(YEAR))
+    with open(nsf_cache.legacy_json_path(YEAR), "w", encoding="utf-8") as f:
+        json.dump(awards, f)
+
+    path = nsf_cache.find_cache(YEAR)
+
+    assert path == nsf_cache.cache_path(YEAR)
+    assert list(nsf_cache.iter_jsonl(path)) == awards
+    manifest = nsf_cache.load_manifest(YEAR)
+    assert manifest["complete"] and manifest["migrated_from"] == os.path.basename(nsf_cache.legacy_json_path(YEAR))
+    assert os.path.exists(nsf_cache.legacy_json_path(YEAR))
+
+
+def test_csv_export_never_overwrites_the_manifest_cache():
+    awards = make_awards(10)
+    cache = write_year(YEAR, awards)
+    csv_path = write_csv(YEAR, awards)
+    # The export is newer than the cache, as after every download
+    os.utime(csv_path, ns=(os.stat(cache).st_mtime_ns + 10**9,) * 2)
+    before = os.stat(cache).st_mtime_ns
+
+    assert nsf_cache.migrate_file(csv_path) == cache
+    assert os.stat(cache).st_mtime_ns == before
+    assert list(nsf_cache.iter_jsonl(cache)) == awards
+    assert not any(name.endswith(nsf_cache.MIGRATED_SUFFIX) for name in os.listdir(nsf_cache.year_folder(YEAR)))
+
+
+def test_csv_export_opens_the_years_store_and_index():
+    pytest.importorskip("pyarrow")
+    import nsf_index
+    import nsf_store
+
+    awards = make_awards(10)
+    cache = write_year(YEAR, awards)
+    csv_path = write_csv(YEAR, awards)
+
+    assert nsf_store.store_for_file(csv_path) == nsf_store.store_path(YEAR)
+    assert nsf_index.index_for_file(csv_path).ids == [award["id"] for award in awards]
+    frame = nsf_store.load_dataframe(csv_path, ["id", "fundsObligatedAmt"])
+    assert frame["fundsObligatedAmt"].tolist() == [float(award["fundsObligatedAmt"]) for award in awards]
+    assert list(nsf_cache.iter_jsonl(cache)) == awards
+
+
+def test_stray_csv_is_converted_next_to_itself():
+    awards = make_awards(5)
+    with open("export.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(awards[0]))
+        writer.writeheader()
+        writer.writerows(awards)
+
+    path = nsf_cache.migrate_file("export.csv")
+
+    assert path == "export" + nsf_cache.MIGRATED_SUFFIX
+    assert [award["id"] for award in nsf_cache.iter_jsonl(path)] == [award["id"] for award in awards]
+    # Converted once; an unchanged file is not converted again
+    mtime = os.stat(path).st_mtime_ns
+    assert nsf_cache.migrate_file("export.csv") == path
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_stray_json_does_not_touch_a_sibling_jsonl():
+    with open("awards.jsonl", "w", encoding="utf-8") as f:
+        f.write('{"id": "keep"}\n')
+    with open("awards.json", "w", encoding="utf-8") as f:
+        json.dump(make_awards(2), f)
+
+    path = nsf_cache.migrate_file("awards.json")
+
+    assert path == "awards" + nsf_cache.MIGRATED_SUFFIX
+    assert list(nsf_cache.iter_jsonl("awards.jsonl")) == [{"id": "keep"}]
+
+
+def test_incomplete_download_is_not_a_cache():
+    write_year(YEAR, make_awards(3))
+    manifest = nsf_cache.load_manifest(YEAR)
+    manifest["complete"] = False
+    nsf_cache.save_manifest(YEAR, manifest)
+
+    assert nsf_cache.find_cache(YEAR) is None
+    assert not nsf_cache.is_complete(YEAR)
+    assert nsf_cache.completed_years() == []
+
+
+def test_completed_years():
+    write_year(2021, make_awards(2, 2021))
+    write_year(2019, make_awards(2, 2019))
+    os.makedirs("awards_2022")
+    assert nsf_cache.completed_years() == [2019, 2021]
+
+
+def test_merge_by_id():
+    existing = make_awards(3)
+    changed = dict(existing[1], title="New title")
+    added = make_awards(1, first=3)[0]
+
+    merged, n_added, n_changed = nsf_cache.merge_by_id(existing, [changed, added, existing[0]])
+
+    assert (n_added, n_changed) == (1, 1)
+    assert [award["id"] for award in merged] == [award["id"] for award in existing + [added]]
+    assert merged[1]["title"] == "New title"
@@ -0,0 +1,100 @@
+"""nsf_cli end to end: output formats, files and exit codes."""
+import csv
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import nsf_cli  # noqa: E402
+from nsf_analysis import analyze_years  # noqa: E402
+from nsf_keywords import RED_FLAG_WORDS  # noqa: E402
+from nsf_report import CSV_FIELDS  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+YEAR = 2020
+
+
+@pytest.fixture
+def year():
+    write_year(YEAR, make_awards(60))
+    return YEAR
+
+
+def run(*argv):
+    return nsf_cli.main([str(arg) for arg in argv])
+
+
+def test_analyze_writes_json_to_stdout(year, capsys):
+    assert run("analyze", "--years", year, "--workers", 1) == nsf_cli.EXIT_OK
+
+    document = json.loads(capsys.readouterr().out)
+    expected = analyze_years([year], RED_FLAG_WORDS, workers=1).results
+    assert document["years"] == [year]
+    assert document["summary"] == {tier: {"count": len(awards), "total_funding": sum(a["amount"] for a in awards)}
+                                   for tier, awards in expected.items() if awards}
+    assert not any("abstract" in award for awards in document["results"].values() for award in awards)
+
+    assert run("analyze", "--years", year, "--abstracts", "--workers", 1) == nsf_cli.EXIT_OK
+    document = json.loads(capsys.readouterr().out)
+    assert all(award["abstract"] for awards in document["results"].values() for award in awards)
+
+
+def test_analyze_writes_csv_to_a_file(year, capsys):
+    assert run("analyze", "--years", year, "--format", "csv", "-o", "out.csv", "--workers", 1) == nsf_cli.EXIT_OK
+
+    with open("out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert rows and list(rows[0]) == CSV_FIELDS
+    output = capsys.readouterr()
+    assert output.out == ""
+    assert "Results saved as out.csv" in output.err
+
+
+def test_report_writes_a_pdf(year):
+    pytest.importorskip("fpdf")
+    assert run("report", "--years", year, "-o", "report.pdf", "--workers", 1) == nsf_cli.EXIT_OK
+    with open("report.pdf", "rb") as f:
+        assert f.read(5) == b"%PDF-"
+
+
+def test_custom_words_only_report_the_custom_tier(year, capsys):
+    assert run("analyze", "--years", year, "--words", "protein folding", "--workers", 1) == nsf_cli.EXIT_OK
+    document = json.loads(capsys.readouterr().out)
+    assert list(document["results"]) == [nsf_cli.CUSTOM_TIER]
+    assert document["keywords"] == {nsf_cli.CUSTOM_TIER: ["protein folding"]}
+
+
+def test_exit_codes(year):
+    assert run("analyze", "--years", year, "--tiers", "9") == nsf_cli.EXIT_USAGE
+    assert run("analyze", "--years", year + 1) == nsf_cli.EXIT_MISSING_DATA
+    assert run("analyze", "--years", year, "--words", "quantum widget", "--fail-on-empty",
+               "--workers", 1) == nsf_cli.EXIT_NO_MATCHES
+    # Offline with an empty page cache, the download cannot complete
+    assert run("download", "--years", year + 1, "--offline", "--quiet") == nsf_cli.EXIT_DOWNLOAD_FAILED
+    with pytest.raises(SystemExit) as exc:
+        run("analyze", "--years", "20x0")
+    assert exc.value.code == nsf_cli.EXIT_USAGE
+
+
+def test_parse_years():
+    assert nsf_cli.parse_years("2022-2020, 2024") == [2020, 2021, 2022, 2024]
+
+
+def test_select_words():
+    tiers = list(RED_FLAG_WORDS)
+    assert list(nsf_cli.select_words(["1", tiers[1][:6]], None)) == tiers[:2]
+    assert nsf_cli.select_words(None, None) == {tier: list(words) for tier, words in RED_FLAG_WORDS.items()}
+    with pytest.raises(ValueError):
+        nsf_cli.select_words(["nope"], None)
+
+
+def test_rank_lists_the_top_awards(year, capsys):
+    assert run("rank", "--years", year, "--top", 3, "--format", "json", "-o", "rank.json") == nsf_cli.EXIT_OK
+
+    with open("rank.json", encoding="utf-8") as f:
+        rows = json.load(f)
+    assert [row["rank"] for row in rows] == [1, 2, 3]
+    assert rows == sorted(rows, key=lambda row: -row["score"])
+    assert "Ranking saved as rank.json" in capsys.readouterr().err
@@ -0,0 +1,113 @@
+"""Near-duplicate clusters and boilerplate detection (nsf_dedup) and how the analyzers apply them."""
+import json
+import random
+
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("scipy")
+
+import nsf_analysis  # noqa: E402
+import nsf_cli  # noqa: E402
+import nsf_dedup  # noqa: E402
+import nsf_store  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+WORDS = ("lake carbon sensor model network survey climate protein graph ocean student soil signal "
+         "robot theory data field energy cell").split()
+
+
+def text(seed, n=120):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n)) + "."
+
+
+def edited(abstract):
+    words = abstract.split()
+    words[60] = "inclusion"
+    return " ".join(words)
+
+
+def with_abstracts(year, abstracts, first=0):
+    awards = make_awards(len(abstracts), year, first)
+    for award, abstract in zip(awards, abstracts):
+        award["abstractText"] = abstract
+    return awards
+
+
+def ids(clusters):
+    return [sorted(nsf_store.take_records(year, [row], ["id"])[0]["id"] for year, row in members)
+            for members in clusters]
+
+
+def test_near_identical_abstracts_cluster_across_years():
+    shared = text(1)
+    write_year(2021, with_abstracts(2021, [shared, text(2), text(3)]))
+    write_year(2022, with_abstracts(2022, [text(4), edited(shared), text(5)]))
+
+    clusters = nsf_dedup.near_duplicates([2021, 2022])
+
+    assert clusters == [[(2021, 0), (2022, 1)]]
+    assert nsf_dedup.duplicate_copies(clusters) == {2022: {1}}
+
+
+def test_clusters_hold_distinct_awards():
+    # One award cached in both years, plus a collaborative copy of its abstract
+    shared = text(1)
+    older = with_abstracts(2021, [shared, text(2)])
+    newer = older[:1] + with_abstracts(2022, [edited(shared), text(3)], first=5)
+    write_year(2021, older, fetched_at="2024-01-01T00:00:00")
+    write_year(2022, newer, fetched_at="2024-02-01T00:00:00")
+
+    assert ids(nsf_dedup.near_duplicates([2021, 2022])) == [sorted([older[0]["id"], newer[1]["id"]])]
+    # Only the newest copy of the repeated award is a member
+    assert nsf_dedup.near_duplicates([2021, 2022]) == [[(2022, 0), (2022, 1)]]
+    assert len(nsf_dedup.near_duplicates([2021, 2022], dedupe=False)[0]) == 3
+
+
+@pytest.mark.parametrize("dedupe_clusters", [True, False])
+def test_collapsing_keeps_one_award_per_cluster(dedupe_clusters):
+    # The cluster's first member is a copy the merge index drops
+    shared = text(1) + " Promotes equity."
+    older = with_abstracts(2021, [shared, edited(shared), text(2)])
+    newer = older[:1] + with_abstracts(2022, [text(3)], first=5)
+    write_year(2021, older, fetched_at="2024-01-01T00:00:00")
+    write_year(2022, newer, fetched_at="2024-02-01T00:00:00")
+    selected = {"Custom": ["equity"]}
+
+    clusters = nsf_dedup.near_duplicates([2021, 2022], dedupe=dedupe_clusters)
+    analysis = nsf_analysis.analyze_years([2021, 2022], selected, workers=1, near_duplicates=clusters)
+
+    # The first member deduplication kept stands for the cluster
+    assert [(award["year"], award["id"]) for award in analysis.results["Custom"]] == [(2021, older[1]["id"])]
+
+
+def test_boilerplate_is_found_and_stripped():
+    boilerplate_sentence = "This award reflects the statutory mission and has been deemed worthy of support."
+    awards = with_abstracts(2021, [f"{text(i, 30)} {boilerplate_sentence}" for i in range(30)])
+    awards[0]["abstractText"] = "Advancing equity in lake science. " + boilerplate_sentence
+    write_year(2021, awards)
+
+    shingles = nsf_dedup.boilerplate_shingles([2021], min_awards=20)
+
+    assert len(shingles)
+    stripped = nsf_dedup.strip_boilerplate(awards[0]["abstractText"], shingles)
+    assert "statutory" not in stripped and "equity in lake science" in stripped
+    assert nsf_dedup.strip_boilerplate("Nothing shared here at all today.", shingles) == \
+        "Nothing shared here at all today."
+
+
+def test_duplicates_command_lists_distinct_awards(capsys):
+    shared = text(1)
+    older = with_abstracts(2021, [shared, text(2)])
+    newer = older[:1] + with_abstracts(2022, [edited(shared)], first=5)
+    write_year(2021, older, fetched_at="2024-01-01T00:00:00")
+    write_year(2022, newer, fetched_at="2024-02-01T00:00:00")
+
+    assert nsf_cli.main(["duplicates", "--years", "2021-2022", "--format", "json"]) == nsf_cli.EXIT_OK
+
+    output = capsys.readouterr()
+    rows = json.loads(output.out)
+    assert sorted(row["id"] for row in rows) == sorted([older[0]["id"], newer[1]["id"]])
+    assert "Found 1 clusters of near-identical abstracts (2 awards)" in output.err
@@ -0,0 +1,69 @@
+"""Keyword-density scoring and the bounded top-K ranking (nsf_density)."""
+import pytest
+
+import nsf_cache
+import nsf_density
+from nsf_density import DensityRanker
+
+from nsf_keywords import RED_FLAG_WORDS, TIER_WEIGHTS
+
+from conftest import make_awards, write_year
+
+YEAR = 2021
+HIGH, LOW = list(RED_FLAG_WORDS)[:2]
+SELECTED = {HIGH: ["equity", "social justice"], LOW: ["framework", "equity"]}
+
+
+def ranked_ids(ranker):
+    return [result["id"] for result in ranker.results()]
+
+
+def test_score_counts_each_occurrence_once_at_its_heaviest_tier():
+    ranker = DensityRanker(SELECTED, min_tokens=1)
+    density = ranker.score("Equity and a framework for equity and social justice")
+
+    # Three keywords, four occurrences in nine words; "equity" is in both tiers
+    assert (density.tokens, density.hits, density.distinct) == (9, 4, 3)
+    assert density.density == pytest.approx(100 * 4 / 9)
+    high, low = TIER_WEIGHTS[HIGH], TIER_WEIGHTS[LOW]
+    assert density.score == pytest.approx(100 * (high + low + high + high) / 9)
+    assert density.tier == HIGH
+    assert density.matched_words == ["equity", "framework", "social justice"]
+    assert ranker.score("protein folding") is None
+
+
+def test_short_abstracts_are_scored_as_min_tokens_long():
+    ranker = DensityRanker(SELECTED, min_tokens=50)
+    assert ranker.score("equity").score == pytest.approx(100 * TIER_WEIGHTS[HIGH] / 50)
+
+
+@pytest.mark.parametrize("by", nsf_density.RANK_KEYS)
+def test_top_k_matches_a_full_sort(by):
+    awards = make_awards(200)
+    full = nsf_density.rank_records(awards, top=len(awards), by=by)
+    top = nsf_density.rank_records(awards, top=7, by=by)
+
+    assert ranked_ids(top) == ranked_ids(full)[:7]
+    assert top.scanned == 200 and top.flagged == full.flagged
+    keys = [top._key(nsf_density.Density(r["tokens"], r["hits"], r["distinct"], r["density"], r["score"],
+                                         r["tier"], r["matched_words"]), r["amount"]) for r in top.results()]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_unknown_ranking():
+    with pytest.raises(ValueError):
+        DensityRanker(by="length")
+
+
+def test_rank_years_reads_only_candidates_but_ranks_the_same():
+    pytest.importorskip("pyarrow")
+    write_year(YEAR, make_awards(120, YEAR))
+    selected = {"Custom": ["protein folding", "sensor networks", "equity"]}
+
+    ranker = nsf_density.rank_years([YEAR], selected, top=10)
+    expected = nsf_density.rank_records(nsf_cache.iter_awards(YEAR), selected, top=10)
+
+    assert ranked_ids(ranker) == ranked_ids(expected)
+    assert ranker.flagged == expected.flagged
+    assert ranker.scanned < expected.scanned
+    assert all(result["year"] == YEAR for result in ranker.results())
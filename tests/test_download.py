@@ -0,0 +1,147 @@
+"""fetch_awards_for_year against the stub API: full downloads, checkpoint resume and refresh."""
+import os
+import threading
+
+import nsf_cache
+import nsf_store
+from nsf_download import PRINT_FIELDS, fetch_awards_for_year
+from nsf_fetch import Page
+
+from conftest import make_awards
+
+YEAR = 2020
+
+
+def download(fetcher, **options):
+    lines = []
+    count = fetch_awards_for_year(YEAR, lines.append, fetcher=fetcher, **options)
+    return count, lines
+
+
+def cached_ids():
+    return [award["id"] for award in nsf_cache.iter_jsonl(nsf_cache.find_cache(YEAR))]
+
+
+def test_full_download_writes_cache_export_and_indexes(stub, fetcher_for):
+    awards = make_awards(120)
+    server, url = stub(awards)
+    progress = []
+
+    count, _ = download(fetcher_for(url, rpp=25), progress=lambda done, total: progress.append((done, total)))
+
+    assert count == 120
+    assert cached_ids() == [award["id"] for award in awards]
+    manifest = nsf_cache.load_manifest(YEAR)
+    assert manifest["complete"] and manifest["record_count"] == 120
+    assert manifest["rpp"] == 25
+    assert progress[-1] == (120, 120)
+    assert os.path.exists(nsf_cache.csv_cache_path(YEAR))
+    assert os.path.exists(nsf_store.store_path(YEAR))
+    # Field types survive the round trip through the cache
+    first = next(nsf_cache.iter_jsonl(nsf_cache.find_cache(YEAR)))
+    assert first["coPDPI"] == awards[0]["coPDPI"]
+
+
+def test_cancelled_download_resumes_from_its_checkpoint(stub, fetcher_for):
+    awards = make_awards(200)
+    server, url = stub(awards)
+    cancel = threading.Event()
+
+    def stop_after_three_pages(done, total):
+        if done >= 75:
+            cancel.set()
+
+    count, lines = download(fetcher_for(url, rpp=25, concurrency=1), cancel_event=cancel,
+                            progress=stop_after_three_pages)
+    manifest = nsf_cache.load_manifest(YEAR, partial=True)
+    assert count == 75 and not manifest["complete"]
+    assert manifest["next_offset"] == 76
+    assert nsf_cache.find_cache(YEAR) is None
+
+    requests_before = server.request_count
+    count, lines = download(fetcher_for(url, rpp=25, concurrency=1))
+
+    assert any("Resuming at offset 76" in line for line in lines)
+    assert count == 200
+    assert cached_ids() == [award["id"] for award in awards]
+    # Only the remaining pages were requested again (plus the empty one that ends the listing)
+    assert server.request_count - requests_before <= 6
+
+
+def test_resume_discards_bytes_written_after_the_last_commit(stub, fetcher_for):
+    awards = make_awards(100)
+    server, url = stub(awards)
+    checkpoint = nsf_cache.Checkpoint(YEAR, 25, PRINT_FIELDS)
+    checkpoint.commit_page(Page(1, awards[:25], len(awards)), awards[:25])
+    # A crash halfway through appending the next page
+    with open(checkpoint.path + nsf_cache.PARTIAL_SUFFIX, "ab") as f:
+        f.write(b'{"id": "torn')
+
+    count, lines = download(fetcher_for(url, rpp=25))
+
+    assert any("Resuming at offset 26" in line for line in lines)
+    assert count == 100
+    assert cached_ids() == [award["id"] for award in awards]
+
+
+def test_failed_page_leaves_a_resumable_checkpoint(stub, fetcher_for):
+    awards = make_awards(100)
+    server, url = stub(awards)
+
+    def fail_after_two_pages(done, total):
+        if done >= 50:
+            server.failure_rate = 1.0
+
+    download(fetcher_for(url, rpp=25, concurrency=1, retries=1), progress=fail_after_two_pages)
+    assert nsf_cache.find_cache(YEAR) is None
+    assert nsf_cache.load_manifest(YEAR, partial=True)["record_count"] == 50
+
+    server.failure_rate = 0.0
+    count, _ = download(fetcher_for(url, rpp=25))
+
+    assert count == 100
+    assert cached_ids() == [award["id"] for award in awards]
+
+
+def test_interrupted_download_of_a_complete_year_keeps_its_cache(stub, fetcher_for):
+    awards = make_awards(100)
+    server, url = stub(awards)
+    download(fetcher_for(url, rpp=25))
+    fetched_at = nsf_cache.load_manifest(YEAR)["fetched_at"]
+
+    def fail_after_two_pages(done, total):
+        if done >= 50:
+            server.failure_rate = 1.0
+
+    download(fetcher_for(url, rpp=25, concurrency=1, retries=1), progress=fail_after_two_pages)
+
+    assert nsf_cache.is_complete(YEAR) and nsf_cache.download_pending(YEAR)
+    assert nsf_cache.load_manifest(YEAR)["fetched_at"] == fetched_at
+    assert cached_ids() == [award["id"] for award in awards]
+
+    server.failure_rate = 0.0
+    count, lines = download(fetcher_for(url, rpp=25))
+
+    assert any("Resuming at offset 51" in line for line in lines)
+    assert count == 100 and not nsf_cache.download_pending(YEAR)
+    assert cached_ids() == [award["id"] for award in awards]
+
+
+def test_refresh_merges_new_and_changed_awards(stub, fetcher_for):
+    awards = make_awards(60)
+    server, url = stub(awards)
+    download(fetcher_for(url, rpp=25))
+    manifest = nsf_cache.load_manifest(YEAR)
+    manifest["started_at"] = "2020-06-01T00:00:00"
+    nsf_cache.save_manifest(YEAR, manifest)
+
+    changed = dict(awards[-1], fundsObligatedAmt="1", abstractText="Revised abstract.")
+    server.awards = awards[:-1] + [changed] + make_awards(5, YEAR, first=60)
+    server.by_id = {award["id"]: [award] for award in server.awards}
+    count, lines = download(fetcher_for(url, rpp=25), refresh=True)
+
+    assert count == 65
+    by_id = {award["id"]: award for award in nsf_cache.iter_jsonl(nsf_cache.find_cache(YEAR))}
+    assert by_id[changed["id"]]["abstractText"] == "Revised abstract."
+    assert by_id[changed["id"]]["fundsObligatedAmt"] == "1"
+    assert set(by_id) == {award["id"] for award in server.awards}
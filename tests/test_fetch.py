@@ -0,0 +1,205 @@
+"""NSFFetcher against the stub API: pooling, ordering, retries, pacing, the page size probe and the page cache."""
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import nsf_fetch
+import nsf_metrics
+import nsf_stub_server
+from nsf_fetch import RateLimiter
+
+from conftest import make_awards
+
+
+def fetch_all(fetcher, **params):
+    return [award for page in fetcher.iter_pages(dict(params)) for award in page.awards]
+
+
+def test_pages_come_back_in_offset_order(stub, fetcher_for):
+    awards = make_awards(230)
+    server, url = stub(awards, latency=0.01)
+    fetcher = fetcher_for(url, concurrency=4, rpp=25)
+
+    pages = list(fetcher.iter_pages({}))
+
+    assert [page.offset for page in pages] == list(range(1, 231, 25))
+    assert [award["id"] for page in pages for award in page.awards] == [award["id"] for award in awards]
+    assert all(page.total == 230 for page in pages)
+
+
+def test_pooled_session_reuses_connections(stub, fetcher_for):
+    server, url = stub(make_awards(500), latency=0.01)
+    fetcher = fetcher_for(url, concurrency=4, rpp=25)
+
+    assert len(fetch_all(fetcher)) == 500
+    assert server.request_count == 20
+    assert server.connection_count <= fetcher.max_in_flight
+
+
+def test_concurrency_keeps_several_pages_in_flight(stub, fetcher_for):
+    server, url = stub(make_awards(200), latency=0.05)
+    fetcher = fetcher_for(url, concurrency=4, rpp=25)
+
+    fetch_all(fetcher)
+
+    assert 1 < server.peak_in_flight <= 4
+
+
+def test_max_in_flight_caps_requests_across_iterators(stub, fetcher_for):
+    server, url = stub(make_awards(200), latency=0.02)
+    fetcher = fetcher_for(url, concurrency=4, max_in_flight=2, rpp=25)
+
+    threads = [threading.Thread(target=fetch_all, args=(fetcher,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.peak_in_flight <= 2
+
+
+def test_transient_failures_are_retried(stub, fetcher_for, monkeypatch):
+    # Every other request is answered with 503
+    monkeypatch.setattr(nsf_stub_server, "random", SimpleNamespace(random=itertools.cycle([0.0, 0.9]).__next__))
+    awards = make_awards(100)
+    server, url = stub(awards, failure_rate=0.5)
+    fetcher = fetcher_for(url, concurrency=1, rpp=25, retries=3)
+
+    with nsf_metrics.collect() as metrics:
+        fetched = fetch_all(fetcher)
+
+    assert [award["id"] for award in fetched] == [award["id"] for award in awards]
+    assert metrics.counters["retries"] == 4
+    assert server.request_count == 8
+
+
+def test_gives_up_after_retries(stub, fetcher_for):
+    server, url = stub(make_awards(10), failure_rate=1.0)
+    fetcher = fetcher_for(url, rpp=25, retries=2)
+
+    with pytest.raises(nsf_fetch.FetchError):
+        fetcher.fetch_page({"offset": 1, "rpp": 25})
+    assert server.request_count == 3
+
+
+def test_backoff_grows_exponentially(stub, fetcher_for, monkeypatch):
+    delays = []
+    monkeypatch.setattr(nsf_fetch.time, "sleep", delays.append)
+    server, url = stub(make_awards(10), failure_rate=1.0)
+    fetcher = fetcher_for(url, rpp=25, retries=3, backoff=0.5)
+
+    with pytest.raises(nsf_fetch.FetchError):
+        fetcher.fetch_page({"offset": 1, "rpp": 25})
+
+    assert len(delays) == 3
+    for attempt, delay in enumerate(delays):
+        assert 0.5 * 2 ** attempt <= delay <= 0.75 * 2 ** attempt
+
+
+def test_client_errors_are_not_retried(stub, fetcher_for):
+    server, url = stub(make_awards(10))
+    fetcher = fetcher_for(url.replace("awards.json", "missing.json"), rpp=25, retries=3)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetcher.fetch_page({"offset": 1, "rpp": 25})
+
+
+def test_rate_limiter_paces_requests():
+    limiter = RateLimiter(rate=50, burst=2)
+    started = time.monotonic()
+    for _ in range(12):
+        limiter.acquire()
+    # The burst goes out at once; the other ten wait for a token each
+    assert time.monotonic() - started >= 10 / 50 * 0.9
+
+
+def test_rate_limit_applies_to_pages(stub, fetcher_for):
+    server, url = stub(make_awards(250))
+    fetcher = fetcher_for(url, concurrency=4, rpp=25, rate_limit=40)
+
+    started = time.monotonic()
+    fetch_all(fetcher)
+
+    assert server.request_count == 10
+    assert time.monotonic() - started >= (10 - fetcher.max_in_flight) / 40 * 0.9
+
+
+def test_probe_finds_the_servers_page_cap(stub, fetcher_for):
+    server, url = stub(make_awards(300), max_rpp=100)
+    fetcher = fetcher_for(url)
+
+    assert fetcher.rpp == 100
+    assert len(fetch_all(fetcher, rpp=fetcher.rpp)) == 300
+    # Remembered per URL, so another fetcher does not probe again
+    requests_before = server.request_count
+    assert fetcher_for(url).rpp == 100
+    assert server.request_count == requests_before
+
+
+def test_params_without_rpp_request_the_fetchers_page_size(stub, fetcher_for):
+    server, url = stub(make_awards(300), max_rpp=100)
+    fetcher = fetcher_for(url, rpp=50)
+
+    pages = list(fetcher.iter_pages({}))
+
+    assert [page.offset for page in pages] == list(range(1, 301, 50))
+    assert sum(len(page.awards) for page in pages) == 300
+
+
+def test_probe_falls_back_when_unreachable(fetcher_for):
+    fetcher = fetcher_for("http://127.0.0.1:9/services/v1/awards.json", retries=0, timeout=1)
+    assert fetcher.rpp == nsf_fetch.DEFAULT_RPP
+
+
+def test_fetch_by_ids(stub, fetcher_for):
+    awards = make_awards(30)
+    server, url = stub(awards)
+    fetcher = fetcher_for(url, concurrency=4, rpp=25)
+
+    found = fetcher.fetch_by_ids([awards[3]["id"], awards[17]["id"], "missing"], "id,abstractText")
+
+    assert set(found) == {awards[3]["id"], awards[17]["id"]}
+    assert found[awards[17]["id"]]["abstractText"] == awards[17]["abstractText"]
+
+
+def test_page_cache_replays_closed_years(stub, fetcher_for, tmp_path):
+    import nsf_http_cache
+
+    awards = make_awards(60)
+    server, url = stub(awards)
+    cache = nsf_http_cache.PageCache(str(tmp_path / "pages"))
+    params = {"dateStart": "01/01/2015", "dateEnd": "12/31/2015", "rpp": 25}
+
+    first = fetch_all(fetcher_for(url, rpp=25, cache=cache), **params)
+    requests_after_first = server.request_count
+    replayed = fetch_all(fetcher_for(url, rpp=25, cache=cache), **params)
+
+    assert replayed == first
+    assert server.request_count == requests_after_first
+
+    # Offline, a page never fetched is a miss rather than a request
+    offline = fetcher_for(url, rpp=25, cache=nsf_http_cache.PageCache(str(tmp_path / "pages"), offline=True))
+    with pytest.raises(nsf_http_cache.CacheMiss):
+        offline.fetch_page({"offset": 1, "rpp": 25, "dateStart": "01/01/2016"})
+    assert server.request_count == requests_after_first
+
+
+def test_stale_pages_are_revalidated_with_304(stub, fetcher_for, tmp_path, monkeypatch):
+    import nsf_http_cache
+
+    server, url = stub(make_awards(60))
+    cache = nsf_http_cache.PageCache(str(tmp_path / "pages"))
+    params = {"dateStart": "01/01/2026", "dateEnd": "12/31/2026", "rpp": 25}
+    first = fetch_all(fetcher_for(url, rpp=25, cache=cache), **params)
+    requests_after_first = server.request_count
+
+    monkeypatch.setattr(nsf_http_cache, "CURRENT_TTL", 0)
+    again = fetch_all(fetcher_for(url, rpp=25, cache=cache), **params)
+
+    # Every page was asked for again, and every answer was a bodiless 304
+    assert again == first
+    assert server.request_count - requests_after_first == server.not_modified_count > 0
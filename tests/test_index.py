@@ -0,0 +1,21 @@
+"""The persistent inverted index answers keyword filters like the matcher."""
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import nsf_index  # noqa: E402
+from nsf_matcher import KeywordMatcher  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+YEAR = 2022
+
+
+def test_index_answers_like_the_matcher():
+    awards = make_awards(50, YEAR)
+    write_year(YEAR, awards)
+    index = nsf_index.open_index(YEAR)
+    texts = [award["abstractText"] for award in awards]
+    for keyword in ("equity", "framework", "diversity, equity and inclusion", "protein folding"):
+        matcher = KeywordMatcher([keyword])
+        assert list(index.lookup(keyword, texts)) == [row for row, text in enumerate(texts) if matcher.hits(text)]
@@ -0,0 +1,82 @@
+"""KeywordMatcher: word boundaries, overlaps and parity between its engines."""
+import re
+
+import pytest
+
+import nsf_matcher
+from nsf_keywords import QUICK_ADD_WORDS, RED_FLAG_WORDS
+from nsf_matcher import KeywordMatcher, normalize_keyword
+
+from conftest import SENTENCES
+
+TEXTS = SENTENCES + [
+    "",
+    "Equity, EQUITY and equity-minded work; inequity and equitable are different words.",
+    "An equity lens and radical inclusion guide the social justice framework.",
+    "Diversity equity inclusion (DEI) and LGBTQIA+ students in STEM.",
+    "Leveraging a cutting-edge, game-changing, scalable approach.",
+    "Die Straße nach İstanbul: ǅemal studies equity.",
+    "“EQUITY” and Inclusion’s reach — a DIVERSITY-minded, Game-Changing framework.",
+    "\u212aey STA\u212aEHOLDER input on α-helix equity.",
+    "framework\nframeworks\tframework_x framework",
+]
+
+
+def reference_hits(text, keywords):
+    """Every (start, end, normalized keyword) found with one word-bounded regex per keyword."""
+    hits = set()
+    for keyword in {normalize_keyword(k) for k in keywords}:
+        pattern = re.compile(r"(?<!\w)" + r"\s".join(re.escape(part) for part in keyword.split(" ")) + r"(?!\w)",
+                             re.IGNORECASE)
+        for match in pattern.finditer(text):
+            hits.add((match.start(), match.end(), keyword))
+    return hits
+
+
+def matcher_hits(matcher, text):
+    return {(hit.start, hit.end, normalize_keyword(hit.keyword)) for hit in matcher.finditer(text)}
+
+
+ALL_KEYWORDS = [word for words in RED_FLAG_WORDS.values() for word in words] + list(QUICK_ADD_WORDS)
+
+
+@pytest.mark.parametrize("engine", ["regex", "scan"])
+@pytest.mark.parametrize("text", TEXTS)
+def test_engine_matches_reference(text, engine):
+    matcher = KeywordMatcher(ALL_KEYWORDS, engine=engine)
+    assert matcher_hits(matcher, text) == reference_hits(text, ALL_KEYWORDS)
+
+
+@pytest.mark.parametrize("engine", ["scan", "aho-corasick"])
+@pytest.mark.parametrize("text", TEXTS)
+def test_engines_agree(text, engine):
+    if engine == "aho-corasick" and nsf_matcher.ahocorasick is None:
+        pytest.skip("pyahocorasick is not installed")
+    regex = KeywordMatcher(RED_FLAG_WORDS, engine="regex")
+    other = KeywordMatcher(RED_FLAG_WORDS, engine=engine)
+    assert regex.hits(text) == other.hits(text)
+    assert regex.matched_words(text) == other.matched_words(text)
+
+
+@pytest.mark.parametrize("engine", ["regex", "scan"])
+def test_word_boundaries(engine):
+    matcher = KeywordMatcher(["equity"], engine=engine)
+    assert [hit.start for hit in matcher.finditer("equity inequity equitable Equity.")] == [0, 26]
+
+
+@pytest.mark.parametrize("engine", ["regex", "scan"])
+def test_overlapping_keywords_are_all_found(engine):
+    matcher = KeywordMatcher(["equity", "equity lens", "inclusion", "radical inclusion"], engine=engine)
+    found = sorted((hit.start, hit.keyword) for hit in matcher.finditer("an equity lens for radical inclusion"))
+    assert found == [(3, "equity"), (3, "equity lens"), (19, "radical inclusion"), (27, "inclusion")]
+
+
+def test_matched_words_follow_list_order_per_tier():
+    matcher = KeywordMatcher({"A": ["inclusion", "equity"], "B": ["equity"]})
+    assert matcher.matched_words("Equity and inclusion.") == {"A": ["inclusion", "equity"], "B": ["equity"]}
+
+
+def test_empty_matcher():
+    matcher = KeywordMatcher([])
+    assert not matcher
+    assert matcher.hits("equity") == []
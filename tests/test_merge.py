@@ -0,0 +1,41 @@
+"""Cross-year merge index keyed by award id (nsf_merge)."""
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import nsf_merge  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+
+@pytest.fixture
+def years():
+    """2021 and 2022, fetched in that order; 2022 repeats 2021's last 10 awards."""
+    older = make_awards(30, 2021)
+    newer = older[20:] + make_awards(40, 2022)
+    write_year(2021, older, fetched_at="2024-01-01T00:00:00")
+    write_year(2022, newer, fetched_at="2024-02-01T00:00:00")
+    return {2021: older, 2022: newer}
+
+
+def test_merge_index_keeps_the_newest_copy(years):
+    merge = nsf_merge.open_merge([2021, 2022])
+
+    assert merge.size == 70
+    assert len(merge.duplicates()) == 10
+    assert merge.positions(years[2021][25]["id"]) == [(2021, 25), (2022, 5)]
+    assert merge.excluded_rows([2021, 2022]) == {2021: set(range(20, 30))}
+    assert merge.kept_rows(2021, [2021, 2022]) == list(range(20))
+    # A sweep that leaves out 2022 keeps every 2021 award
+    assert merge.kept_rows(2021, [2021]) == list(range(30))
+    assert merge.table([2021, 2022], ["id"]).num_rows == 70
+
+
+def test_merge_index_is_updated_incrementally(years):
+    nsf_merge.open_merge([2021, 2022])
+    write_year(2023, years[2022][:5], fetched_at="2024-03-01T00:00:00")
+
+    merge = nsf_merge.update_year(2023)
+
+    assert merge.excluded_rows([2022, 2023]) == {2022: set(range(5))}
+    assert sorted(merge.years) == [2021, 2022, 2023]
@@ -0,0 +1,66 @@
+"""nsf_report: report sections and PDF volumes."""
+import os
+
+import pytest
+
+import nsf_report
+
+
+def result(i, amount, year=2020):
+    return {"id": f"{i:07d}", "year": year, "title": f"Award {i}", "awardee": f"University {i}",
+            "amount": float(amount), "matched_words": ["equity"], "abstract": f"Abstract {i} – équité " * 40}
+
+
+@pytest.fixture
+def results():
+    return {
+        "Tier 1": [result(i, 1000 - i) for i in range(10)],
+        "Tier 2": [result(i, 1000 - i) for i in range(5, 8)] + [result(99, 5000)],
+        "Tier 3": [],
+    }
+
+
+def test_sections_slice_tiers_and_rank_overall(results):
+    sections = list(nsf_report.report_sections(results, top_n=2, overall_top=3))
+
+    assert [heading for heading, _ in sections] == ["Top 3 Overall", "Tier 1 - Top 2", "Tier 2 - Top 2"]
+    overall = sections[0][1]
+    assert [award["id"] for award in overall] == ["0000099", "0000000", "0000001"]
+    # An award matched in several tiers appears once overall, listing its tiers
+    assert [award["tiers"] for award in overall] == [["Tier 2"], ["Tier 1"], ["Tier 1"]]
+    assert [award["id"] for award in sections[1][1]] == ["0000000", "0000001"]
+
+
+def test_sections_without_top_n_keep_every_award(results):
+    sections = dict(nsf_report.report_sections(results))
+    assert list(sections) == ["Tier 1 Matches", "Tier 2 Matches"]
+    assert len(sections["Tier 1 Matches"]) == 10
+
+
+def test_top_awards():
+    awards = [result(i, amount) for i, amount in enumerate([5, 9, 1, 7])]
+    assert [award["amount"] for award in nsf_report.top_awards(awards, 2)] == [9, 7]
+    assert [award["amount"] for award in nsf_report.top_awards(awards, None)] == [9, 7, 5, 1]
+
+
+def test_pdf_is_split_into_volumes(results):
+    pytest.importorskip("fpdf")
+
+    paths = nsf_report.write_pdf(results, "report.pdf", max_awards_per_file=5, abstract_chars=200)
+
+    # 14 awards at 5 per volume
+    assert paths == ["report.pdf", "report_part2.pdf", "report_part3.pdf"]
+    for path in paths:
+        with open(path, "rb") as f:
+            assert f.read(5) == b"%PDF-"
+        assert os.path.getsize(path) > 0
+
+
+def test_pdf_in_one_volume(results):
+    pytest.importorskip("fpdf")
+    assert nsf_report.write_pdf(results, "report.pdf", top_n=3, overall_top=5) == ["report.pdf"]
+
+
+def test_top_report(results):
+    pytest.importorskip("fpdf")
+    assert nsf_report.write_top_report(results["Tier 1"], "top.pdf", n=3) == ["top.pdf"]
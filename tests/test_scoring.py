@@ -0,0 +1,85 @@
+"""Vectorized tier scoring and funding rollups (nsf_scoring)."""
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("scipy")
+
+import nsf_scoring  # noqa: E402
+from nsf_keywords import RED_FLAG_WORDS  # noqa: E402
+from nsf_matcher import KeywordMatcher  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+YEAR = 2021
+
+
+@pytest.fixture
+def awards():
+    awards = make_awards(30, YEAR)
+    write_year(YEAR, awards)
+    return awards
+
+
+@pytest.fixture
+def years():
+    """2021 and 2022, fetched in that order; 2022 repeats 2021's last 10 awards."""
+    older = make_awards(30, 2021)
+    newer = older[20:] + make_awards(40, 2022)
+    write_year(2021, older, fetched_at="2024-01-01T00:00:00")
+    write_year(2022, newer, fetched_at="2024-02-01T00:00:00")
+    return {2021: older, 2022: newer}
+
+
+def test_score_years_counts_each_award_once(years):
+    scores = nsf_scoring.score_years([2021, 2022])
+    matcher = KeywordMatcher(RED_FLAG_WORDS)
+    distinct = {award["id"]: award for year in (2021, 2022) for award in years[year]}
+
+    assert len(scores.frame) == len(distinct) == 70
+    assert sorted(scores.frame["id"]) == sorted(distinct)
+    flagged = {award_id for award_id, award in distinct.items() if matcher.matched_words(award["abstractText"])}
+    assert set(scores.frame.loc[scores.frame["keywords"] > 0, "id"]) == flagged
+    assert scores.frame["amount"].sum() == sum(float(award["fundsObligatedAmt"]) for award in distinct.values())
+
+
+def test_score_years_without_dedupe_counts_every_copy(years):
+    assert len(nsf_scoring.score_years([2021, 2022], dedupe=False).frame) == 80
+
+
+def test_score_years_with_a_year_that_keeps_no_rows():
+    awards = make_awards(20, 2024)
+    write_year(2024, awards[:8], fetched_at="2024-01-01T00:00:00")
+    write_year(2025, awards, fetched_at="2024-02-01T00:00:00")
+
+    scores = nsf_scoring.score_years([2024, 2025])
+
+    assert len(scores.frame) == 20
+    assert set(scores.frame["year"]) == {2025}
+    assert scores.hits.shape == (20, len(scores.keywords))
+    assert nsf_scoring.rollup(scores, "awardeeName")["awards"].sum() == 20
+
+
+def test_tier_totals_match_a_direct_scan(awards):
+    selected = {tier: words[:5] for tier, words in RED_FLAG_WORDS.items()}
+    scores = nsf_scoring.score_years([YEAR], selected)
+    matcher = KeywordMatcher(selected)
+
+    for tier in selected:
+        expected = sum(float(award["fundsObligatedAmt"]) for award in awards
+                       if tier in matcher.matched_words(award["abstractText"]))
+        assert scores.tier_totals[tier] == expected
+
+
+def test_rollup_groups_flagged_funding(awards):
+    scores = nsf_scoring.score_years([YEAR])
+    matcher = KeywordMatcher(RED_FLAG_WORDS)
+    table = nsf_scoring.rollup(scores, "awardeeName")
+
+    assert table["awards"].sum() == len(awards)
+    for awardee, row in table.iterrows():
+        mine = [award for award in awards if award["awardeeName"] == awardee]
+        flagged = [award for award in mine if matcher.matched_words(award["abstractText"])]
+        assert row["funding"] == sum(float(award["fundsObligatedAmt"]) for award in mine)
+        assert row["flagged_funding"] == sum(float(award["fundsObligatedAmt"]) for award in flagged)
+    assert list(table["flagged_funding"]) == sorted(table["flagged_funding"], reverse=True)
+    assert len(nsf_scoring.rollup(scores, "awardeeName", top=2)) == 2
@@ -0,0 +1,135 @@
+""""More like this" search over the sparse TF-IDF index (nsf_similar)."""
+import json
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("scipy")
+
+import nsf_cli  # noqa: E402
+import nsf_similar  # noqa: E402
+import nsf_tokens  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+WORDS = ("lake carbon sensor model network survey climate protein graph ocean student soil signal robot "
+         "theory data field energy cell river forest quantum plasma galaxy").split()
+
+
+def abstracts(n, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) + "." for _ in range(n)]
+
+
+def write(year, texts, first=0, fetched_at="2024-01-01T00:00:00"):
+    awards = make_awards(len(texts), year, first)
+    for award, text in zip(awards, texts):
+        award["abstractText"] = text
+    write_year(year, awards, fetched_at)
+    return awards
+
+
+def brute_force(index, tokens, skip=None):
+    """Exact cosine of the query against every abstract, best first."""
+    word = nsf_similar.word_terms(nsf_tokens.vocabulary())
+    tokens = np.asarray(tokens)
+    tokens = tokens[word[tokens]]
+    query = np.zeros(len(index.idf))
+    terms, counts = np.unique(tokens, return_counts=True)
+    query[terms] = (1 + np.log(counts)) * index.idf[terms]
+    scored = []
+    for year, arrays in index.tokens.items():
+        for row in range(arrays.size):
+            if (year, row) == skip:
+                continue
+            ids = np.asarray(arrays.row(row))
+            terms, counts = np.unique(ids[word[ids]], return_counts=True)
+            vector = np.zeros(len(index.idf))
+            vector[terms] = (1 + np.log(counts)) * index.idf[terms]
+            norm = np.linalg.norm(query) * np.linalg.norm(vector)
+            if norm and np.dot(query, vector) > 0:
+                scored.append((year, row, float(np.dot(query, vector) / norm)))
+    scored.sort(key=lambda hit: (-hit[2], hit[0], hit[1]))
+    return scored
+
+
+def test_results_match_a_brute_force_cosine():
+    write(2021, abstracts(60, 1))
+    write(2022, abstracts(60, 2))
+    index = nsf_similar.open_similar([2021, 2022])
+
+    hits = index.similar_to(2021, 5, k=10)
+    expected = brute_force(index, index.tokens[2021].row(5), skip=(2021, 5))[:10]
+
+    assert [(year, row) for year, row, _ in hits] == [(year, row) for year, row, _ in expected]
+    assert [score for _, _, score in hits] == pytest.approx([score for _, _, score in expected], rel=1e-4)
+
+
+def test_identical_abstracts_score_one_and_the_query_is_left_out():
+    texts = abstracts(30, 3)
+    write(2021, texts)
+    write(2022, [texts[7]] + abstracts(10, 4), first=100)
+    index = nsf_similar.open_similar([2021, 2022])
+
+    hits = index.similar_to(2021, 7, k=3)
+
+    assert hits[0][:2] == (2022, 0)
+    assert hits[0][2] == pytest.approx(1.0)
+    assert (2021, 7) not in [hit[:2] for hit in hits]
+
+
+def test_unknown_words_and_empty_text_find_nothing():
+    write(2021, abstracts(20, 5))
+    index = nsf_similar.open_similar([2021])
+    assert index.similar_text("") == []
+    assert index.similar_text("zyzzyva quux") == []
+    assert index.similar_text("galaxy plasma zyzzyva")
+
+
+def test_similar_awards_skip_the_source_and_repeated_copies():
+    texts = abstracts(30, 6)
+    older = write(2021, texts)
+    # 2022 repeats two 2021 awards (one of them the source) under their own ids
+    write_year(2022, older[7:9], fetched_at="2024-02-01T00:00:00")
+
+    awards = nsf_similar.similar_awards(texts[7], k=5, exclude_id=older[7]["id"], years=[2021, 2022])
+
+    found = [(award["year"], award["id"]) for award in awards]
+    assert older[7]["id"] not in [award_id for _, award_id in found]
+    assert len(set(award_id for _, award_id in found)) == len(found) == 5
+    assert awards == sorted(awards, key=lambda award: -award["similarity"])
+
+
+def test_within_year_copies_are_returned_once():
+    texts = abstracts(20, 7)
+    awards = write(2021, texts)
+    write_year(2021, awards + awards[3:4])
+
+    hits = nsf_similar.similar_awards(texts[3], k=3, years=[2021])
+
+    assert [award["id"] for award in hits].count(awards[3]["id"]) == 1
+
+
+def test_corpus_statistics_follow_the_years():
+    write(2021, abstracts(20, 8))
+    first = nsf_similar.open_similar([2021])
+    write(2022, abstracts(20, 9))
+    second = nsf_similar.open_similar([2021, 2022])
+
+    assert (first.size, second.size) == (20, 40)
+    assert second.key != first.key
+    assert nsf_similar.open_similar([2021, 2022]) is second
+
+
+def test_similar_command(capsys):
+    awards = write(2021, abstracts(30, 10))
+
+    status = nsf_cli.main(["similar", "--id", awards[4]["id"], "--top", "3", "--format", "json"])
+
+    rows = json.loads(capsys.readouterr().out)
+    assert status == nsf_cli.EXIT_OK
+    assert [row["rank"] for row in rows] == [1, 2, 3]
+    assert awards[4]["id"] not in [row["id"] for row in rows]
+    assert nsf_cli.main(["similar", "--id", "nope"]) == nsf_cli.EXIT_MISSING_DATA
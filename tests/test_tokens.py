@@ -0,0 +1,97 @@
+"""Integer token arrays and the shared vocabulary (nsf_tokens)."""
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import nsf_density  # noqa: E402
+import nsf_tokens  # noqa: E402
+from nsf_matcher import KeywordMatcher  # noqa: E402
+
+from conftest import make_awards, write_year  # noqa: E402
+
+KEYWORDS = ["equity", "framework", "diversity, equity and inclusion", "cutting-edge", "social justice",
+            "protein folding", "never seen anywhere"]
+
+
+def year_with(year, abstracts):
+    awards = make_awards(len(abstracts), year)
+    for award, abstract in zip(awards, abstracts):
+        award["abstractText"] = abstract
+    write_year(year, awards)
+    return awards
+
+
+def sample_year(year, n=40):
+    awards = make_awards(n, year)
+    awards[1]["abstractText"] = "A cutting-edge, game-changing\nframework for social justice."
+    awards[2]["abstractText"] = ""
+    write_year(year, awards)
+    return awards
+
+
+def test_rows_round_trip_through_the_vocabulary():
+    awards = sample_year(2021)
+    arrays = nsf_tokens.open_tokens(2021)
+
+    assert arrays.size == len(awards)
+    for i, award in enumerate(awards):
+        assert arrays.terms(i) == nsf_tokens.tokenize(award["abstractText"])
+        assert arrays.words[i] == len(award["abstractText"].split())
+
+
+def test_find_agrees_with_the_matcher():
+    awards = sample_year(2021)
+    arrays = nsf_tokens.open_tokens(2021)
+    for keyword in KEYWORDS:
+        matcher = KeywordMatcher([keyword])
+        expected = [row for row, award in enumerate(awards) if matcher.hits(award["abstractText"])]
+        assert list(arrays.find(keyword)) == expected, keyword
+
+
+def test_token_matching_ignores_whitespace_inside_phrases():
+    year_with(2021, ["cutting - edge and social\n\njustice"])
+    arrays = nsf_tokens.open_tokens(2021)
+    assert list(arrays.counts("cutting-edge")[1]) == [1]
+    assert list(arrays.find("social justice")) == [0]
+
+
+def test_phrases_never_span_two_abstracts():
+    year_with(2021, ["a call for social", "justice in science", "social justice"])
+    assert list(nsf_tokens.open_tokens(2021).find("social justice")) == [2]
+
+
+def test_years_share_an_append_only_vocabulary():
+    year_with(2021, ["equity and access"])
+    first = nsf_tokens.open_tokens(2021)
+    equity = first.keyword_ids("equity")
+    year_with(2022, ["novel access to equity"])
+    second = nsf_tokens.open_tokens(2022)
+
+    assert second.keyword_ids("equity") == equity
+    assert list(first.find("equity")) == [0]
+    with open(nsf_tokens.VOCAB_PATH, encoding="utf-8") as f:
+        assert f.read().split("\n")[:-1] == ["equity", "and", "access", "novel", "to"]
+
+
+def test_arrays_are_rebuilt_when_the_store_changes():
+    year_with(2021, ["equity"])
+    assert list(nsf_tokens.open_tokens(2021).find("framework")) == []
+
+    year_with(2021, ["a framework", "equity"])
+    arrays = nsf_tokens.open_tokens(2021)
+
+    assert arrays.size == 2
+    assert list(arrays.find("framework")) == [0]
+
+
+@pytest.mark.parametrize("by", nsf_density.RANK_KEYS)
+def test_token_ranking_matches_the_streaming_ranking(by):
+    sample_year(2021, 150)
+    sample_year(2022, 150)
+
+    tokens = nsf_density.rank_years([2021, 2022], top=15, by=by, use_tokens=True)
+    streaming = nsf_density.rank_years([2021, 2022], top=15, by=by)
+
+    assert [(r["year"], r["id"]) for r in tokens.results()] == [(r["year"], r["id"]) for r in streaming.results()]
+    assert [r["matched_words"] for r in tokens.results()] == [r["matched_words"] for r in streaming.results()]
+    assert tokens.flagged == streaming.flagged